@@ -1,45 +1,35 @@
 import streamlit as st
-import json
 import os
 import glob
-import concurrent.futures
-from dotenv import load_dotenv
-from generate import GenerateEmail
+import time
+from generate import GenerateEmail, REWRITE_TONES, REWRITE_VARIANTS, load_env
+from http_clients import connection_stats
+from judge_memo import get_judge_memo
+from dataset import open_dataset
 
-load_dotenv()
+# Every interaction reruns this script; .env is parsed on the first run only
+load_env()
 
 st.set_page_config(page_title="Email Helper App", page_icon="📧", layout="wide")
 
-generator_bot = GenerateEmail(
-    deployment_name=os.getenv("GENERATOR_DEPLOYMENT", "gpt-4o-mini")
-)
-judge_bot = GenerateEmail(deployment_name=os.getenv("JUDGE_DEPLOYMENT", "gpt-4.1"))
+# Built once per server process, not on every rerun; the bots share one HTTP pool
+@st.cache_resource
+def get_generator_bot():
+    return GenerateEmail(deployment_name=os.getenv("GENERATOR_DEPLOYMENT", "gpt-4o-mini"))
 
-DATASET_DIR = "datasets"
+# One judge per mode, so one session's sidebar toggle never changes another session's judge
+@st.cache_resource
+def get_judge_bot(judge_mode):
+    return GenerateEmail(deployment_name=os.getenv("JUDGE_DEPLOYMENT", "gpt-4.1"), judge_mode=judge_mode)
 
-# --- HELPER FUNCTIONS ---
-@st.cache_data
-def load_single_jsonl(file_name):
-    path = os.path.join(DATASET_DIR, file_name)
-    data = []
-    
-    if os.path.exists(path):
-        with open(path, "r", encoding="utf-8") as f:
-            for line in f:
-                try:
-                    data.append(json.loads(line))
-                except json.JSONDecodeError:
-                    continue
-    return data
+generator_bot = get_generator_bot()
+# Judgements by content hash, shared by every session on this server
+judge_memo = get_judge_memo()
 
-def get_emails_dict(file_name):
-    raw_data = load_single_jsonl(file_name)
-    emails = {}
-    for idx, item in enumerate(raw_data):
-        new_id = idx + 1
-        item["id"] = new_id
-        emails[new_id] = item
-    return {"emails": emails, "ids": list(emails.keys())}
+DATASET_DIR = "datasets"
+# Above this many emails the picker becomes a number input; a selectbox ships every option on each rerun
+PICKER_LIMIT = 2000
+METRIC_NAMES = ["faithfulness", "completeness", "robustness", "url_preservation", "edge_case_scan"]
 
 # ---------------- SIDEBAR CONFIGURATION ----------------
 st.sidebar.title("Configuration")
@@ -98,17 +88,59 @@ elif source_category == "Generated Mails":
             format_func=format_filename
         )
 
+combined_judging = st.sidebar.checkbox(
+    "Single-call judging",
+    value=False,
+    help="Score all five metrics in one judge request instead of five."
+)
+judge_bot = get_judge_bot("combined" if combined_judging else "per_metric")
+
+stream_rewrites = st.sidebar.checkbox(
+    "Stream rewrites",
+    value=True,
+    help="Show the rewrite as it is written instead of waiting for the full reply."
+)
+
+prefetch_judging = st.sidebar.checkbox(
+    "Judge in background",
+    value=False,
+    help="Start judging as soon as a rewrite finishes, so 'Judge Email' usually has the scores ready."
+)
+
+with st.sidebar.expander("🔌 Connection pool"):
+    pools = connection_stats()
+    if not pools:
+        st.caption("No requests sent yet.")
+    for pool in pools:
+        st.caption(f"{pool['requests']} requests over {pool['new_connections']} connections "
+                   f"({pool['reuse_rate']:.0%} reused, pool size {pool['pool_size']})")
+    for name, bot in (("Rewrites", generator_bot), ("Judge", judge_bot)):
+        # Hedging is opt-in (HEDGE_PERCENTILE) and shared by every session on the deployment
+        hedge = bot.hedge.stats()
+        if hedge["percentile"] and hedge["calls"]:
+            st.caption(f"{name}: {hedge['hedged']}/{hedge['calls']} calls hedged ({hedge['hedge_wins']} won), "
+                       f"p95 {hedge['unhedged_p95_s']:.2f}s → {hedge['p95_s']:.2f}s")
+    memo = judge_memo.stats()
+    st.caption(f"Judge memo: {memo['entries']} scores, {memo['hits']} hits, {memo['misses']} misses, "
+               f"{memo['prefetched']} prefetched, {memo['pending']} in flight")
+
 # ---------------- LOAD CONTENT ----------------
 if selected_filename:
-    dataset_info = get_emails_dict(selected_filename)
-    email_ids = dataset_info["ids"]
+    # Indexed once per file; reruns only stat the file and read the selected line
+    dataset = open_dataset(os.path.join(DATASET_DIR, selected_filename))
+    email_ids = dataset.ids()
 
     if not email_ids:
         st.error(f"Error: No data found in '{selected_filename}'. Please check the file.")
         st.stop()
 
-    email_id = st.sidebar.selectbox("Select Email ID", email_ids)
-    email = dataset_info["emails"][email_id]
+    if len(email_ids) <= PICKER_LIMIT:
+        email_id = st.sidebar.selectbox("Select Email ID", email_ids)
+    else:
+        position = st.sidebar.number_input(f"Select Email (1-{len(email_ids)})", min_value=1, max_value=len(email_ids), step=1)
+        email_id = email_ids[position - 1]
+        st.sidebar.caption(f"Email ID: {email_id}")
+    email = dataset.get(email_id, {})
 else:
     st.info("👈 Please select a file to begin.")
     st.stop()
@@ -118,6 +150,8 @@ state_id = f"{selected_filename}_{email_id}"
 body_key = f"body_{state_id}"
 orig_key = f"orig_{state_id}"
 metrics_key = f"metrics_{state_id}"
+pending_key = f"pending_{state_id}"
+variants_key = f"variants_{state_id}"
 
 # Expanded metrics structure (5 metrics)
 default_metrics = {
@@ -135,6 +169,13 @@ if orig_key not in st.session_state:
 if metrics_key not in st.session_state:
     st.session_state[metrics_key] = default_metrics.copy()
 
+def prefetch_judge():
+    # Same stripped texts as run_judge, so the click finds these memo entries
+    original = st.session_state[orig_key].strip()
+    current = st.session_state[body_key].strip()
+    if prefetch_judging and current and original != current:
+        judge_memo.prefetch(judge_bot, METRIC_NAMES, original, current)
+
 # ---------------- MAIN UI ----------------
 st.markdown(f"### 📧 Email Details")
 st.caption(f"File: {selected_filename}")
@@ -143,6 +184,33 @@ st.markdown(f"**Subject:** {email.get('subject', 'No Subject')}")
 st.markdown("---")
 
 st.markdown("### ✏️ Email Body")
+
+# A streamed rewrite queued by run_ai renders here, where the text area sits
+pending = st.session_state.pop(pending_key, None)
+if pending:
+    action_type, tone = pending
+    placeholder = st.empty()
+    text, error = "", None
+    try:
+        for chunk in generator_bot.generate_stream(action_type, st.session_state[body_key].strip(), tone_type=tone):
+            text += chunk
+            placeholder.markdown(text + "▌")
+    except Exception as e:
+        # A timeout or dropped connection after the first chunk; what arrived is kept for editing
+        error = e
+    placeholder.empty()
+
+    if error is not None:
+        st.error(f"Error: the rewrite stopped part-way: {error}")
+        if text.strip():
+            st.session_state[body_key] = generator_bot._clean_body(text, action_type)
+    elif not text.startswith("Error:"):
+        st.session_state[body_key] = generator_bot._clean_body(text, action_type)
+        st.session_state[metrics_key] = default_metrics.copy()
+        prefetch_judge()
+    else:
+        st.error(text)
+
 st.text_area(label="Edit text below:", height=250, key=body_key)
 
 # ---------------- LOGIC HANDLERS ----------------
@@ -151,6 +219,11 @@ def run_ai(action_type, tone=None):
     if not current:
         return
 
+    if stream_rewrites:
+        # Callbacks run before the page is drawn, so the stream itself is rendered in the main body
+        st.session_state[pending_key] = (action_type, tone or "Professional")
+        return
+
     with st.spinner("Generating..."):
         if action_type == "tone":
             res = generator_bot.generate("tone", current, tone_type=tone)
@@ -160,6 +233,7 @@ def run_ai(action_type, tone=None):
     if not res.startswith("Error:"):
         st.session_state[body_key] = res
         st.session_state[metrics_key] = default_metrics.copy()
+        prefetch_judge()
     else:
         st.error(res)
 
@@ -174,25 +248,59 @@ def run_judge():
         st.warning("You haven't modified the email.")
         return
 
-    # UPDATED METRICS LIST (5 Core Metrics)
-    metric_names = [
-        "faithfulness", "completeness", "robustness", 
-        "url_preservation", "edge_case_scan"
-    ]
-    results = {}
-
     with st.spinner("Judging Metrics (Running Evaluators)..."):
-        with concurrent.futures.ThreadPoolExecutor(max_workers=5) as executor:
-            future_to_metric = {
-                executor.submit(judge_bot.evaluate, m, original, current): m 
-                for m in metric_names
-            }
-            
-            for future in concurrent.futures.as_completed(future_to_metric):
-                metric_name = future_to_metric[future]
-                results[metric_name] = future.result()
+        start = time.perf_counter()
+        # Pairs judged before (in any session) or still being prefetched make no new calls
+        judgements, judged = judge_memo.evaluate_all(judge_bot, METRIC_NAMES, original, current)
+        st.session_state["last_judge_seconds"] = time.perf_counter() - start
+        st.session_state["last_judge_reused"] = len(METRIC_NAMES) - judged
 
-    st.session_state[metrics_key] = results
+    st.session_state[metrics_key] = {m: j["explanation"] for m, j in judgements.items()}
+
+def run_variants():
+    current = st.session_state[body_key].strip()
+    if not current:
+        return
+
+    cached = st.session_state.get(variants_key)
+    if cached and cached["source"] == current:
+        # Already generated for this exact text
+        return
+
+    with st.spinner(f"Generating {len(REWRITE_VARIANTS)} variants..."):
+        start = time.perf_counter()
+        rewrites = generator_bot.generate_variants(current)
+    st.session_state[variants_key] = {
+        "source": current,
+        "rewrites": rewrites,
+        "seconds": time.perf_counter() - start,
+        "metrics": {},
+    }
+
+def judge_variants():
+    variants = st.session_state.get(variants_key)
+    original = st.session_state[orig_key].strip()
+    if not variants:
+        return
+    labels = [
+        label for label, text in variants["rewrites"].items()
+        if not text.startswith("Error:") and text.strip() != original
+    ]
+
+    with st.spinner(f"Judging {len(labels)} variants..."):
+        start = time.perf_counter()
+        # Queue every variant first so they are judged side by side, then collect them
+        for label in labels:
+            judge_memo.prefetch(judge_bot, METRIC_NAMES, original, variants["rewrites"][label].strip())
+        for label in labels:
+            judgements, _ = judge_memo.evaluate_all(judge_bot, METRIC_NAMES, original, variants["rewrites"][label].strip())
+            variants["metrics"][label] = judgements
+        st.session_state["last_judge_seconds"] = time.perf_counter() - start
+        st.session_state["last_judge_reused"] = 0
+
+def use_variant(label):
+    st.session_state[body_key] = st.session_state[variants_key]["rewrites"][label]
+    st.session_state[metrics_key] = default_metrics.copy()
 
 def reset():
     st.session_state[body_key] = st.session_state[orig_key]
@@ -207,9 +315,16 @@ with c1:
 with c2:
     st.button("📝 Lengthen", on_click=run_ai, args=("lengthen",), use_container_width=True)
 with c3:
-    t = st.selectbox("Tone", ["Friendly", "Sympathetic", "Professional", "Diplomatic", "Witty"], label_visibility="collapsed")
+    t = st.selectbox("Tone", REWRITE_TONES, label_visibility="collapsed")
     st.button("🎭 Apply Tone", on_click=run_ai, args=("tone", t), use_container_width=True)
 
+st.button(
+    "🧪 Generate All Variants",
+    on_click=run_variants,
+    use_container_width=True,
+    help="Shorten, lengthen and every tone at once, shown side by side below.",
+)
+
 st.markdown("")
 
 if st.button("⚖️ Judge Email", on_click=run_judge, use_container_width=True, type="primary"):
@@ -230,6 +345,41 @@ if any(metrics.values()):
     with m4: st.error(f"**URL Preservation**\n\n{metrics['url_preservation']}")
     with m5: st.warning(f"**Edge Case Stability**\n\n{metrics['edge_case_scan']}")
 
+if "last_judge_seconds" in st.session_state:
+    reused = st.session_state.get("last_judge_reused", 0)
+    st.caption(f"⏱️ Last judge took {st.session_state['last_judge_seconds']:.2f}s"
+               + (f" ({reused}/{len(METRIC_NAMES)} scores memoized or prefetched)" if reused else ""))
+
+# ---------------- VARIANTS DISPLAY ----------------
+variants = st.session_state.get(variants_key)
+
+if variants:
+    st.markdown("#### 🧪 All Variants")
+    st.caption(f"{len(variants['rewrites'])} rewrites generated concurrently in {variants['seconds']:.2f}s")
+    st.button("⚖️ Judge All Variants", on_click=judge_variants)
+
+    labels = list(variants["rewrites"])
+    for row in range(0, len(labels), 4):
+        for col, label in zip(st.columns(4), labels[row:row + 4]):
+            with col:
+                text = variants["rewrites"][label]
+                st.markdown(f"**{label}**")
+                if text.startswith("Error:"):
+                    st.error(text)
+                    continue
+                with st.container(height=220):
+                    st.markdown(text)
+                judgements = variants["metrics"].get(label)
+                if judgements:
+                    scores = [j["score"] for j in judgements.values() if j["score"] is not None]
+                    if scores:
+                        st.caption(f"Mean score {sum(scores) / len(scores):.2f}/5")
+                    st.caption(" · ".join(
+                        f"{m}: {j['score']:.2f}" if j["score"] is not None else f"{m}: –"
+                        for m, j in judgements.items()
+                    ))
+                st.button("Use this", key=f"use_{variants_key}_{label}", on_click=use_variant, args=(label,))
+
 st.divider()
 if st.button("🔄 Reset to Original Content", on_click=reset):
     st.toast("Restored!")
\ No newline at end of file
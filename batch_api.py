@@ -0,0 +1,249 @@
+"""Provider-side batch submission (Azure OpenAI Batch API) for offline runs.
+
+Requests are written as Batch-API JSONL input files, submitted, polled until
+the provider finishes them, and the output lines are merged back by
+custom_id. Batch jobs trade latency (up to the 24h completion window) for a
+lower price and a quota that is separate from the real-time rate limits.
+
+Two interchangeable clients implement submit / status / results:
+
+* AzureBatchClient talks to the real endpoint (the deployments must be of a
+  Global-Batch type).
+* LocalBatchClient is a file-based stand-in that answers requests with the
+  canned mock_server.py replies, so the whole flow runs offline.
+"""
+import os
+import json
+import time
+import uuid
+import hashlib
+
+# Batch endpoints need a newer API version than the chat calls in generate.py
+BATCH_API_VERSION = "2024-10-21"
+# Provider caps are 100k requests / 200 MB per input file; stay well below both
+MAX_REQUESTS_PER_FILE = 50000
+MAX_BYTES_PER_FILE = 100 * 1024 * 1024
+
+TERMINAL_STATES = {"completed", "failed", "expired", "cancelled"}
+# States whose batch cannot be reused when the same input file is submitted again
+DEAD_STATES = {"failed", "expired", "cancelled", "cancelling"}
+
+
+def request_line(custom_id, model, messages, temperature, **params):
+    """One Batch-API input line for a chat-completions request."""
+    return {
+        "custom_id": custom_id,
+        "method": "POST",
+        "url": "/chat/completions",
+        "body": {"model": model, "messages": messages, "temperature": temperature, **params},
+    }
+
+
+def parse_result(line):
+    """Turns one output line into (content, usage, error); error is None on success."""
+    response = line.get("response") or {}
+    body = response.get("body") or {}
+    error = line.get("error") or body.get("error")
+    if error or response.get("status_code") != 200:
+        message = error.get("message") if isinstance(error, dict) else None
+        return None, None, message or f"status {response.get('status_code')}"
+    choices = body.get("choices") or []
+    if not choices:
+        return None, None, "empty response (content filtered?)"
+    return (choices[0].get("message") or {}).get("content") or "", body.get("usage") or {}, None
+
+
+class AzureBatchClient:
+    """Submits input files to the Azure OpenAI Batch API."""
+
+    def __init__(self, api_version=BATCH_API_VERSION):
+        from http_clients import get_client_pool
+
+        self.client = get_client_pool(api_version).client()
+
+    def submit(self, path):
+        with open(path, "rb") as f:
+            uploaded = self.client.files.create(file=f, purpose="batch")
+        batch = self.client.batches.create(
+            input_file_id=uploaded.id,
+            endpoint="/chat/completions",
+            completion_window="24h",
+        )
+        return batch.id
+
+    def status(self, batch_id):
+        return self.client.batches.retrieve(batch_id).status
+
+    def results(self, batch_id):
+        batch = self.client.batches.retrieve(batch_id)
+        # Successful lines are in the output file, failed requests in the error file
+        for file_id in (batch.output_file_id, batch.error_file_id):
+            if not file_id:
+                continue
+            for raw in self.client.files.content(file_id).text.splitlines():
+                if raw.strip():
+                    yield json.loads(raw)
+
+
+class LocalBatchClient:
+    """File-based stand-in for the Batch API.
+
+    Each batch is a folder under workdir holding input.jsonl and, once it has
+    been "processed", output.jsonl in the provider's output format. A batch
+    reports in_progress for polls_until_done - 1 polls so callers exercise
+    their polling loop.
+    """
+
+    def __init__(self, workdir, responder=None, polls_until_done=2):
+        if responder is None:
+            from mock_server import MockBehaviour
+
+            responder = MockBehaviour(latency_ms=0).reply
+        self.workdir = workdir
+        self.responder = responder
+        self.polls_until_done = polls_until_done
+        self._polls = {}
+
+    def _batch_dir(self, batch_id):
+        return os.path.join(self.workdir, batch_id)
+
+    def submit(self, path):
+        batch_id = f"local-{uuid.uuid4().hex[:12]}"
+        os.makedirs(self._batch_dir(batch_id))
+        with open(path, "rb") as src, open(os.path.join(self._batch_dir(batch_id), "input.jsonl"), "wb") as dst:
+            dst.write(src.read())
+        return batch_id
+
+    def status(self, batch_id):
+        if not os.path.isdir(self._batch_dir(batch_id)):
+            return "failed"
+        if os.path.exists(os.path.join(self._batch_dir(batch_id), "output.jsonl")):
+            return "completed"
+        self._polls[batch_id] = self._polls.get(batch_id, 0) + 1
+        if self._polls[batch_id] < self.polls_until_done:
+            return "in_progress"
+        self._process(batch_id)
+        return "completed"
+
+    def _process(self, batch_id):
+        batch_dir = self._batch_dir(batch_id)
+        with open(os.path.join(batch_dir, "input.jsonl"), "r", encoding="utf-8") as src, \
+                open(os.path.join(batch_dir, "output.jsonl.tmp"), "w", encoding="utf-8") as dst:
+            for raw in src:
+                if not raw.strip():
+                    continue
+                request = json.loads(raw)
+                body = request["body"]
+                content = self.responder(body)
+                prompt_tokens = sum(len(m.get("content", "")) // 4 for m in body.get("messages", []))
+                completion_tokens = len(content) // 4
+                dst.write(json.dumps({
+                    "id": f"batch_req_{uuid.uuid4().hex[:12]}",
+                    "custom_id": request["custom_id"],
+                    "response": {
+                        "status_code": 200,
+                        "body": {
+                            "object": "chat.completion",
+                            "model": body.get("model"),
+                            "choices": [{"index": 0, "finish_reason": "stop",
+                                         "message": {"role": "assistant", "content": content}}],
+                            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                                      "total_tokens": prompt_tokens + completion_tokens},
+                        },
+                    },
+                    "error": None,
+                }) + "\n")
+        os.replace(os.path.join(batch_dir, "output.jsonl.tmp"), os.path.join(batch_dir, "output.jsonl"))
+
+    def results(self, batch_id):
+        path = os.path.join(self._batch_dir(batch_id), "output.jsonl")
+        if not os.path.exists(path):
+            return
+        with open(path, "r", encoding="utf-8") as f:
+            for raw in f:
+                if raw.strip():
+                    yield json.loads(raw)
+
+
+# --- SUBMIT / POLL / MERGE ---
+def _chunks(requests):
+    """Encoded input files, split by request count and byte size."""
+    chunk, size = [], 0
+    for request in requests:
+        line = (json.dumps(request) + "\n").encode("utf-8")
+        if chunk and (len(chunk) >= MAX_REQUESTS_PER_FILE or size + len(line) > MAX_BYTES_PER_FILE):
+            yield b"".join(chunk)
+            chunk, size = [], 0
+        chunk.append(line)
+        size += len(line)
+    if chunk:
+        yield b"".join(chunk)
+
+
+def _load_state(workdir):
+    try:
+        with open(os.path.join(workdir, "batches.json"), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_state(workdir, state):
+    path = os.path.join(workdir, "batches.json")
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=2)
+    os.replace(path + ".tmp", path)
+
+
+def run_requests(client, requests, workdir, name, poll_interval=60.0):
+    """Submits requests, waits for every batch and returns {custom_id: (content, usage, error)}.
+
+    Input files are named by a hash of their content and the batch id for
+    each is remembered in workdir/batches.json, so rerunning after a crash
+    picks the submitted batches back up instead of paying for them twice.
+    """
+    os.makedirs(workdir, exist_ok=True)
+    state = _load_state(workdir)
+
+    batch_ids = []
+    for part, data in enumerate(_chunks(requests)):
+        digest = hashlib.sha256(data).hexdigest()[:16]
+        path = os.path.join(workdir, f"{name}.part{part}.{digest}.jsonl")
+        with open(path, "wb") as f:
+            f.write(data)
+
+        batch_id = state.get(digest)
+        if batch_id and client.status(batch_id) in DEAD_STATES:
+            batch_id = None
+        if batch_id:
+            print(f"♻️  {name} part {part}: reusing batch {batch_id}")
+        else:
+            batch_id = client.submit(path)
+            state[digest] = batch_id
+            _save_state(workdir, state)
+            count = data.count(b"\n")
+            print(f"📤 {name} part {part}: {count} requests -> batch {batch_id}")
+        batch_ids.append(batch_id)
+
+    statuses = {}
+    while len(statuses) < len(batch_ids):
+        for batch_id in batch_ids:
+            if batch_id not in statuses:
+                status = client.status(batch_id)
+                if status in TERMINAL_STATES:
+                    statuses[batch_id] = status
+        if len(statuses) < len(batch_ids):
+            print(f"⏳ {name}: {len(batch_ids) - len(statuses)} batch(es) still running, next check in {poll_interval:.0f}s")
+            time.sleep(poll_interval)
+
+    results = {}
+    for batch_id in batch_ids:
+        if statuses[batch_id] != "completed":
+            # Expired/cancelled batches still return whatever finished in time
+            print(f"⚠️ {name}: batch {batch_id} ended as {statuses[batch_id]}")
+        for line in client.results(batch_id):
+            results[line["custom_id"]] = parse_result(line)
+
+    for request in requests:
+        results.setdefault(request["custom_id"], (None, None, "no result returned by the batch"))
+    return results
@@ -1,13 +1,16 @@
 import os
-import json
-import re
-import concurrent.futures
+import asyncio
+import argparse
 import time
-from dotenv import load_dotenv
-from generate import GenerateEmail
-from tqdm import tqdm
-
-load_dotenv()
+from generate import GenerateEmail, load_env, set_max_inflight
+from results_store import ResultsStore, DEFAULT_RESULTS_PATH, unit_key, read_results
+from dataset import open_dataset
+from batch_api import AzureBatchClient, LocalBatchClient
+from pipeline import Stage, run_pipeline, arun_pipeline
+import telemetry
+import token_budget
+import fingerprints
+from http_clients import connection_stats
 
 DATASET_DIR = "datasets"
 FILES_TO_TEST = ["mixed.jsonl", "challenge.jsonl", "adversarial.jsonl"]
@@ -25,63 +28,31 @@ METRICS = [
     "edge_case_scan"
 ]
 
-# Initialize Bots
-generator_bot = GenerateEmail(deployment_name=os.getenv("GENERATOR_DEPLOYMENT", "gpt-4o-mini"))
-judge_bot = GenerateEmail(deployment_name=os.getenv("JUDGE_DEPLOYMENT", "gpt-4.1"))
-
-def parse_score(response_text):
-    """Extracts floating point score from AI response."""
-    match = re.search(r"Score:\s*(\d+\.\d+)", response_text)
-    if match:
-        return float(match.group(1))
-    match_int = re.search(r"Score:\s*(\d+)", response_text)
-    if match_int:
-        return float(match_int.group(1))
-    return 0.0
-
-def process_single_entry(entry, action, tone_type=None):
-    original_text = entry.get("content", "")
-    if not original_text:
-        return None
-
-    # 1. Rewrite
-    rewritten_text = generator_bot.generate(action, original_text, tone_type=tone_type)
-    
-    # 2. Evaluate (Parallel)
-    scores = {}
-    explanations = {}
-    
-    with concurrent.futures.ThreadPoolExecutor(max_workers=len(METRICS)) as executor:
-        future_map = {
-            executor.submit(judge_bot.evaluate, m, original_text, rewritten_text): m 
-            for m in METRICS
-        }
-        
-        for future in concurrent.futures.as_completed(future_map):
-            metric = future_map[future]
-            res = future.result()
-            scores[metric] = parse_score(res)
-            explanations[metric] = res 
+# Score changes smaller than this are float noise, not moves (scores have two decimals)
+MOVE_THRESHOLD = 0.005
+
+# Bots are built by init_bots(), so importing this module (judge_compare does) reads no .env
+generator_bot = None
+judge_bot = None
+
+def init_bots():
+    """Builds the generator and judge bots once, after .env has named their deployments."""
+    global generator_bot, judge_bot
+    if generator_bot is None:
+        load_env()
+        generator_bot = GenerateEmail(deployment_name=os.getenv("GENERATOR_DEPLOYMENT", "gpt-4o-mini"))
+        judge_bot = GenerateEmail(deployment_name=os.getenv("JUDGE_DEPLOYMENT", "gpt-4.1"))
 
+def _build_result(entry, original_text, rewritten_text, judgements):
     return {
         "id": entry.get("id"),
         "original": original_text,
         "rewritten": rewritten_text,
-        "scores": scores,
-        "explanations": explanations
+        "scores": {m: j["score"] for m, j in judgements.items()},
+        "explanations": {m: j["explanation"] for m, j in judgements.items()}
     }
 
-def run_test_suite():
-    print("🚀 Starting GLOBAL Batch Evaluation (Aggregated)")
-    print(f"Metrics: {METRICS}")
-    print(f"Files: {FILES_TO_TEST}")
-    print("--------------------------------------------------")
-    
-    # Global Accumulators
-    global_metrics_sum = {m: 0.0 for m in METRICS}
-    global_count = 0
-    all_worst_cases = []
-    
+def build_configurations():
     # Build Configuration List (7 Items)
     configurations = []
     for action in ACTIONS:
@@ -90,61 +61,264 @@ def run_test_suite():
                 configurations.append({"action": action, "tone": t})
         else:
             configurations.append({"action": action, "tone": None})
+    return configurations
+
+def config_label(config):
+    label = f"{config['action'].upper()}"
+    if config["tone"]:
+        label += f" ({config['tone']})"
+    return label
+
+def iter_work_units(configurations, done_keys):
+    """Flattens every pending (config, file, entry id) combination into one work list.
+
+    Units only carry the id; workers read the entry through the dataset index
+    when they pick the unit up, so no file is held in memory.
+    """
+    datasets = {}
+    for filename in FILES_TO_TEST:
+        filepath = os.path.join(DATASET_DIR, filename)
+        if os.path.exists(filepath):
+            datasets[filename] = open_dataset(filepath)
+    file_ids = {filename: ds.ids() for filename, ds in datasets.items()}
 
-    # --- MASTER LOOP ---
     for config in configurations:
-        current_action = config['action']
-        current_tone = config['tone']
-        
-        label = f"{current_action.upper()}"
-        if current_tone:
-            label += f" ({current_tone})"
-            
-        print(f"\n▶️  Processing Action: {label}")
-
-        for filename in FILES_TO_TEST:
-            filepath = os.path.join(DATASET_DIR, filename)
-            if not os.path.exists(filepath):
+        label = config_label(config)
+        for filename, ids in file_ids.items():
+            for entry_id in ids:
+                if unit_key(label, filename, entry_id) in done_keys:
+                    continue
+                yield {"config": config, "label": label, "file": filename, "dataset": datasets[filename], "id": entry_id}
+
+def _unit_entry(unit):
+    return unit["dataset"].get(unit["id"], {})
+
+# --- INCREMENTAL RUNS ---
+def tag_fingerprints(units):
+    """Attaches generation, judge and input fingerprints to every unit (see fingerprints.py)."""
+    judge_prints = fingerprints.judge_fingerprints(judge_bot, METRICS)
+    gen_prints, input_prints = {}, {}
+    for unit in units:
+        if unit["label"] not in gen_prints:
+            gen_prints[unit["label"]] = fingerprints.generation_fingerprint(generator_bot, unit["config"])
+        # The same email appears under every config; hash it once
+        entry_key = (unit["file"], unit["id"])
+        if entry_key not in input_prints:
+            input_prints[entry_key] = fingerprints.input_fingerprint(_unit_entry(unit))
+        unit["fingerprints"] = {
+            "generation": gen_prints[unit["label"]],
+            "judge": judge_prints,
+            "input": input_prints[entry_key],
+        }
+
+def plan_incremental(units, previous):
+    """Splits units against the previous run's records by fingerprint.
+
+    Returns (records to reuse as they are, units still to run). Units whose
+    rewrite is still valid carry it, plus the judgements that are still
+    valid, so only the metrics whose judge changed are asked again.
+    """
+    reused, pending, rejudged = [], [], 0
+    for unit in units:
+        prev = previous.get(unit_key(unit["label"], unit["file"], unit["id"]))
+        old = (prev or {}).get("fingerprints") or {}
+        new = unit["fingerprints"]
+        if old.get("input") == new["input"] and old.get("generation") == new["generation"]:
+            old_judge = old.get("judge") or {}
+            # Missing scores (failed calls, unparseable replies) are asked again too
+            stale = [m for m in METRICS if old_judge.get(m) != new["judge"][m] or prev["scores"].get(m) is None]
+            if not stale:
+                reused.append(prev)
+                continue
+            unit["rewritten"] = prev["rewritten"]
+            unit["kept"] = {
+                m: {"score": prev["scores"][m], "explanation": prev["explanations"].get(m, "")}
+                for m in METRICS if m not in stale
+            }
+            rejudged += 1
+        pending.append(unit)
+    print(f"♻️  Incremental: {len(reused)} results reused, {rejudged} rewrites re-judged, "
+          f"{len(pending) - rejudged} units recomputed")
+    return reused, pending
+
+# --- PIPELINE STAGES ---
+# The rewrite stage (generator deployment) feeds the judge stage (judge deployment)
+# through a bounded queue, so both quotas are in use at the same time.
+def _rewrite_stage(unit):
+    entry = _unit_entry(unit)
+    original_text = entry.get("content", "")
+    # Set when an incremental run kept the previous rewrite and only the judge changed
+    rewritten_text = unit.get("rewritten")
+    if original_text and rewritten_text is None:
+        config = unit["config"]
+        rewritten_text = generator_bot.generate(config["action"], original_text, tone_type=config["tone"])
+    return {**unit, "entry": entry, "rewritten": rewritten_text}
+
+async def _arewrite_stage(unit):
+    entry = _unit_entry(unit)
+    original_text = entry.get("content", "")
+    # Set when an incremental run kept the previous rewrite and only the judge changed
+    rewritten_text = unit.get("rewritten")
+    if original_text and rewritten_text is None:
+        config = unit["config"]
+        rewritten_text = await generator_bot.agenerate(config["action"], original_text, tone_type=config["tone"])
+    return {**unit, "entry": entry, "rewritten": rewritten_text}
+
+def _judge_stage(item):
+    if item["rewritten"] is None:
+        return item, None
+    entry = item["entry"]
+    judgements = {}
+    # A failed rewrite is reported as an error without spending judge quota on it
+    if not item["rewritten"].startswith("Error:"):
+        kept = item.get("kept", {})
+        stale = [m for m in METRICS if m not in kept]
+        judgements = {**kept, **judge_bot.evaluate_all(stale, entry["content"], item["rewritten"], parallel=False)}
+    return item, _build_result(entry, entry["content"], item["rewritten"], judgements)
+
+async def _ajudge_stage(item):
+    if item["rewritten"] is None:
+        return item, None
+    entry = item["entry"]
+    judgements = {}
+    if not item["rewritten"].startswith("Error:"):
+        kept = item.get("kept", {})
+        stale = [m for m in METRICS if m not in kept]
+        judgements = {**kept, **await judge_bot.aevaluate_all(stale, entry["content"], item["rewritten"])}
+    return item, _build_result(entry, entry["content"], item["rewritten"], judgements)
+
+def _progress(total):
+    # One bar for the whole run: tqdm reports items/sec and the ETA across all units
+    from tqdm import tqdm
+    return tqdm(total=total, desc="   📦 work units", unit="item", smoothing=0.05)
+
+def _run_pipeline(units, on_result, on_failure, use_async, gen_workers, judge_workers):
+    """Runs every work unit through the rewrite -> judge pipeline; returns per-stage stats.
+
+    on_failure gets the pipeline.StageError of every unit a stage raised on.
+    """
+    with _progress(len(units)) as bar:
+        def deliver(output):
+            item, res = output
+            if res:
+                on_result(res, item)
+            bar.update(1)
+
+        def fail(failure):
+            on_failure(failure)
+            bar.update(1)
+
+        if use_async:
+            # An async judge worker gathers all of an item's metric calls at once, so its
+            # workers queue for the judge deployment's --judge-concurrency slots: that limit,
+            # not the worker count, caps async throughput. Fewer workers would leave slots
+            # idle while each item waits on its slowest metric.
+            stages = [Stage("rewrite", _arewrite_stage, gen_workers), Stage("judge", _ajudge_stage, judge_workers)]
+            return asyncio.run(arun_pipeline(units, stages, deliver, fail))
+        stages = [Stage("rewrite", _rewrite_stage, gen_workers), Stage("judge", _judge_stage, judge_workers)]
+        return run_pipeline(units, stages, deliver, fail)
+
+def _run_batch_api(units, on_result, client, workdir, poll_interval):
+    """Runs every work unit as provider batch jobs: all rewrites first, then all judgements."""
+    # Stage 1: one rewrite request per unit that has content, or per chunk of an oversized one
+    gen_calls, chunked = {}, {}
+    rewrites = {}
+    for i, unit in enumerate(units):
+        original = _unit_entry(unit).get("content", "")
+        if original and unit.get("rewritten") is not None:
+            rewrites[i] = unit["rewritten"]
+        elif original:
+            action, tone = unit["config"]["action"], unit["config"]["tone"]
+            chunked[i] = token_budget.split_paragraphs(original, generator_bot.chunk_tokens)
+            for c, (_, chunk) in enumerate(chunked[i]):
+                gen_calls[f"gen-{i}-{c}"] = (generator_bot._generate_messages(action, chunk, tone), {}, ("generate", action))
+    answers = generator_bot.batch_complete(gen_calls, client, workdir, "generate", poll_interval)
+    for i, chunks in chunked.items():
+        action = units[i]["config"]["action"]
+        parts = [generator_bot._clean_body(answers[f"gen-{i}-{c}"], action) for c in range(len(chunks))]
+        rewrites[i] = generator_bot._stitch_chunks(chunks, parts)
+
+    # Stage 2: judgements for every rewrite that came back
+    # Incremental runs carry the judgements that are still valid; only the rest are requested
+    judgements = {i: dict(units[i].get("kept", {})) for i, r in rewrites.items() if not r.startswith("Error:")}
+    if judge_bot.judge_mode == "combined":
+        combined_calls, stale = {}, {}
+        for i, kept in judgements.items():
+            stale[i] = [m for m in METRICS if m not in kept]
+            if not stale[i]:
                 continue
-            
-            # Load ALL Entries
-            entries = []
-            with open(filepath, "r", encoding="utf-8") as f:
-                for line in f:
-                    try:
-                        entries.append(json.loads(line))
-                    except: continue
-            
-            # Use ALL entries in the file
-            entries_to_run = entries 
-            
-            # Run Batch (Silent Mode - No intermediate tables)
-            with concurrent.futures.ThreadPoolExecutor(max_workers=3) as executor:
-                futures = [
-                    executor.submit(process_single_entry, e, current_action, current_tone) 
-                    for e in entries_to_run
-                ]
-                
-                # Progress bar for visual feedback only
-                for future in tqdm(concurrent.futures.as_completed(futures), total=len(entries_to_run), desc=f"   📂 {filename}", leave=False):
-                    res = future.result()
-                    if res:
-                        # Add to Global Sums
-                        for m in METRICS:
-                            global_metrics_sum[m] += res["scores"].get(m, 0.0)
-                        global_count += 1
-                        
-                        # Edge Case Detection
-                        failed_metrics = [m for m, s in res["scores"].items() if s < 3.0]
-                        if failed_metrics:
-                            all_worst_cases.append({
-                                "config": label,
-                                "file": filename,
-                                "id": res["id"],
-                                "failures": failed_metrics,
-                                "scores": res["scores"],
-                                "explanation": res["explanations"][failed_metrics[0]]
-                            })
+            messages = judge_bot._combined_messages(stale[i], _unit_entry(units[i])["content"], rewrites[i])
+            if messages is not None:
+                combined_calls[f"judge-{i}"] = (messages, {"response_format": {"type": "json_object"}}, ("evaluate_all", "combined"))
+        answers = judge_bot.batch_complete(combined_calls, client, workdir, "judge-combined", poll_interval)
+        for cid, text in answers.items():
+            i = int(cid.split("-")[1])
+            judgements[i].update(judge_bot._parse_combined(text, stale[i]))
+
+    # Per-metric requests for the default mode and for anything a combined reply missed
+    metric_calls = {}
+    for i, scored in judgements.items():
+        original = _unit_entry(units[i])["content"]
+        for m in METRICS:
+            if m not in scored:
+                messages = judge_bot._evaluate_messages(m, original, rewrites[i])
+                if messages is None:
+                    scored[m] = judge_bot._judgement(f"Error: Metric prompt for '{m}' not found.")
+                else:
+                    metric_calls[f"judge-{i}-{m}"] = (messages, judge_bot._evaluate_params(), ("evaluate", m))
+    answers = judge_bot.batch_complete(metric_calls, client, workdir, "judge", poll_interval)
+    for cid, text in answers.items():
+        _, i, m = cid.split("-", 2)
+        judgements[int(i)][m] = judge_bot._judgement(text)
+
+    # Bounded re-asks for replies without a usable score; the round number keeps the
+    # input files (and so the reused batch ids) apart from earlier rounds
+    for attempt in range(judge_bot.max_reasks):
+        reask_calls = {
+            f"reask{attempt}-{i}-{m}": metric_calls[f"judge-{i}-{m}"][:2] + (("reask", m),)
+            for i, scored in judgements.items() for m, j in scored.items()
+            if f"judge-{i}-{m}" in metric_calls and judge_bot.needs_reask(j)
+        }
+        if not reask_calls:
+            break
+        answers = judge_bot.batch_complete(reask_calls, client, workdir, f"judge-reask{attempt}", poll_interval, cacheable=False)
+        for cid, text in answers.items():
+            _, i, m = cid.split("-", 2)
+            judgement = judge_bot._judgement(text)
+            if judgement["score"] is not None:
+                messages, params, _ = reask_calls[cid]
+                judge_bot._cache_replace(messages, params, text)
+            judgements[int(i)][m] = judgement
+
+    # Same result records, store and report as the real-time paths
+    for i, rewritten in rewrites.items():
+        entry = _unit_entry(units[i])
+        res = _build_result(entry, entry["content"], rewritten, judgements.get(i, {}))
+        on_result(res, units[i])
+
+def _has_api_error(res):
+    texts = [res["rewritten"], *res["explanations"].values()]
+    return any(t.startswith("Error:") for t in texts)
+
+def _grade(avg):
+    if avg >= 4.8: return "🌟 PERFECT"
+    if avg >= 4.5: return "✅ EXCELLENT"
+    if avg >= 4.0: return "⚠️ GOOD"
+    return "❌ POOR"
+
+def _print_breakdown(title, table, by):
+    """One row per value of `by`, one column per metric."""
+    grid = table.pivot(index=by, columns="metric", values="mean").reindex(columns=METRICS)
+    print(f"\n{title}")
+    print("-" * 60)
+    print(f"{by.ljust(24)} " + " ".join(m[:11].rjust(11) for m in METRICS))
+    for name, row in grid.iterrows():
+        print(f"{str(name).ljust(24)} " + " ".join(f"{v:>11.3f}" for v in row))
+
+def print_report(df):
+    """Global averages, per-config / per-file breakdowns and the worst items of a score table."""
+    import results_table
+    global_count = results_table.item_count(df) if len(df) else 0
 
     # --- FINAL GLOBAL REPORT ---
     print("\n\n")
@@ -152,35 +326,348 @@ def run_test_suite():
     print("📊 FINAL GLOBAL AVERAGE SCORES")
     print("="*60)
     print(f"Total Emails Processed: {global_count}")
-    print(f"Total Scenarios Evaluated: {global_count * 5} metrics")
+    print(f"Total Scenarios Evaluated: {len(df)} metrics")
+    missing = int(df["score"].isna().sum())
+    if missing:
+        # API errors and replies without a score are left out of every average
+        print(f"Missing Scores (excluded): {missing}")
     print("-" * 60)
 
     if global_count > 0:
+        by_metric = results_table.aggregate(df, ("metric",)).set_index("metric")
         for m in METRICS:
-            avg = global_metrics_sum[m] / global_count
-            
-            # Grade Visualizer
-            if avg >= 4.8: grade = "🌟 PERFECT"
-            elif avg >= 4.5: grade = "✅ EXCELLENT"
-            elif avg >= 4.0: grade = "⚠️ GOOD"
-            else: grade = "❌ POOR"
-            
-            print(f"{m.ljust(20)}: {avg:.4f} / 5.00  [{grade}]")
+            if m not in by_metric.index:
+                continue
+            r = by_metric.loc[m]
+            print(f"{m.ljust(20)}: {r['mean']:.4f} / 5.00  [{_grade(r['mean'])}]  "
+                  f"p05 {r['p05']:.2f}  std {r['std']:.2f}  fail {r['failure_rate']:.1%}")
     else:
         print("No data processed.")
 
     print("="*60)
-    
+    if global_count == 0:
+        return
+
+    _print_breakdown("🎛️  MEAN SCORE BY CONFIG", results_table.aggregate(df, ("config", "metric")), "config")
+    _print_breakdown("📁 MEAN SCORE BY FILE", results_table.aggregate(df, ("file", "metric")), "file")
+
+    by_config = results_table.aggregate(df, ("config",))
+    print(f"\nFailure rate (score < {results_table.FAILURE_THRESHOLD}) by config: "
+          + ", ".join(f"{r.config} {r.failure_rate:.1%}" for r in by_config.itertuples()))
+
     # Worst Case Summary
-    print(f"\n🚩 EDGE CASES FOUND: {len(all_worst_cases)}")
-    if all_worst_cases:
+    worst, worst_case_count = results_table.worst_items(df, n=3)
+    print(f"\n🚩 EDGE CASES FOUND: {worst_case_count}")
+    if worst:
         print("Top 3 Failures for Review:")
-        for i, case in enumerate(all_worst_cases[:3], 1):
+        for i, case in enumerate(worst, 1):
             print(f"{i}. {case['config']} | {case['file']} (ID {case['id']})")
-            print(f"   Failed: {case['failures']} -> Score: {case['scores'][case['failures'][0]]}")
+            print(f"   Failed: {case['failures']} -> Lowest Score: {case['lowest']}")
             print("-" * 40)
 
+def print_hedging(name, bot):
+    """Hedge rate and the tail latency of calls as waited for vs. without their hedges."""
+    hedge = bot.hedge.stats()
+    if not hedge["percentile"] and not hedge["hedged"]:
+        return
+    delay = f"{hedge['delay_s']:.2f}s" if hedge["delay_s"] is not None else "not yet learned"
+    print(f"{name} Hedging ({bot.model}): {hedge['hedged']}/{hedge['calls']} calls hedged "
+          f"({hedge['hedge_rate']:.1%}, {hedge['hedge_wins']} won by the hedge) after p{hedge['percentile']:g} = {delay}; "
+          f"p95 {hedge['unhedged_p95_s']:.2f}s -> {hedge['p95_s']:.2f}s, "
+          f"p99 {hedge['unhedged_p99_s']:.2f}s -> {hedge['p99_s']:.2f}s")
+
+def print_moved_scores(previous, store, show=10):
+    """What changed relative to the previous run's records, per config/metric and per item."""
+    import results_table
+    old = results_table.scores_frame(previous.values())
+    new = results_table.scores_frame(store)
+    items = results_table.diff_items(old, new)
+    items = items[items["delta"].abs() >= MOVE_THRESHOLD]
+    print(f"\n🔀 SCORES THAT MOVED: {len(items)} of {len(new)} score rows")
+    if items.empty:
+        return
+    groups = results_table.diff_runs(old, new, ("config", "metric"))
+    # NaN deltas (a group only one run scored) compare False and are left out too
+    groups = groups[groups["mean_delta"].abs() >= MOVE_THRESHOLD].head(show)
+    print("-" * 60)
+    print(f"{'config'.ljust(24)} {'metric'.ljust(18)} {'old':>6} {'new':>6} {'delta':>7}")
+    for r in groups.itertuples():
+        print(f"{str(r.config).ljust(24)} {str(r.metric).ljust(18)} {r.mean_old:>6.2f} {r.mean_new:>6.2f} {r.mean_delta:>+7.2f}")
+    print("Biggest per-item moves:")
+    for r in items.head(show // 2).itertuples():
+        print(f"   {r.config} | {r.file} (ID {r.id}) {r.metric}: {r.score_old:.2f} -> {r.score_new:.2f}")
+
+def print_budget(units):
+    """Pre-flight token estimate for the run.
+
+    Incremental units count only what they will send: no rewrite when the
+    previous one is kept, and only the metrics that are not. Judge prompts
+    use the original as a stand-in for rewrites that do not exist yet.
+    """
+    gen = {"requests": 0, "prompt_tokens": 0, "completion_tokens": 0}
+    judge = dict(gen)
+    chunked = 0
+    for unit in units:
+        original = _unit_entry(unit).get("content", "")
+        if not original:
+            continue
+        rewritten = unit.get("rewritten")
+        if rewritten is None:
+            config = unit["config"]
+            estimate = generator_bot.estimate_generate(config["action"], original, config["tone"])
+            chunked += estimate["requests"] > 1
+            for k, v in estimate.items():
+                gen[k] += v
+        stale = [m for m in METRICS if m not in unit.get("kept", {})]
+        if stale:
+            for k, v in judge_bot.estimate_evaluate_all(stale, original, rewritten or original).items():
+                judge[k] += v
+
+    print("\n📐 Estimated Token Budget")
+    for name, budget in (("Rewrites", gen), ("Judging", judge)):
+        print(f"   {name:<9} {budget['requests']:>6} requests  ~{budget['prompt_tokens']:,} prompt + "
+              f"~{budget['completion_tokens']:,} completion tokens")
+    if chunked:
+        print(f"   ✂️  {chunked} emails over {generator_bot.chunk_tokens} tokens are rewritten in paragraph chunks")
+
+def print_pipeline(stats, wall):
+    """Per-stage utilization, for sizing --gen-concurrency and --judge-concurrency."""
+    rows = [st.row(wall) for st in stats]
+    print("\n🔀 PIPELINE STAGES")
+    print("-" * 60)
+    print(f"{'stage'.ljust(10)} {'workers':>7} {'items':>7} {'errors':>6} {'busy':>7} {'starved':>8} {'blocked':>8}")
+    for r in rows:
+        print(f"{r['stage'].ljust(10)} {r['workers']:>7} {r['items']:>7} {r['errors']:>6} "
+              f"{r['busy']:>7.0%} {r['starved']:>8.0%} {r['blocked']:>8.0%}")
+    print("-" * 60)
+    if rows and wall > 0:
+        # The busiest stage limits throughput; the others wait on it (starved or blocked)
+        bottleneck = max(rows, key=lambda r: r["busy"])
+        flag = {"rewrite": "--gen-concurrency", "judge": "--judge-concurrency"}.get(bottleneck["stage"])
+        print(f"Bottleneck: {bottleneck['stage']} stage ({bottleneck['busy']:.0%} busy)"
+              + (f"; raise {flag} if that deployment has quota left." if flag else ""))
+
+def print_telemetry(aggregator):
+    """Prints the per-call breakdown by action and metric collected during the run."""
+    rows = aggregator.summary(group_by=("action", "key"))
+    if not rows:
+        return
+    print("\n⏱️  API CALL BREAKDOWN")
+    print("-" * 92)
+    print(f"{'action'.ljust(14)} {'key'.ljust(22)} {'calls':>6} {'cached':>6} {'retries':>7} "
+          f"{'p50 s':>7} {'p95 s':>7} {'p99 s':>7} {'tokens':>10}")
+    for r in rows:
+        tokens = r["prompt_tokens"] + r["completion_tokens"]
+        print(f"{str(r['action']).ljust(14)} {str(r['key']).ljust(22)} {r['calls']:>6} {r['cache_hits']:>6} "
+              f"{r['retries']:>7} {r['p50_s']:>7.2f} {r['p95_s']:>7.2f} {r['p99_s']:>7.2f} {tokens:>10}")
+    print("-" * 92)
+    for r in aggregator.summary(group_by=("deployment",)):
+        print(f"Tokens on {r['deployment']}: {r['prompt_tokens']} prompt + {r['completion_tokens']} completion "
+              f"= {r['prompt_tokens'] + r['completion_tokens']} ({r['errors']} failed calls)")
+
+def run_test_suite(use_async=False, results_path=DEFAULT_RESULTS_PATH, resume=False,
+                   gen_concurrency=8, judge_concurrency=16, telemetry_path=None,
+                   batch_client=None, batch_poll=60.0, incremental=False):
+    # pandas is only needed for the report, so --help and dry runs never load it
+    import results_table
+    init_bots()
+    print("🚀 Starting GLOBAL Batch Evaluation (Aggregated)")
+    print(f"Metrics: {METRICS}")
+    print(f"Files: {FILES_TO_TEST}")
+    if batch_client is not None:
+        print(f"Mode: provider Batch API ({type(batch_client).__name__})")
+    elif use_async:
+        print("Mode: asyncio (shared in-flight limit)")
+    print(f"Concurrency: {gen_concurrency} generation / {judge_concurrency} judge requests")
+    print(f"Results: {results_path}{' (resuming)' if resume else ' (incremental)' if incremental else ''}")
+    print("--------------------------------------------------")
+
+    # Read before the store truncates the file for the new run
+    previous = {}
+    if incremental and os.path.exists(results_path):
+        previous = {unit_key(r["config"], r["file"], r["id"]): r for r in read_results(results_path)}
+
+    store = ResultsStore(results_path, resume=resume)
+    done_keys = store.completed_keys() if resume else set()
+    if done_keys:
+        print(f"⏩ Skipping {len(done_keys)} work units already in the results store")
+
+    errored = 0
+    dropped = 0
+
+    def record(res, unit):
+        nonlocal errored
+        # Failed API calls are not stored, so --resume retries them
+        if _has_api_error(res):
+            errored += 1
+            return
+        store.append({
+            "config": unit["label"],
+            "file": unit["file"],
+            "id": res["id"],
+            "rewritten": res["rewritten"],
+            "scores": res["scores"],
+            "explanations": res["explanations"],
+            # Lets the next --incremental run tell which parts of this result are still valid
+            "fingerprints": unit["fingerprints"],
+        })
+
+    def drop(failure):
+        nonlocal dropped
+        dropped += 1
+
+    # Generator and judge deployments have separate rate limits, so separate budgets
+    generator_bot.set_concurrency(gen_concurrency)
+    judge_bot.set_concurrency(judge_concurrency)
+
+    # Freeze prompts.yaml for the run: an edit mid-batch must not mix prompt versions
+    live_prompts = (generator_bot.prompts, judge_bot.prompts)
+    generator_bot.prompts = generator_bot.prompts.snapshot()
+    judge_bot.prompts = judge_bot.prompts.snapshot()
+
+    units = list(iter_work_units(build_configurations(), done_keys))
+    tag_fingerprints(units)
+    if incremental:
+        reused, units = plan_incremental(units, previous)
+        for rec in reused:
+            store.append(rec)
+    print_budget(units)
+    run_start = time.time()
+
+    aggregator = telemetry.add_sink(telemetry.MemoryAggregator())
+    jsonl_sink = telemetry.add_sink(telemetry.JsonlSink(telemetry_path)) if telemetry_path else None
+
+    try:
+        if batch_client is not None:
+            # Input files and submitted batch ids live next to the results store
+            workdir = os.path.join(os.path.dirname(results_path) or ".", "batch_api")
+            _run_batch_api(units, record, batch_client, workdir, batch_poll)
+            stage_stats = None
+        else:
+            # One worker per in-flight request each deployment's budget allows
+            stage_stats = _run_pipeline(units, record, drop, use_async, gen_concurrency, judge_concurrency)
+
+        elapsed = time.time() - run_start
+        if units:
+            print(f"\n⏱️  {len(units)} items in {elapsed:.1f}s ({len(units) / max(elapsed, 1e-9):.2f} items/sec)")
+            if stage_stats:
+                print_pipeline(stage_stats, elapsed)
+
+        if errored:
+            print(f"\n⚠️ {errored} items hit API errors and were not stored; rerun with --resume to retry them.")
+        if dropped:
+            print(f"\n⚠️ {dropped} items were dropped after an unexpected error in a pipeline stage and were "
+                  f"not stored; rerun with --resume to retry them.")
+        # Columnar copy of the whole store: the report and later run-to-run diffs read it
+        scores = results_table.scores_frame(store)
+        print_report(scores)
+        if previous:
+            print_moved_scores(previous, store)
+        if len(scores):
+            parquet = results_table.write_parquet(scores, results_table.parquet_path(results_path))
+            print(f"\n💾 {len(scores)} score rows saved to {parquet} (diff runs with results_table.py diff)")
+        print_telemetry(aggregator)
+    finally:
+        store.close()
+        generator_bot.prompts, judge_bot.prompts = live_prompts
+        telemetry.remove_sink(aggregator)
+        if jsonl_sink:
+            telemetry.remove_sink(jsonl_sink)
+            jsonl_sink.close()
+
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the global batch evaluation.")
+    parser.add_argument("--async", dest="use_async", action="store_true",
+                        help="Drive every request from one event loop instead of nested thread pools.")
+    parser.add_argument("--max-inflight", type=int, default=None,
+                        help="Cap on concurrent API requests for --async (default: MAX_INFLIGHT_REQUESTS or 64).")
+    parser.add_argument("--judge-mode", choices=["per_metric", "combined"], default="per_metric",
+                        help="'combined' scores all metrics in one judge call, falling back per metric on parse failures.")
+    parser.add_argument("--judge-format", choices=["text", "json"], default="text",
+                        help="'json' asks per-metric judges for a {\"score\", \"reason\"} object instead of \"Score: X.XX\" text.")
+    parser.add_argument("--judge-reasks", type=int, default=None,
+                        help="Times a judge reply without a usable score is asked again (default: JUDGE_REASKS or 1).")
+    parser.add_argument("--gen-concurrency", type=int, default=8,
+                        help="Max in-flight requests to the generator deployment.")
+    parser.add_argument("--judge-concurrency", type=int, default=16,
+                        help="Max in-flight requests to the judge deployment.")
+    parser.add_argument("--gen-rpm", type=int, default=None, help="Generator requests/min quota (default: learned from response headers).")
+    parser.add_argument("--gen-tpm", type=int, default=None, help="Generator tokens/min quota.")
+    parser.add_argument("--judge-rpm", type=int, default=None, help="Judge requests/min quota.")
+    parser.add_argument("--judge-tpm", type=int, default=None, help="Judge tokens/min quota.")
+    parser.add_argument("--timeout", type=float, default=None,
+                        help="Seconds a request may take before it fails and is retried (default: API_TIMEOUT_SECONDS or 60).")
+    parser.add_argument("--hedge-percentile", type=float, default=None,
+                        help="Send a second copy of a request once it outlasts this percentile of recent latencies, "
+                             "e.g. 90 (default: HEDGE_PERCENTILE or 0, off).")
+    parser.add_argument("--hedge-max-rate", type=float, default=None,
+                        help="Largest fraction of calls that may be hedged (default: HEDGE_MAX_RATE or 0.1).")
+    parser.add_argument("--results", default=DEFAULT_RESULTS_PATH,
+                        help=f"JSONL file each item's result is appended to (default: {DEFAULT_RESULTS_PATH}).")
+    rerun = parser.add_mutually_exclusive_group()
+    rerun.add_argument("--resume", action="store_true",
+                       help="Keep existing results and skip work units that already have one.")
+    rerun.add_argument("--incremental", action="store_true",
+                       help="Reuse results whose prompt, deployment and input fingerprints are unchanged; "
+                            "re-judge or recompute the rest and report which scores moved.")
+    parser.add_argument("--telemetry", default=None,
+                        help="Also write one JSONL record per API call (latency, tokens, retries, cache hit) to this file.")
+    parser.add_argument("--batch-api", choices=["azure", "local"], default=None,
+                        help="Submit rewrites, then judgements, as provider batch jobs instead of real-time calls "
+                             "('local' is an offline file-based stand-in).")
+    parser.add_argument("--batch-poll", type=float, default=60.0,
+                        help="Seconds between batch status checks (default: 60).")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="Bypass the on-disk response cache and call the API for every request.")
+    cli_args = parser.parse_args()
+    init_bots()
+    if cli_args.max_inflight:
+        set_max_inflight(cli_args.max_inflight)
+    judge_bot.judge_mode = cli_args.judge_mode
+    judge_bot.judge_format = cli_args.judge_format
+    if cli_args.judge_reasks is not None:
+        judge_bot.max_reasks = cli_args.judge_reasks
+    generator_bot.rate_limiter.configure(rpm=cli_args.gen_rpm, tpm=cli_args.gen_tpm)
+    judge_bot.rate_limiter.configure(rpm=cli_args.judge_rpm, tpm=cli_args.judge_tpm)
+    for bot in (generator_bot, judge_bot):
+        if cli_args.timeout is not None:
+            bot.timeout = cli_args.timeout
+        if cli_args.hedge_percentile is not None or cli_args.hedge_max_rate is not None:
+            bot.set_hedging(cli_args.hedge_percentile if cli_args.hedge_percentile is not None else bot.hedge.percentile,
+                            cli_args.hedge_max_rate)
+    if cli_args.no_cache:
+        generator_bot.cache = judge_bot.cache = None
+
+    batch_client = None
+    if cli_args.batch_api == "azure":
+        batch_client = AzureBatchClient()
+    elif cli_args.batch_api == "local":
+        batch_client = LocalBatchClient(os.path.join(os.path.dirname(cli_args.results) or ".", "batch_api", "local"))
+
     start_time = time.time()
-    run_test_suite()
-    print(f"\nTotal Runtime: {time.time() - start_time:.2f} seconds")
\ No newline at end of file
+    run_test_suite(
+        use_async=cli_args.use_async,
+        results_path=cli_args.results,
+        resume=cli_args.resume,
+        gen_concurrency=cli_args.gen_concurrency,
+        judge_concurrency=cli_args.judge_concurrency,
+        telemetry_path=cli_args.telemetry,
+        batch_client=batch_client,
+        batch_poll=cli_args.batch_poll,
+        incremental=cli_args.incremental,
+    )
+    print(f"\nTotal Runtime: {time.time() - start_time:.2f} seconds")
+    for name, bot in (("Generator", generator_bot), ("Judge", judge_bot)):
+        limits = bot.rate_limiter.stats()
+        print(f"{name} Rate Limiter ({bot.model}): {limits['successes']} ok, {limits['throttles']} throttled, "
+              f"final window {limits['window']}")
+    for name, bot in (("Generator", generator_bot), ("Judge", judge_bot)):
+        print_hedging(name, bot)
+    for pool in connection_stats():
+        print(f"HTTP Pool {pool['endpoint']} ({pool['api_version']}): {pool['requests']} requests over "
+              f"{pool['new_connections']} connections ({pool['reuse_rate']:.1%} reused, "
+              f"{pool['tls_handshakes']} TLS handshakes, pool size {pool['pool_size']})")
+    if generator_bot.cache is not None:
+        stats = generator_bot.cache.stats()
+        print(f"Response Cache: {stats['hits']} hits / {stats['misses']} misses "
+              f"({stats['hit_rate']:.0%}), {stats['entries']} entries, {stats['bytes'] / 1e6:.1f} MB")
\ No newline at end of file
@@ -0,0 +1,170 @@
+"""Tail latency of judging with and without hedged requests and per-call timeouts.
+
+Run from the repository root:
+
+    python -m benchmarks.hedging
+    python -m benchmarks.hedging --async --calls 400 --slow-rate 0.03 --percentile 95
+
+The workload is the app's "Judge Email": evaluate_all over the five metrics,
+so the slowest of five requests decides how long a judgement takes. It runs
+against mock_server.py (in its own process) with slow-response injection:
+most replies take about --latency-ms, and a --slow-rate fraction take
+--slow-ms instead. A second mock, whose slow replies take --stuck-ms, stands
+in for stalled requests and shows what the per-call timeout buys.
+
+Every scenario runs on a fresh deployment name, so its hedge policy starts
+cold and has to learn the latency percentile from its own first requests.
+Reported per judgement: p50/p95/p99/max latency and how many scores came
+back empty. Reported per request: the share that was hedged and the
+requests the server saw, which includes hedges and retries.
+
+The mock is one Python process, and the workload is closed-loop: a scenario
+that stops waiting on stalls sends its next requests sooner and loads the
+mock harder, so its median can rise a little. Compare the tails.
+"""
+import os
+import time
+import asyncio
+import argparse
+import statistics
+import concurrent.futures
+
+from telemetry import percentile
+from benchmarks.throughput import MockServerProcess
+
+METRICS = ["faithfulness", "completeness", "robustness", "url_preservation", "edge_case_scan"]
+
+
+def _pairs(calls, name):
+    return [
+        (f"Hi team, the {name} review moves to Thursday {i}. Agenda: https://example.com/{i}",
+         f"The {name} review is now on Thursday {i}. Agenda: https://example.com/{i}")
+        for i in range(calls)
+    ]
+
+
+def run_scenario(name, server, calls, workers, use_async, hedge_percentile, timeout):
+    """Judges `calls` rewrites with `workers` in flight; returns the scenario's row."""
+    from generate import GenerateEmail
+
+    bot = GenerateEmail(f"bench-{name}")
+    bot.timeout = timeout
+    bot.set_hedging(hedge_percentile)
+    pairs = _pairs(calls, name)
+
+    def judge(pair):
+        start = time.perf_counter()
+        results = bot.evaluate_all(METRICS, *pair)
+        return time.perf_counter() - start, sum(j["score"] is None for j in results.values())
+
+    async def ajudge(pair, slots):
+        async with slots:
+            start = time.perf_counter()
+            results = await bot.aevaluate_all(METRICS, *pair)
+            return time.perf_counter() - start, sum(j["score"] is None for j in results.values())
+
+    async def amain():
+        slots = asyncio.Semaphore(workers)
+        return await asyncio.gather(*(ajudge(p, slots) for p in pairs))
+
+    before = server.stats()
+    start = time.perf_counter()
+    if use_async:
+        outcomes = asyncio.run(amain())
+    else:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+            outcomes = list(executor.map(judge, pairs))
+    elapsed = time.perf_counter() - start
+    after = server.stats()
+
+    latencies = [seconds for seconds, _ in outcomes]
+    hedge = bot.hedge.stats()
+    return {
+        "scenario": name,
+        "seconds": round(elapsed, 2),
+        "requests": after["requests"] - before["requests"],
+        "slowed": after["slowed"] - before["slowed"],
+        "hedge_rate": hedge["hedge_rate"],
+        "hedge_wins": hedge["hedge_wins"],
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "max_ms": max(latencies) * 1000,
+        "missing_scores": sum(missing for _, missing in outcomes),
+    }
+
+
+def print_rows(rows):
+    header = (f"{'scenario'.ljust(24)} {'secs':>6} {'reqs':>6} {'slow':>5} {'hedged':>7} {'won':>4} "
+              f"{'p50ms':>8} {'p95ms':>8} {'p99ms':>8} {'maxms':>8} {'no score':>8}")
+    print(header)
+    print("-" * len(header))
+    for r in rows:
+        print(f"{r['scenario'].ljust(24)} {r['seconds']:>6.1f} {r['requests']:>6} {r['slowed']:>5} "
+              f"{r['hedge_rate']:>7.1%} {r['hedge_wins']:>4} {r['p50_ms']:>8.0f} {r['p95_ms']:>8.0f} "
+              f"{r['p99_ms']:>8.0f} {r['max_ms']:>8.0f} {r['missing_scores']:>8}")
+
+
+def _improvement(rows, before, after):
+    old, new = rows[before], rows[after]
+    extra = new["requests"] / old["requests"] - 1 if old["requests"] else 0.0
+    print(f"{new['scenario']} vs {old['scenario']}: p95 {old['p95_ms']:.0f} -> {new['p95_ms']:.0f} ms, "
+          f"p99 {old['p99_ms']:.0f} -> {new['p99_ms']:.0f} ms, for {extra:+.1%} requests")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare judge tail latency with and without hedging and timeouts.")
+    parser.add_argument("--calls", type=int, default=200, help="Rewrites judged per scenario (five requests each).")
+    parser.add_argument("--workers", type=int, default=8, help="Judgements in flight.")
+    parser.add_argument("--async", dest="use_async", action="store_true", help="Use aevaluate_all on one event loop.")
+    parser.add_argument("--latency-ms", type=float, default=50.0, help="Median mock latency.")
+    parser.add_argument("--latency-sigma", type=float, default=0.3)
+    parser.add_argument("--slow-rate", type=float, default=0.02, help="Fraction of mock replies that are slow.")
+    parser.add_argument("--slow-ms", type=float, default=2000.0, help="Latency of slow replies on the tail mock.")
+    parser.add_argument("--stuck-ms", type=float, default=15000.0, help="Latency of slow replies on the stalled mock.")
+    parser.add_argument("--percentile", type=float, default=95.0, help="Hedge after this latency percentile.")
+    parser.add_argument("--timeout", type=float, default=1.0, help="Per-request timeout for the timeout scenarios.")
+    parser.add_argument("--seed", type=int, default=7)
+    cli_args = parser.parse_args()
+
+    os.environ["AZURE_OPENAI_API_KEY"] = "mock"
+    os.environ["RESPONSE_CACHE"] = "0"
+    common = (cli_args.calls, cli_args.workers, cli_args.use_async)
+    mode = "async" if cli_args.use_async else "threads"
+    pct = f"p{cli_args.percentile:g}"
+
+    rows = []
+    for slow_ms, scenarios in (
+        (cli_args.slow_ms, [
+            ("tail", 0, 60.0),
+            (f"tail-hedge-{pct}", cli_args.percentile, 60.0),
+        ]),
+        (cli_args.stuck_ms, [
+            ("stuck", 0, 60.0),
+            (f"stuck-timeout-{cli_args.timeout:g}s", 0, cli_args.timeout),
+            (f"stuck-timeout-hedge-{pct}", cli_args.percentile, cli_args.timeout),
+        ]),
+    ):
+        server = MockServerProcess(
+            cli_args.latency_ms, cli_args.latency_sigma, 0.0, cli_args.seed,
+            extra_args=("--slow-rate", str(cli_args.slow_rate), "--slow-ms", str(slow_ms)),
+        )
+        # Every scenario on this server builds its bot after this, so its clients point here
+        os.environ["AZURE_OPENAI_ENDPOINT"] = server.url
+        try:
+            # Opens the shared connection pool, so the first scenario does not pay for it
+            run_scenario("warmup", server, cli_args.workers * 2, *common[1:], 0, 60.0)
+            for name, hedge_percentile, timeout in scenarios:
+                rows.append(run_scenario(f"{name}[{mode}]", server, *common, hedge_percentile, timeout))
+        finally:
+            server.stop()
+
+    print_rows(rows)
+    print()
+    _improvement(rows, 0, 1)
+    _improvement(rows, 2, 3)
+    _improvement(rows, 2, 4)
+
+
+if __name__ == "__main__":
+    main()
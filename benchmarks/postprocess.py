@@ -0,0 +1,155 @@
+"""Speed and output-stability check for postprocess.clean_body.
+
+Run from the repository root:
+
+    python -m benchmarks.postprocess             # check the corpus, then time it
+    python -m benchmarks.postprocess --update    # accept the current output as the new corpus
+
+The regression corpus (benchmarks/corpus/postprocess.jsonl) is built from
+every email in datasets/*.jsonl, dressed up the way model replies come back:
+as-is, wrapped in subject/salutation/sign-off/placeholder scaffolding, and
+with its URLs turned into markdown links and bracketed placeholders. Inputs
+are frozen in the corpus, so regenerating the datasets does not move it.
+Each entry records the cleaned output for one action; any difference fails
+the check. The timing compares clean_body against the original inline
+implementation on the same inputs.
+"""
+import os
+import re
+import sys
+import glob
+import json
+import time
+import argparse
+
+from postprocess import clean_body, ACTION_RULES
+
+CORPUS_PATH = os.path.join("benchmarks", "corpus", "postprocess.jsonl")
+DATASET_GLOB = os.path.join("datasets", "*.jsonl")
+_URL = re.compile(r"https?://[^\s)\]]+[^\s)\].,!?]")
+
+
+def legacy_clean_body(text):
+    """The pre-postprocess GenerateEmail._clean_body, kept verbatim as the timing baseline."""
+    text = re.sub(r"\[.*?\]", "", text)
+    banned_starts = (
+        "subject:", "dear", "to:", "from:", "hi ", "hello ", "greetings",
+        "regards", "best regards", "sincerely", "best,", "cheers",
+        "thank you", "thanks,", "yours truly", "warm regards"
+    )
+    lines = text.splitlines()
+    cleaned = []
+    for line in lines:
+        s_line = line.strip().lower()
+        if not s_line: continue
+        if len(s_line.split()) < 10 and s_line.startswith(banned_starts): continue
+        if len(s_line.split()) < 4 and not s_line.endswith(('.', '!', '?')): continue
+        cleaned.append(line)
+    result = "\n".join(cleaned).strip()
+    return result if result else text
+
+
+def _variants(record):
+    content = record["content"]
+    subject = record.get("subject") or "Update"
+    yield "plain", content
+    yield "email", f"Subject: {subject}\n\nDear team,\n\n{content}\n\nBest regards,\n[Your Name]\n[Your Title]"
+    urls = _URL.findall(content)
+    linked = content
+    for n, url in enumerate(urls, 1):
+        linked = linked.replace(url, f"[link {n}]({url})", 1)
+    # A bare URL line and a bracketed URL, as models like to append them
+    tail = f"\n{urls[0]}\nMore at [{urls[0]}]" if urls else "\nSee [Insert link here] and [the report](https://example.com/report)."
+    yield "links", f"Hi team,\n{linked}{tail}\nThanks,\nAlex"
+
+
+def build_inputs():
+    """(key, text) pairs for every dataset email and variant."""
+    actions = sorted(ACTION_RULES)
+    n = 0
+    for path in sorted(glob.glob(DATASET_GLOB)):
+        with open(path, "r", encoding="utf-8") as f:
+            for line_no, line in enumerate(f, 1):
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if not isinstance(record, dict) or not record.get("content"):
+                    continue
+                for variant, text in _variants(record):
+                    # Actions rotate so every rule set is covered without repeating each input
+                    yield {
+                        "key": f"{os.path.basename(path)}:{line_no}:{variant}",
+                        "action": actions[n % len(actions)],
+                        "input": text,
+                    }
+                    n += 1
+
+
+def load_corpus(path=CORPUS_PATH):
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def update_corpus(path=CORPUS_PATH):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    count = 0
+    with open(path, "w", encoding="utf-8") as f:
+        for entry in build_inputs():
+            entry["expected"] = clean_body(entry["input"], entry["action"])
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            count += 1
+    print(f"Wrote {count} cases to {path}")
+
+
+def check_corpus(corpus, show=5):
+    failures = [e for e in corpus if clean_body(e["input"], e["action"]) != e["expected"]]
+    print(f"Regression corpus: {len(corpus) - len(failures)}/{len(corpus)} outputs unchanged")
+    for e in failures[:show]:
+        print(f"  ✗ {e['key']} ({e['action']})")
+        print(f"    expected: {e['expected'][:160]!r}")
+        print(f"    got:      {clean_body(e['input'], e['action'])[:160]!r}")
+    return not failures
+
+
+def _time_per_call(func, inputs, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for args in inputs:
+            func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best / len(inputs)
+
+
+def time_corpus(corpus, repeat):
+    legacy = _time_per_call(legacy_clean_body, [(e["input"],) for e in corpus], repeat)
+    current = _time_per_call(clean_body, [(e["input"], e["action"]) for e in corpus], repeat)
+    print(f"legacy _clean_body : {legacy * 1e6:7.2f} µs/call")
+    print(f"clean_body         : {current * 1e6:7.2f} µs/call ({legacy / current:.2f}x)")
+    # What keep_urls changed relative to the old behaviour
+    kept = sum(legacy_clean_body(e["input"]) != e["expected"] for e in corpus)
+    print(f"Outputs that differ from the legacy cleaner: {kept}/{len(corpus)} (link-preserving rules)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark and regression-check the rewrite post-processor.")
+    parser.add_argument("--update", action="store_true", help="Rebuild the corpus from datasets/ with the current output.")
+    parser.add_argument("--repeat", type=int, default=20, help="Timing passes over the corpus (best is reported).")
+    cli_args = parser.parse_args()
+
+    if cli_args.update:
+        update_corpus()
+        return
+    if not os.path.exists(CORPUS_PATH):
+        sys.exit(f"No corpus at {CORPUS_PATH}; create it with --update")
+
+    corpus = load_corpus()
+    stable = check_corpus(corpus)
+    time_corpus(corpus, cli_args.repeat)
+    if not stable:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""Cold-start and per-interaction overhead of the entry points.
+
+Run from the repository root:
+
+    python -m benchmarks.startup                 # import times, then Streamlit app runs
+    python -m benchmarks.startup --repeat 10 --modules generate batch_runner
+
+Import cost is measured in fresh interpreters with `python -X importtime`, so
+nothing is in sys.modules yet: the time `import <module>` takes, and the
+direct imports that account for most of it. The app is driven by Streamlit's
+AppTest in a fresh process: the first script run (cold start), plain reruns,
+and reruns triggered by an interaction (picking another email, toggling a
+sidebar option). Every click in the app pays the rerun cost before any API
+call, so it should stay in the low milliseconds.
+
+No requests are sent; AZURE_OPENAI_ENDPOINT defaults to an unused local port.
+"""
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+DEFAULT_MODULES = ["generate", "batch_runner", "judge_compare", "results_table"]
+
+# Runs in a fresh interpreter; prints one JSON object with the timings in seconds
+_APP_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+imported = time.perf_counter() - start
+
+at = AppTest.from_file("app.py", default_timeout=120)
+start = time.perf_counter()
+at.run()
+first = time.perf_counter() - start
+if at.exception:
+    sys.exit(f"app.py raised: {at.exception[0].message}")
+
+def timed(action):
+    start = time.perf_counter()
+    action()
+    return time.perf_counter() - start
+
+repeat = int(sys.argv[1])
+reruns = [timed(at.run) for _ in range(repeat)]
+
+# Widgets are looked up on the latest element tree before every interaction
+options = list(at.sidebar.selectbox[-1].options)
+pick = [timed(lambda i=i: at.sidebar.selectbox[-1].select(options[i % len(options)]).run()) for i in range(1, repeat + 1)]
+toggle = [timed(lambda i=i: at.sidebar.checkbox[0].set_value(i % 2 == 1).run()) for i in range(repeat)]
+print(json.dumps({"apptest_import": imported, "first_run": first, "rerun": reruns, "pick_email": pick, "toggle_option": toggle}))
+"""
+
+
+def _env():
+    env = dict(os.environ)
+    env.setdefault("AZURE_OPENAI_ENDPOINT", "http://127.0.0.1:9")
+    env.setdefault("AZURE_OPENAI_API_KEY", "benchmark")
+    return env
+
+
+def import_profile(module):
+    """(total seconds, [(child module, seconds)]) for importing module in a fresh interpreter."""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True, env=_env(),
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{proc.stderr[-2000:]}")
+
+    # Imports are logged as they finish, so a module's children come right before it
+    total, children, pending = None, [], []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        if not cumulative.strip().isdigit():
+            continue  # the header line
+        seconds = int(cumulative) / 1e6
+        depth = (len(name) - len(name.lstrip(" ")) - 1) // 2
+        if depth == 1:
+            pending.append((name.strip(), seconds))
+        elif depth == 0:
+            if name.strip() == module:
+                total, children = seconds, pending
+            pending = []
+    return total, sorted(children, key=lambda c: c[1], reverse=True)
+
+
+def time_imports(modules, repeat, show=5):
+    print(f"{'module':<16} {'best ms':>8} {'median ms':>10}   heaviest direct imports")
+    print("-" * 100)
+    for module in modules:
+        runs = [import_profile(module) for _ in range(repeat)]
+        totals = [total for total, _ in runs]
+        _, children = min(runs, key=lambda r: r[0])
+        heavy = ", ".join(f"{name} {seconds * 1e3:.0f}" for name, seconds in children[:show])
+        print(f"{module:<16} {min(totals) * 1e3:>8.1f} {statistics.median(totals) * 1e3:>10.1f}   {heavy}")
+
+
+def time_app(repeat):
+    proc = subprocess.run(
+        [sys.executable, "-c", _APP_SCRIPT, str(repeat)],
+        capture_output=True, text=True, env=_env(),
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"app run failed:\n{proc.stderr[-2000:]}")
+    timings = json.loads(proc.stdout.strip().splitlines()[-1])
+
+    print(f"\n{'app.py (AppTest)':<24} {'median ms':>10} {'p95 ms':>8}")
+    print("-" * 44)
+    print(f"{'cold first run':<24} {timings['first_run'] * 1e3:>10.1f}")
+    for name in ("rerun", "pick_email", "toggle_option"):
+        samples = sorted(timings[name])
+        p95 = samples[min(len(samples) - 1, int(0.95 * len(samples)))]
+        print(f"{name:<24} {statistics.median(samples) * 1e3:>10.1f} {p95 * 1e3:>8.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure import time and Streamlit rerun latency.")
+    parser.add_argument("--modules", nargs="+", default=DEFAULT_MODULES, help="Modules to time `import` for.")
+    parser.add_argument("--repeat", type=int, default=5, help="Fresh interpreters per module / reruns per app scenario.")
+    parser.add_argument("--no-app", action="store_true", help="Skip the Streamlit app runs.")
+    cli_args = parser.parse_args()
+
+    time_imports(cli_args.modules, cli_args.repeat)
+    if not cli_args.no_app:
+        time_app(cli_args.repeat * 4)
+
+
+if __name__ == "__main__":
+    main()
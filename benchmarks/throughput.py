@@ -0,0 +1,293 @@
+"""End-to-end throughput benchmark against the local mock Azure OpenAI server.
+
+Run from the repository root:
+
+    python -m benchmarks.throughput                 # all scenarios, saved under benchmarks/results/
+    python -m benchmarks.throughput --compare OLD.json NEW.json
+
+Every scenario reports requests/sec, client-side p50/p95/p99 latency per API
+call (from the telemetry records), peak thread count, peak RSS and how many
+new HTTP connections it opened, so runs from different commits can be
+compared side by side.
+"""
+import os
+import io
+import sys
+import json
+import time
+import asyncio
+import argparse
+import tempfile
+import threading
+import contextlib
+import subprocess
+import urllib.request
+import concurrent.futures
+
+import telemetry
+from telemetry import percentile
+from http_clients import connection_stats
+
+RESULTS_DIR = os.path.join("benchmarks", "results")
+BENCH_DATASETS = ["mixed.jsonl", "challenge.jsonl", "adversarial.jsonl"]
+
+
+def _rss_bytes():
+    # Current RSS from /proc where available; ru_maxrss is a lifetime peak on other systems
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class ResourceSampler:
+    """Samples thread count and RSS on a background thread to find scenario peaks."""
+
+    def __init__(self, interval=0.02):
+        self.interval = interval
+        self.peak_threads = 0
+        self.peak_rss = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _sample(self):
+        self.peak_threads = max(self.peak_threads, threading.active_count())
+        self.peak_rss = max(self.peak_rss, _rss_bytes())
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._sample()
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self._sample()
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self._sample()
+
+
+class MockServerProcess:
+    """Runs mock_server.py in its own process so its threads and memory stay out of the numbers."""
+
+    def __init__(self, latency_ms, latency_sigma, error_rate, seed, extra_args=()):
+        self._proc = subprocess.Popen(
+            [sys.executable, "mock_server.py", "--port", "0",
+             "--latency-ms", str(latency_ms), "--latency-sigma", str(latency_sigma),
+             "--error-rate", str(error_rate), "--seed", str(seed), *extra_args],
+            stdout=subprocess.PIPE, text=True,
+        )
+        # First line: "Mock Azure OpenAI listening on http://host:port"
+        self.url = self._proc.stdout.readline().strip().rsplit(" ", 1)[-1]
+
+    def stats(self):
+        with urllib.request.urlopen(f"{self.url}/stats") as resp:
+            return json.load(resp)
+
+    def stop(self):
+        self._proc.terminate()
+        self._proc.wait()
+
+
+def _connections_opened():
+    return sum(p["new_connections"] for p in connection_stats())
+
+
+def run_scenario(name, server, func):
+    """Runs func() under the timer and sampler and returns its metrics row."""
+    aggregator = telemetry.add_sink(telemetry.MemoryAggregator())
+    before = server.stats()
+    connections_before = _connections_opened()
+    # The scenarios print reports and progress bars; keep the benchmark output readable
+    try:
+        with ResourceSampler() as sampler, \
+                contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+            start = time.perf_counter()
+            func()
+            elapsed = time.perf_counter() - start
+    finally:
+        telemetry.remove_sink(aggregator)
+    latencies = aggregator.latencies()
+
+    after = server.stats()
+    requests = after["requests"] - before["requests"]
+    return {
+        "scenario": name,
+        "seconds": round(elapsed, 3),
+        "requests": requests,
+        "throttled": after["throttled"] - before["throttled"],
+        "requests_per_sec": round(requests / elapsed, 2) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 1),
+        "peak_threads": sampler.peak_threads,
+        "peak_rss_mb": round(sampler.peak_rss / 1e6, 1),
+        # Warm pools open few connections however many requests they send
+        "new_connections": _connections_opened() - connections_before,
+    }
+
+
+# --- SCENARIOS ---
+def bench_generate_email(calls, workers):
+    from generate import GenerateEmail
+
+    bot = GenerateEmail(os.getenv("GENERATOR_DEPLOYMENT", "gpt-4o-mini"))
+    texts = [f"Benchmark email number {i}. Please confirm the meeting on Friday." for i in range(calls)]
+
+    def threaded():
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+            list(executor.map(lambda t: bot.generate("shorten", t), texts))
+
+    def async_path():
+        async def main():
+            await asyncio.gather(*(bot.agenerate("shorten", t) for t in texts))
+        asyncio.run(main())
+
+    return threaded, async_path
+
+
+def _bench_datasets(workdir, items_per_file):
+    """Copies the first few entries of each bundled file into a scratch datasets dir."""
+    dataset_dir = os.path.join(workdir, "datasets")
+    os.makedirs(dataset_dir, exist_ok=True)
+    for filename in BENCH_DATASETS:
+        with open(os.path.join("datasets", filename), "r", encoding="utf-8") as src, \
+                open(os.path.join(dataset_dir, filename), "w", encoding="utf-8") as dst:
+            for i, line in enumerate(src):
+                if i >= items_per_file:
+                    break
+                dst.write(line)
+    return dataset_dir
+
+
+def bench_test_suite(workdir, items_per_file):
+    import batch_runner
+
+    batch_runner.DATASET_DIR = _bench_datasets(workdir, items_per_file)
+    results_path = os.path.join(workdir, "results.jsonl")
+
+    def threaded():
+        batch_runner.run_test_suite(results_path=results_path)
+
+    def async_path():
+        batch_runner.run_test_suite(use_async=True, results_path=results_path)
+
+    return threaded, async_path
+
+
+def bench_generate_file(workdir, count):
+    import generate
+
+    generate.DATASET_DIR = workdir
+    bot = generate.GenerateEmail(os.getenv("GENERATOR_DEPLOYMENT", "gpt-4o-mini"))
+
+    def threaded():
+        generate.generate_file(bot, "mixed.jsonl", count)
+
+    def async_path():
+        generate.generate_file(bot, "mixed.jsonl", count, use_async=True)
+
+    return threaded, async_path
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def print_rows(rows):
+    header = (f"{'scenario'.ljust(26)} {'req/s':>8} {'p50ms':>8} {'p95ms':>8} {'p99ms':>8} {'threads':>8} "
+              f"{'rssMB':>7} {'429s':>5} {'conns':>6}")
+    print(header)
+    print("-" * len(header))
+    for r in rows:
+        print(f"{r['scenario'].ljust(26)} {r['requests_per_sec']:>8.1f} {r['p50_ms']:>8.1f} {r['p95_ms']:>8.1f} "
+              f"{r['p99_ms']:>8.1f} {r['peak_threads']:>8} {r['peak_rss_mb']:>7.1f} {r['throttled']:>5} "
+              f"{r.get('new_connections', '-'):>6}")
+
+
+def compare(old_path, new_path):
+    with open(old_path, encoding="utf-8") as f:
+        old = json.load(f)
+    with open(new_path, encoding="utf-8") as f:
+        new = json.load(f)
+    old_rows = {r["scenario"]: r for r in old["scenarios"]}
+
+    print(f"Comparing {old['revision']} -> {new['revision']}")
+    print(f"{'scenario'.ljust(26)} {'req/s':>18} {'p95ms':>18} {'threads':>10} {'rssMB':>14}")
+    for r in new["scenarios"]:
+        o = old_rows.get(r["scenario"])
+        if o is None:
+            continue
+        delta = (r["requests_per_sec"] / o["requests_per_sec"] - 1) if o["requests_per_sec"] else 0.0
+        print(f"{r['scenario'].ljust(26)} {o['requests_per_sec']:>7.1f}->{r['requests_per_sec']:<7.1f}{delta:>+4.0%} "
+              f"{o['p95_ms']:>8.1f}->{r['p95_ms']:<8.1f} {o['peak_threads']:>4}->{r['peak_threads']:<4} "
+              f"{o['peak_rss_mb']:>6.1f}->{r['peak_rss_mb']:<6.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark pipeline throughput against the local mock server.")
+    parser.add_argument("--latency-ms", type=float, default=50.0, help="Median mock response latency.")
+    parser.add_argument("--latency-sigma", type=float, default=0.5)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of mock requests answered with 429.")
+    parser.add_argument("--calls", type=int, default=200, help="Calls for the GenerateEmail scenario.")
+    parser.add_argument("--workers", type=int, default=16, help="Thread pool size for the GenerateEmail scenario.")
+    parser.add_argument("--items", type=int, default=5, help="Entries per file for the run_test_suite scenario.")
+    parser.add_argument("--synth", type=int, default=30, help="Emails for the generate_file scenario.")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--output", help="Where to save the JSON results (default: benchmarks/results/<rev>.json).")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="Compare two saved result files and exit.")
+    cli_args = parser.parse_args()
+
+    if cli_args.compare:
+        compare(*cli_args.compare)
+        return
+
+    server = MockServerProcess(cli_args.latency_ms, cli_args.latency_sigma, cli_args.error_rate, cli_args.seed)
+    # Must be set before generate/batch_runner build their clients
+    os.environ["AZURE_OPENAI_ENDPOINT"] = server.url
+    os.environ["AZURE_OPENAI_API_KEY"] = "mock"
+    os.environ["RESPONSE_CACHE"] = "0"
+
+    rows = []
+    try:
+        with tempfile.TemporaryDirectory() as workdir:
+            scenarios = [
+                ("generate_email", bench_generate_email(cli_args.calls, cli_args.workers)),
+                ("run_test_suite", bench_test_suite(workdir, cli_args.items)),
+                ("generate_file", bench_generate_file(workdir, cli_args.synth)),
+            ]
+            for name, (threaded, async_path) in scenarios:
+                rows.append(run_scenario(f"{name}[threads]", server, threaded))
+                rows.append(run_scenario(f"{name}[async]", server, async_path))
+    finally:
+        server.stop()
+
+    revision = git_revision()
+    report = {
+        "revision": revision,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": sys.version.split()[0],
+        "settings": vars(cli_args),
+        "scenarios": rows,
+    }
+    print_rows(rows)
+
+    output = cli_args.output or os.path.join(RESULTS_DIR, f"{revision}.json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nSaved to {output}")
+
+
+if __name__ == "__main__":
+    main()
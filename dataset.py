@@ -0,0 +1,260 @@
+"""JSONL email datasets with a byte-offset index for random access by id.
+
+The first open of a file scans it once and records where every line starts;
+the index is cached under .cache/datasets/ and rebuilt when the file's mtime
+or size changes. Lookups by id then read a single line through mmap, and
+iteration streams the file line by line, so neither loads the whole dataset.
+
+Records without an "id" get their 1-based line position as id. Lines that
+are not valid JSON objects are skipped, as before.
+"""
+import os
+import json
+import mmap
+import hashlib
+import threading
+
+# DATASET_INDEX_DIR overrides this when a dataset or writer is created, after .env is loaded
+INDEX_DIR = os.path.join(".cache", "datasets")
+INDEX_VERSION = 1
+# DatasetWriter flushes its partial file every this many records
+FLUSH_EVERY = 20
+
+
+def _index_dir():
+    return os.getenv("DATASET_INDEX_DIR", INDEX_DIR)
+
+
+def _signature(path):
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+
+def _index_path(path, index_dir):
+    # Name + hash of the absolute path, so equal file names in different folders don't clash
+    digest = hashlib.sha1(os.path.abspath(path).encode("utf-8")).hexdigest()[:12]
+    return os.path.join(index_dir, f"{os.path.basename(path)}.{digest}.idx.json")
+
+
+def _parse_line(raw):
+    try:
+        record = json.loads(raw)
+    except (json.JSONDecodeError, UnicodeDecodeError):
+        return None
+    return record if isinstance(record, dict) else None
+
+
+def _save_index(path, index_dir, signature, ids, offsets):
+    os.makedirs(index_dir, exist_ok=True)
+    index_path = _index_path(path, index_dir)
+    tmp_path = f"{index_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({
+            "version": INDEX_VERSION,
+            "source": os.path.abspath(path),
+            "mtime_ns": signature[0],
+            "size": signature[1],
+            "ids": ids,
+            "offsets": offsets,
+        }, f)
+    # Atomic swap: a concurrent reader sees the old index or the new one, never half
+    os.replace(tmp_path, index_path)
+
+
+class Dataset:
+    """One JSONL file: ids(), get(id), len() and streaming iteration."""
+
+    def __init__(self, path, index_dir=None):
+        self.path = path
+        self.index_dir = index_dir or _index_dir()
+        self._lock = threading.Lock()
+        self._signature = None
+        self._loaded = False
+        self._file = None
+        self._mmap = None
+        self._ids = []
+        self._offsets = {}
+
+    # --- INDEX ---
+    def _load_cached_index(self, signature):
+        try:
+            with open(_index_path(self.path, self.index_dir), "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if data.get("version") != INDEX_VERSION or [data.get("mtime_ns"), data.get("size")] != list(signature):
+            return None
+        return data["ids"], data["offsets"]
+
+    def _build_index(self, mm):
+        ids, offsets = [], []
+        position = 0
+        offset = 0
+        while offset < len(mm):
+            end = mm.find(b"\n", offset)
+            if end == -1:
+                end = len(mm)
+            line = mm[offset:end]
+            if line.strip():
+                position += 1
+                record = _parse_line(line)
+                if record is not None:
+                    ids.append(record.get("id", position))
+                    offsets.append(offset)
+            offset = end + 1
+        return ids, offsets
+
+    def _close_map(self):
+        if self._mmap is not None:
+            self._mmap.close()
+            self._file.close()
+        self._mmap = self._file = None
+
+    def refresh(self):
+        """Re-indexes if the file changed on disk; cheap (one stat) when it has not."""
+        with self._lock:
+            signature = _signature(self.path)
+            if self._loaded and signature == self._signature:
+                return
+            self._close_map()
+            self._ids, self._offsets, self._signature = [], {}, signature
+            self._loaded = True
+            if signature is None or signature[1] == 0:
+                return
+
+            self._file = open(self.path, "rb")
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            cached = self._load_cached_index(signature)
+            if cached is None:
+                cached = self._build_index(self._mmap)
+                try:
+                    _save_index(self.path, self.index_dir, signature, *cached)
+                except OSError:
+                    # A read-only checkout still works, it just re-scans next time
+                    pass
+            ids, offsets = cached
+            self._ids = ids
+            # First occurrence wins if a file repeats an id
+            self._offsets = {}
+            for entry_id, offset in zip(ids, offsets):
+                self._offsets.setdefault(entry_id, offset)
+
+    # --- ACCESS ---
+    def ids(self):
+        self.refresh()
+        return list(self._ids)
+
+    def __len__(self):
+        self.refresh()
+        return len(self._ids)
+
+    def __contains__(self, entry_id):
+        self.refresh()
+        return entry_id in self._offsets
+
+    def get(self, entry_id, default=None):
+        """Reads and parses the one line holding entry_id (a fresh dict on every call)."""
+        self.refresh()
+        with self._lock:
+            offset = self._offsets.get(entry_id)
+            if offset is None:
+                return default
+            end = self._mmap.find(b"\n", offset)
+            line = self._mmap[offset:end if end != -1 else len(self._mmap)]
+        record = _parse_line(line)
+        if record is None:
+            return default
+        record.setdefault("id", entry_id)
+        return record
+
+    def __iter__(self):
+        """Streams every valid record in file order without loading the file."""
+        if not os.path.exists(self.path):
+            return
+        position = 0
+        with open(self.path, "rb") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                position += 1
+                record = _parse_line(line)
+                if record is not None:
+                    record.setdefault("id", position)
+                    yield record
+
+    def close(self):
+        with self._lock:
+            self._close_map()
+            self._loaded = False
+
+
+class DatasetWriter:
+    """Writes a JSONL dataset and its index in one pass, so the first read skips the scan.
+
+    Records stream to <path>.partial, flushed every flush_every records, so a
+    run's progress can be followed on disk. close() moves it over the
+    dataset: a reader with the old file mapped keeps a valid view instead of
+    crashing on a truncated mapping. abort() (and leaving a with-block on an
+    exception) keeps the .partial and the old dataset as they are.
+    """
+
+    def __init__(self, path, index_dir=None, flush_every=FLUSH_EVERY):
+        self.path = path
+        self.index_dir = index_dir or _index_dir()
+        self.count = 0
+        self.flush_every = flush_every
+        self._ids = []
+        self._offsets = []
+        self._offset = 0
+        self.partial_path = f"{path}.partial"
+        self._file = open(self.partial_path, "wb")
+
+    def write(self, record):
+        line = (json.dumps(record) + "\n").encode("utf-8")
+        self.count += 1
+        self._ids.append(record.get("id", self.count))
+        self._offsets.append(self._offset)
+        self._file.write(line)
+        self._offset += len(line)
+        if self.count % self.flush_every == 0:
+            self._file.flush()
+
+    def close(self):
+        if self._file.closed:
+            return
+        self._file.close()
+        os.replace(self.partial_path, self.path)
+        try:
+            _save_index(self.path, self.index_dir, _signature(self.path), self._ids, self._offsets)
+        except OSError:
+            pass
+
+    def abort(self):
+        """Stops writing without touching the dataset; what was written stays in partial_path."""
+        if not self._file.closed:
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+_datasets = {}
+_datasets_lock = threading.Lock()
+
+
+def open_dataset(path):
+    """Returns the shared Dataset for a path, so every caller reuses one index and mmap."""
+    key = os.path.abspath(path)
+    with _datasets_lock:
+        if key not in _datasets:
+            _datasets[key] = Dataset(path)
+        return _datasets[key]
@@ -0,0 +1,88 @@
+"""Near-duplicate detection for generated emails.
+
+Texts are compared by the Jaccard similarity of their character 5-gram
+shingles (after lowercasing and collapsing punctuation), estimated with a
+64-value MinHash signature. Signatures are split into 16 bands of 4 values
+and bucketed per band, so a lookup only compares against texts that share a
+band; with the default 0.7 threshold a true near-duplicate shares one with
+~99% probability, while unrelated emails almost never do.
+"""
+import re
+import numpy as np
+
+SHINGLE_CHARS = 5
+NUM_PERM = 64
+BANDS = 16
+# Estimated Jaccard similarity at which two texts count as the same email
+THRESHOLD = 0.7
+
+# Multiply-shift hashing of the packed shingles (uint64 products wrap mod 2**64)
+_rng = np.random.default_rng(20240601)
+_A = _rng.integers(1, 2**63, size=(NUM_PERM, 1), dtype=np.uint64) | np.uint64(1)
+_B = _rng.integers(0, 2**63, size=(NUM_PERM, 1), dtype=np.uint64)
+_SHIFT = np.uint64(32)
+_BYTE = np.uint64(8)
+
+_NON_WORD = re.compile(r"[^a-z0-9]+")
+
+
+def _normalize(text):
+    return _NON_WORD.sub(" ", text.lower()).strip()
+
+
+def _shingles(text):
+    """Distinct shingles, each packed into one integer (5 ASCII bytes fit in 40 bits)."""
+    data = np.frombuffer(_normalize(text).encode("ascii"), dtype=np.uint8).astype(np.uint64)
+    if len(data) <= SHINGLE_CHARS:
+        data = np.pad(data, (0, SHINGLE_CHARS - len(data)))
+    count = len(data) - SHINGLE_CHARS + 1
+    packed = np.zeros(count, dtype=np.uint64)
+    for k in range(SHINGLE_CHARS):
+        packed = (packed << _BYTE) | data[k:k + count]
+    return np.unique(packed)
+
+
+def signature(text):
+    """MinHash signature of text's shingle set (NUM_PERM uint64 values)."""
+    return ((_A * _shingles(text) + _B) >> _SHIFT).min(axis=1)
+
+
+def similarity(sig_a, sig_b):
+    """Estimated Jaccard similarity of the texts behind two signatures."""
+    return float(np.count_nonzero(sig_a == sig_b)) / NUM_PERM
+
+
+class NearDuplicateIndex:
+    """Texts seen so far, answering "is this a near-duplicate of one of them?"."""
+
+    def __init__(self, threshold=THRESHOLD):
+        self.threshold = threshold
+        self._rows = NUM_PERM // BANDS
+        self._buckets = [{} for _ in range(BANDS)]
+        self._signatures = []
+
+    def _band_keys(self, sig):
+        # Slicing one bytes object is much cheaper than BANDS numpy slices
+        raw, width = sig.tobytes(), self._rows * sig.itemsize
+        return [raw[i * width:(i + 1) * width] for i in range(BANDS)]
+
+    def add(self, text):
+        """Stores text and returns True, or returns False if a near-duplicate is already stored."""
+        sig = signature(text)
+        keys = self._band_keys(sig)
+        checked = set()
+        for bucket, key in zip(self._buckets, keys):
+            for candidate in bucket.get(key, ()):
+                if candidate not in checked:
+                    checked.add(candidate)
+                    if similarity(sig, self._signatures[candidate]) >= self.threshold:
+                        return False
+
+        index = len(self._signatures)
+        self._signatures.append(sig)
+        for bucket, key in zip(self._buckets, keys):
+            bucket.setdefault(key, []).append(index)
+        return True
+
+    def __len__(self):
+        return len(self._signatures)
@@ -0,0 +1,54 @@
+"""Fingerprints that decide whether a stored batch result is still valid.
+
+Every result record carries three short hashes:
+
+* generation: generator deployment and temperature, the action's prompt
+  template, the tone, the chunk size and the post-processing rules;
+* judge (one per metric): judge deployment, temperature, mode and format,
+  and the metric's prompt template (plus the combined judge prompt in that
+  mode, where every metric shares one call);
+* input: the dataset record itself.
+
+Editing only the tone block of prompts.yaml changes the generation hash of
+the tone configs alone; appending emails adds units with new input hashes.
+A unit whose hashes all match its previous record is reused as is; one whose
+generation and input match keeps its rewrite and only the metrics whose
+judge hash changed are judged again.
+"""
+import json
+import hashlib
+
+import postprocess
+
+
+def digest(*parts):
+    payload = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
+def _template_print(prompts, name):
+    template = prompts.get(name)
+    return template.fingerprint if template is not None else None
+
+
+def generation_fingerprint(bot, config):
+    rules = postprocess.rules_for(config["action"])
+    return digest(
+        bot.model, bot.temperature, _template_print(bot.prompts, config["action"]),
+        config["tone"], bot.chunk_tokens, vars(rules),
+    )
+
+
+def judge_fingerprints(bot, metrics):
+    """{metric: fingerprint}; in combined mode every metric also depends on the others' rubrics."""
+    if bot.judge_mode == "combined":
+        shared = [_template_print(bot.prompts, m) for m in metrics] + [_template_print(bot.prompts, "multi_metric_judge")]
+        return {m: digest(bot.model, bot.temperature, bot.judge_mode, m, shared) for m in metrics}
+    return {
+        m: digest(bot.model, bot.temperature, bot.judge_mode, bot.judge_format, m, _template_print(bot.prompts, m))
+        for m in metrics
+    }
+
+
+def input_fingerprint(entry):
+    return digest(entry)
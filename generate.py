@@ -1,196 +1,1067 @@
 import os
-import yaml
 import json
 import random
 import re
 import time
+import asyncio
+import argparse
+import threading
+import itertools
+import contextlib
 import concurrent.futures
-from dotenv import load_dotenv
-from openai import AzureOpenAI
-from tqdm import tqdm
-
-load_dotenv()
+from response_cache import get_response_cache
+from http_clients import get_client_pool
+from prompt_registry import get_prompt_registry, STRUCTURED_SCORE_FORMAT
+from dataset import DatasetWriter
+from postprocess import clean_body
+from rate_limiter import get_rate_limiter, backoff_delay, parse_retry_after
+import hedging
+import telemetry
+import batch_api
+import token_budget
 
 DATASET_DIR = "datasets"
-os.makedirs(DATASET_DIR, exist_ok=True)
 
-try:
-    with open("prompts.yaml", "r", encoding="utf-8") as f:
-        prompts = yaml.safe_load(f)
-except FileNotFoundError:
-    prompts = {}
+API_VERSION = "2024-02-01"
+
+# --- LAZY STARTUP ---
+# Importing this module has no side effects and pulls in no SDK: .env is read
+# when the first bot is built, openai/httpx when the first client is, and
+# tqdm/numpy only for dataset synthesis. The app and CLIs start that much faster.
+_env_loaded = False
+
+def load_env():
+    """Reads .env into os.environ once per process."""
+    global _env_loaded
+    if not _env_loaded:
+        from dotenv import load_dotenv
+        load_dotenv()
+        _env_loaded = True
+
+# --- ASYNC CONCURRENCY LIMIT ---
+# One semaphore caps in-flight requests for every GenerateEmail instance on the
+# async path, so a single event loop can drive hundreds of calls within quota.
+# The size is read from MAX_INFLIGHT_REQUESTS on first use, after .env is loaded.
+_async_limit = {
+    "size": None,
+    "loop": None,
+    "semaphore": None,
+}
+
+def set_max_inflight(limit):
+    """Sets the process-wide cap on concurrent async API requests."""
+    if limit < 1:
+        raise ValueError("max in-flight requests must be at least 1")
+    _async_limit["size"] = limit
+    _async_limit["semaphore"] = None
+
+def _loop_semaphore(state):
+    # asyncio primitives belong to one loop; rebuild when a new loop is running
+    loop = asyncio.get_running_loop()
+    if state["semaphore"] is None or state["loop"] is not loop:
+        if state["size"] is None:
+            state["size"] = int(os.getenv("MAX_INFLIGHT_REQUESTS", "64"))
+        state["semaphore"] = asyncio.Semaphore(state["size"])
+        state["loop"] = loop
+    return state["semaphore"]
+
+def _get_async_semaphore():
+    return _loop_semaphore(_async_limit)
+
+# Legacy judge replies: "**Score: 4.50/5** - ..."
+_SCORE_PATTERN = re.compile(r"Score:\s*(\d+(?:\.\d+)?)")
+
+def _valid_score(value):
+    try:
+        score = float(value)
+    except (TypeError, ValueError):
+        return None
+    # Also rejects NaN
+    return score if 0.0 <= score <= 5.0 else None
+
+def parse_judgement(response_text):
+    """(score, reason) from a judge reply; score is None when the reply holds no valid one.
+
+    Understands the structured {"score", "reason"} JSON reply and the legacy
+    "Score: X.XX" text, where reason is None. API errors ("Error: ...") and
+    unparseable replies give None rather than a fake 0.0.
+    """
+    if not response_text or response_text.startswith("Error:"):
+        return None, None
+    text = response_text.strip()
+    if text.startswith(("{", "```")):
+        try:
+            data = json.loads(text.replace("```json", "").replace("```", "").strip())
+        except json.JSONDecodeError:
+            data = None
+        if isinstance(data, dict):
+            return _valid_score(data.get("score")), str(data.get("reason", "")).strip()
+    # The substring test skips the regex for replies that cannot match
+    if "Score:" in text:
+        match = _SCORE_PATTERN.search(text)
+        if match:
+            return _valid_score(match.group(1)), None
+    return None, None
+
+def parse_score(response_text):
+    """Extracts the 0-5 score from a judge reply, or None if it has none."""
+    return parse_judgement(response_text)[0]
+
+# Tones offered by the app; every rewrite the app can make, by label, for generate_variants
+REWRITE_TONES = ["Friendly", "Sympathetic", "Professional", "Diplomatic", "Witty"]
+REWRITE_VARIANTS = {
+    "Shorten": ("shorten", None),
+    "Lengthen": ("lengthen", None),
+    **{f"Tone: {t}": ("tone", t) for t in REWRITE_TONES},
+}
 
 class GenerateEmail:
-    def __init__(self, deployment_name):
-        self.client = AzureOpenAI(
-            api_version="2024-02-01"
-        )
+    def __init__(self, deployment_name, use_cache=True, judge_mode="per_metric"):
+        load_env()
+        # Clients and connections are shared by every instance on the same endpoint;
+        # the clients themselves are built on the first request
+        self._pool = get_client_pool(API_VERSION)
         self.model = deployment_name
+        self.temperature = 0.3
+        # Identical (deployment, temperature, messages) requests are answered from disk;
+        # the SQLite file is opened on the first lookup
+        self._use_cache = use_cache
+        self._cache = None
+        # "per_metric" sends one judge call per metric, "combined" scores them all in one call
+        self.judge_mode = judge_mode
+        # "json" asks per-metric judges for a {"score", "reason"} object, "text" for "Score: X.XX"
+        self.judge_format = "text"
+        # Judge replies with no usable score are asked again at most this many times
+        self.max_reasks = int(os.getenv("JUDGE_REASKS", "1"))
+        # Retries are ours (limiter-aware), so the SDK's own retry loop is switched off
+        self.max_retries = int(os.getenv("API_MAX_RETRIES", "6"))
+        # Seconds one request may take (for streams: between chunks) before it fails and is retried
+        self.timeout = float(os.getenv("API_TIMEOUT_SECONDS", "60"))
+        # Rewrites of longer inputs are split at paragraph boundaries and stitched back
+        self.chunk_tokens = token_budget.chunk_tokens()
+        self.usage = {"requests": 0, "prompt_tokens": 0, "completion_tokens": 0}
+        self._usage_lock = threading.Lock()
+        # Optional per-deployment cap on in-flight requests (see set_concurrency)
+        self._slots = None
+        self._async_slots = {"size": None, "loop": None, "semaphore": None}
+        # Shared by every instance on the same deployment: RPM/TPM pacing and AIMD window
+        self.rate_limiter = get_rate_limiter(deployment_name)
+        # Also per deployment: when to send a second copy of a slow request (off unless configured)
+        self.hedge = hedging.get_hedge_policy(deployment_name)
+        # Live prompts.yaml templates, loaded on first use; batch runs swap in a frozen PromptSet snapshot
+        self._prompts = None
+
+    @property
+    def prompts(self):
+        if self._prompts is None:
+            self._prompts = get_prompt_registry()
+        return self._prompts
+
+    @prompts.setter
+    def prompts(self, value):
+        self._prompts = value
+
+    @property
+    def cache(self):
+        if self._cache is None and self._use_cache:
+            self._cache = get_response_cache()
+            # RESPONSE_CACHE=0 gives None; stop asking
+            self._use_cache = self._cache is not None
+        return self._cache
+
+    @cache.setter
+    def cache(self, value):
+        # None switches caching off for this instance
+        self._cache = value
+        self._use_cache = value is not None
+
+    def set_concurrency(self, limit):
+        """Caps this instance's in-flight requests, independent of other deployments."""
+        if limit < 1:
+            raise ValueError("concurrency limit must be at least 1")
+        self._slots = threading.BoundedSemaphore(limit)
+        self._async_slots = {"size": limit, "loop": None, "semaphore": None}
+        self._pool.reserve(self.model, limit)
+        self.rate_limiter.configure(max_concurrency=limit)
+
+    def set_hedging(self, percentile, max_rate=None):
+        """Hedges requests that outlast `percentile` of this deployment's recent latencies; 0 turns it off."""
+        if not 0 <= percentile < 100:
+            raise ValueError("hedge percentile must be in [0, 100)")
+        if max_rate is not None and not 0 <= max_rate <= 1:
+            raise ValueError("hedge rate must be in [0, 1]")
+        self.hedge.configure(percentile=percentile, max_rate=max_rate)
+
+    @contextlib.asynccontextmanager
+    async def _async_request_slot(self):
+        # Deployment slot first, so waiting on one deployment never holds a global slot
+        if self._async_slots["size"] is None:
+            async with _get_async_semaphore():
+                yield
+        else:
+            async with _loop_semaphore(self._async_slots), _get_async_semaphore():
+                yield
+
+    @property
+    def client(self):
+        return self._pool.client()
+
+    @property
+    def async_client(self):
+        # One per event loop, built on first use so sync-only callers never open an async pool
+        return self._pool.async_client()
+
+    def _warm_client(self, use_async=False):
+        # The first request builds the client (and imports openai) before any latency is
+        # timed; a failure here is raised again, and reported, when the request uses it
+        try:
+            self.async_client if use_async else self.client
+        except Exception:
+            pass
+
+    def _cache_lookup(self, messages, cacheable, params):
+        if self.cache is None or not cacheable:
+            return None, None
+        key = self.cache.make_key(self.model, self.temperature, messages, **params)
+        return key, self.cache.get(key)
+
+    def _emit(self, tag, start, response=None, retries=0, cache_hit=False, error=None, ttft=None):
+        if not telemetry.has_sinks():
+            return
+        usage = getattr(response, "usage", None)
+        telemetry.emit(telemetry.make_record(
+            self.model, tag, time.perf_counter() - start,
+            prompt_tokens=usage.prompt_tokens if usage else 0,
+            completion_tokens=usage.completion_tokens if usage else 0,
+            retries=retries, cache_hit=cache_hit, error=error, ttft_s=ttft,
+        ))
+
+    def _record_usage(self, response):
+        usage = getattr(response, "usage", None)
+        with self._usage_lock:
+            self.usage["requests"] += 1
+            if usage is not None:
+                self.usage["prompt_tokens"] += usage.prompt_tokens
+                self.usage["completion_tokens"] += usage.completion_tokens
+
+    def _cache_replace(self, messages, params, content):
+        # Overwrites a cached reply that turned out unusable with a good one
+        key, _ = self._cache_lookup(messages, True, params)
+        self._cache_store(key, content)
+
+    def _cache_store(self, key, content):
+        if key is not None:
+            self.cache.put(key, content)
+        return content
+
+    @staticmethod
+    def _estimate_tokens(messages, completion=None):
+        # Pre-flight size for the rate limiter: counted prompt plus the predicted reply
+        return token_budget.message_tokens(messages) + (completion or token_budget.DEFAULT_COMPLETION_TOKENS)
+
+    def _retry_delay(self, error, attempt):
+        """Seconds to wait before retrying, or None when the error is not retryable."""
+        status = getattr(error, "status_code", None)
+        if status == 429 or (status is None and "429" in str(error)):
+            headers = getattr(getattr(error, "response", None), "headers", None)
+            retry_after = parse_retry_after(headers)
+            # Pauses every caller on this deployment and shrinks its concurrency window
+            self.rate_limiter.on_throttle(retry_after)
+            print(f"⚠️ Rate limit hit on {self.model}. Retrying in {retry_after or 0:.1f}s+ (attempt {attempt + 1})...")
+            return backoff_delay(attempt)
+        from openai import APIConnectionError
+        if isinstance(error, APIConnectionError) or (status is not None and status >= 500):
+            return backoff_delay(attempt)
+        return None
+
+    def _parse_raw(self, raw, est_tokens):
+        response = raw.parse()
+        self.rate_limiter.on_success(raw.headers)
+        used = response.usage.total_tokens if response.usage else est_tokens
+        return response, used
+
+    def _request(self, messages, est_tokens, params):
+        # One copy of a request, sent once the limiter admitted it; a hedged call
+        # may send two, and both are paced and counted
+        used = est_tokens
+        try:
+            raw = self.client.chat.completions.with_raw_response.create(
+                model=self.model,
+                messages=messages,
+                temperature=self.temperature,
+                timeout=self.timeout,
+                **params,
+            )
+            response, used = self._parse_raw(raw, est_tokens)
+        finally:
+            self.rate_limiter.release(est_tokens, used)
+        self._record_usage(response)
+        return response
 
-    def _call_api(self, messages):
-        # Added Retry Logic to prevent Rate Limit (429) Crashes
-        retries = 3
-        for attempt in range(retries):
+    async def _arequest(self, messages, est_tokens, params):
+        used = est_tokens
+        try:
+            raw = await self.async_client.chat.completions.with_raw_response.create(
+                model=self.model,
+                messages=messages,
+                temperature=self.temperature,
+                timeout=self.timeout,
+                **params,
+            )
+            response, used = self._parse_raw(raw, est_tokens)
+        finally:
+            self.rate_limiter.release(est_tokens, used)
+        self._record_usage(response)
+        return response
+
+    def _call_api(self, messages, cacheable=True, tag=None, completion_tokens=None, **params):
+        # tag = (action, key) labels the call in telemetry, e.g. ("evaluate", "faithfulness")
+        start = time.perf_counter()
+        key, cached = self._cache_lookup(messages, cacheable, params)
+        if cached is not None:
+            self._emit(tag, start, cache_hit=True)
+            return cached
+
+        self._warm_client()
+        est_tokens = self._estimate_tokens(messages, completion_tokens)
+        for attempt in range(self.max_retries + 1):
+            try:
+                # A hedge shares the caller's deployment slot; the hedge budget bounds the extra load
+                with self._slots or contextlib.nullcontext():
+                    if attempt == 0:
+                        # Latency counts from the slot, not from queueing for it; retry backoff still counts
+                        start = time.perf_counter()
+                    response = hedging.call(
+                        self.hedge,
+                        lambda: self._request(messages, est_tokens, params),
+                        acquire=lambda: self.rate_limiter.acquire(est_tokens),
+                    )
+                self._emit(tag, start, response=response, retries=attempt)
+                return self._cache_store(key, response.choices[0].message.content.strip())
+            except Exception as e:
+                delay = self._retry_delay(e, attempt)
+                if delay is not None and attempt < self.max_retries:
+                    time.sleep(delay)
+                    continue
+                self._emit(tag, start, retries=attempt, error=str(e))
+                return f"Error: {str(e)}"
+
+    def _open_stream(self, messages, est_tokens):
+        # Holds the deployment slot and limiter reservation until _close_stream
+        if self._slots:
+            self._slots.acquire()
+        try:
+            self.rate_limiter.acquire(est_tokens)
             try:
-                response = self.client.chat.completions.create(
+                raw = self.client.chat.completions.with_raw_response.create(
                     model=self.model,
                     messages=messages,
-                    temperature=0.3,
+                    temperature=self.temperature,
+                    stream=True,
+                    # Usage arrives in a final chunk with no choices
+                    stream_options={"include_usage": True},
+                    timeout=self.timeout,
                 )
-                return response.choices[0].message.content.strip()
+                stream = raw.parse()
+                self.rate_limiter.on_success(raw.headers)
+                return stream
+            except Exception:
+                self.rate_limiter.release(est_tokens, est_tokens)
+                raise
+        except Exception:
+            if self._slots:
+                self._slots.release()
+            raise
+
+    def _close_stream(self, stream, est_tokens, used=None):
+        stream.close()
+        self.rate_limiter.release(est_tokens, used or est_tokens)
+        if self._slots:
+            self._slots.release()
+
+    def _stream_api(self, messages, tag=None, completion_tokens=None):
+        """Yields completion text deltas as they arrive; a cache hit yields the whole text once."""
+        start = time.perf_counter()
+        key, cached = self._cache_lookup(messages, True, {})
+        if cached is not None:
+            self._emit(tag, start, cache_hit=True)
+            yield cached
+            return
+
+        self._warm_client()
+        start = time.perf_counter()
+        est_tokens = self._estimate_tokens(messages, completion_tokens)
+        # Retries are only possible before the first chunk has been handed out
+        for attempt in range(self.max_retries + 1):
+            try:
+                stream = self._open_stream(messages, est_tokens)
+                break
+            except Exception as e:
+                delay = self._retry_delay(e, attempt)
+                if delay is not None and attempt < self.max_retries:
+                    time.sleep(delay)
+                    continue
+                self._emit(tag, start, retries=attempt, error=str(e))
+                yield f"Error: {str(e)}"
+                return
+
+        parts = []
+        first_token = None
+        final = None
+        try:
+            for chunk in stream:
+                if chunk.usage is not None:
+                    final = chunk
+                # Azure sends content-filter chunks with no choices; the usage chunk has none either
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    if first_token is None:
+                        first_token = time.perf_counter() - start
+                    parts.append(delta)
+                    yield delta
+        except Exception as e:
+            self._emit(tag, start, retries=attempt, error=str(e), ttft=first_token)
+            raise
+        finally:
+            self._close_stream(stream, est_tokens, final.usage.total_tokens if final else None)
+
+        self._record_usage(final)
+        self._emit(tag, start, response=final, retries=attempt, ttft=first_token)
+        self._cache_store(key, "".join(parts).strip())
+
+    async def _acall_api(self, messages, cacheable=True, tag=None, completion_tokens=None, **params):
+        # Async twin of _call_api; only the request itself holds a semaphore slot
+        start = time.perf_counter()
+        key, cached = self._cache_lookup(messages, cacheable, params)
+        if cached is not None:
+            self._emit(tag, start, cache_hit=True)
+            return cached
+
+        self._warm_client(use_async=True)
+        est_tokens = self._estimate_tokens(messages, completion_tokens)
+        for attempt in range(self.max_retries + 1):
+            try:
+                async with self._async_request_slot():
+                    if attempt == 0:
+                        start = time.perf_counter()
+                    response = await hedging.acall(
+                        self.hedge,
+                        lambda: self._arequest(messages, est_tokens, params),
+                        acquire=lambda: self.rate_limiter.aacquire(est_tokens),
+                    )
+                self._emit(tag, start, response=response, retries=attempt)
+                return self._cache_store(key, response.choices[0].message.content.strip())
             except Exception as e:
-                if "429" in str(e) and attempt < retries - 1:
-                    wait_time = (attempt + 1) * 2  # Wait 2s, 4s, 6s...
-                    print(f"⚠️ Rate limit hit. Retrying in {wait_time}s...")
-                    time.sleep(wait_time)
+                delay = self._retry_delay(e, attempt)
+                if delay is not None and attempt < self.max_retries:
+                    await asyncio.sleep(delay)
                     continue
+                self._emit(tag, start, retries=attempt, error=str(e))
                 return f"Error: {str(e)}"
 
+    # --- PROVIDER BATCH API ---
+    def batch_complete(self, calls, batch_client, workdir, name, poll_interval=60.0, cacheable=True):
+        """Answers {custom_id: (messages, params, tag)} through a provider batch job.
+
+        Returns {custom_id: text}. Cache hits never reach the batch, and failed
+        requests come back as "Error: ..." strings, as with _call_api.
+        """
+        start = time.perf_counter()
+        answers, pending, requests = {}, {}, []
+        for custom_id, (messages, params, tag) in calls.items():
+            key, cached = self._cache_lookup(messages, cacheable, params)
+            if cached is not None:
+                self._emit(tag, start, cache_hit=True)
+                answers[custom_id] = cached
+                continue
+            pending[custom_id] = (key, tag)
+            requests.append(batch_api.request_line(custom_id, self.model, messages, self.temperature, **params))
+        if not requests:
+            return answers
+
+        results = batch_api.run_requests(batch_client, requests, workdir, name, poll_interval)
+        for custom_id, (key, tag) in pending.items():
+            content, usage, error = results[custom_id]
+            if error is not None:
+                self._emit(tag, start, error=error)
+                answers[custom_id] = f"Error: {error}"
+                continue
+            prompt_tokens = usage.get("prompt_tokens", 0)
+            completion_tokens = usage.get("completion_tokens", 0)
+            with self._usage_lock:
+                self.usage["requests"] += 1
+                self.usage["prompt_tokens"] += prompt_tokens
+                self.usage["completion_tokens"] += completion_tokens
+            if telemetry.has_sinks():
+                # Latency here is the batch turnaround, not a single request
+                telemetry.emit(telemetry.make_record(
+                    self.model, tag, time.perf_counter() - start,
+                    prompt_tokens=prompt_tokens, completion_tokens=completion_tokens,
+                ))
+            answers[custom_id] = self._cache_store(key, content.strip())
+        return answers
+
     def get_prompt(self, action, role, **kwargs):
-        template = prompts.get(action, {}).get(role)
-        return template.format(**kwargs) if template else ""
+        template = self.prompts.get(action)
+        if template is None:
+            return ""
+        if role == "system":
+            return template.system or ""
+        return template.render(**kwargs)
 
     @staticmethod
-    def _clean_body(text: str) -> str:
-        text = re.sub(r"\[.*?\]", "", text)
-        banned_starts = (
-            "subject:", "dear", "to:", "from:", "hi ", "hello ", "greetings", 
-            "regards", "best regards", "sincerely", "best,", "cheers", 
-            "thank you", "thanks,", "yours truly", "warm regards"
-        )
-        lines = text.splitlines()
-        cleaned = []
-        for line in lines:
-            s_line = line.strip().lower()
-            if not s_line: continue
-            if len(s_line.split()) < 10 and s_line.startswith(banned_starts): continue
-            if len(s_line.split()) < 4 and not s_line.endswith(('.', '!', '?')): continue
-            cleaned.append(line)
-        result = "\n".join(cleaned).strip()
-        return result if result else text
+    def _clean_body(text: str, action: str = None) -> str:
+        # Rules per action live in postprocess.ACTION_RULES
+        return clean_body(text, action)
 
-    def generate(self, action: str, selected_text: str, tone_type: str = "Professional") -> str:
-        args = {"selected_text": selected_text, "tone_type": tone_type}
-        user_prompt_template = self.get_prompt(action, "user", **args)
-        
-        if not user_prompt_template:
+    def _generate_messages(self, action, selected_text, tone_type):
+        # System prompt and "paragraph" wording are baked into the template at load time
+        template = self.prompts.get(action)
+        if template is None:
+            return None
+        return template.messages(selected_text=selected_text, tone_type=tone_type)
+
+    def _generate_one(self, action, selected_text, tone_type):
+        messages = self._generate_messages(action, selected_text, tone_type)
+        if messages is None:
             return "Error: Prompt template not found."
+        expected = token_budget.completion_tokens(action, selected_text)
+        return self._clean_body(self._call_api(messages, tag=("generate", action), completion_tokens=expected), action)
+
+    async def _agenerate_one(self, action, selected_text, tone_type):
+        messages = self._generate_messages(action, selected_text, tone_type)
+        if messages is None:
+            return "Error: Prompt template not found."
+        expected = token_budget.completion_tokens(action, selected_text)
+        return self._clean_body(await self._acall_api(messages, tag=("generate", action), completion_tokens=expected), action)
+
+    @staticmethod
+    def _stitch_chunks(chunks, rewrites):
+        # One failed chunk fails the rewrite; a half-rewritten email is worse than an error
+        for res in rewrites:
+            if res.startswith("Error:"):
+                return res
+        return token_budget.stitch(chunks, rewrites)
+
+    def generate(self, action: str, selected_text: str, tone_type: str = "Professional") -> str:
+        """Rewrites the text; inputs over chunk_tokens are rewritten chunk by chunk in parallel."""
+        chunks = token_budget.split_paragraphs(selected_text, self.chunk_tokens)
+        if len(chunks) == 1:
+            return self._generate_one(action, selected_text, tone_type)
+        with concurrent.futures.ThreadPoolExecutor(max_workers=len(chunks)) as executor:
+            rewrites = list(executor.map(lambda c: self._generate_one(action, c[1], tone_type), chunks))
+        return self._stitch_chunks(chunks, rewrites)
+
+    def generate_stream(self, action: str, selected_text: str, tone_type: str = "Professional"):
+        """Yields the raw rewrite as it streams in.
+
+        Run the joined text through _clean_body once the stream ends; it works
+        line by line, so cleaning partial output could drop a line mid-sentence.
+        Chunked inputs are rewritten in parallel and yielded once, when stitched.
+        """
+        if len(token_budget.split_paragraphs(selected_text, self.chunk_tokens)) > 1:
+            yield self.generate(action, selected_text, tone_type)
+            return
+        messages = self._generate_messages(action, selected_text, tone_type)
+        if messages is None:
+            yield "Error: Prompt template not found."
+            return
+        expected = token_budget.completion_tokens(action, selected_text)
+        yield from self._stream_api(messages, tag=("generate", action), completion_tokens=expected)
+
+    async def agenerate(self, action: str, selected_text: str, tone_type: str = "Professional") -> str:
+        chunks = token_budget.split_paragraphs(selected_text, self.chunk_tokens)
+        if len(chunks) == 1:
+            return await self._agenerate_one(action, selected_text, tone_type)
+        rewrites = await asyncio.gather(*(self._agenerate_one(action, c, tone_type) for _, c in chunks))
+        return self._stitch_chunks(chunks, rewrites)
 
-        system_prompt = (
-            "You are a professional writing assistant.\n"
-            "Rules:\n"
-            "- Output ONLY the rewritten paragraph content.\n"
-            "- Return plain text only."
+    # --- TOKEN BUDGETS ---
+    def estimate_generate(self, action, selected_text, tone_type="Professional"):
+        """Predicted {"requests", "prompt_tokens", "completion_tokens"} of generate(), without sending anything."""
+        budget = {"requests": 0, "prompt_tokens": 0, "completion_tokens": 0}
+        for _, chunk in token_budget.split_paragraphs(selected_text, self.chunk_tokens):
+            messages = self._generate_messages(action, chunk, tone_type)
+            if messages is None:
+                continue
+            budget["requests"] += 1
+            budget["prompt_tokens"] += token_budget.message_tokens(messages)
+            budget["completion_tokens"] += token_budget.completion_tokens(action, chunk)
+        return budget
+
+    def estimate_evaluate_all(self, metrics, original_text, rewritten_text):
+        """Predicted size of evaluate_all() (before any re-asks)."""
+        if self.judge_mode == "combined":
+            messages = self._combined_messages(metrics, original_text, rewritten_text)
+            if messages is not None:
+                return {
+                    "requests": 1,
+                    "prompt_tokens": token_budget.message_tokens(messages),
+                    "completion_tokens": token_budget.JUDGE_COMPLETION_TOKENS * len(metrics),
+                }
+        budget = {"requests": 0, "prompt_tokens": 0, "completion_tokens": 0}
+        for m in metrics:
+            messages = self._evaluate_messages(m, original_text, rewritten_text)
+            if messages is None:
+                continue
+            budget["requests"] += 1
+            budget["prompt_tokens"] += token_budget.message_tokens(messages)
+            budget["completion_tokens"] += token_budget.JUDGE_COMPLETION_TOKENS
+        return budget
+
+    # --- MULTI-VARIANT REWRITES ---
+    def generate_variants(self, selected_text, variants=None):
+        """Runs every rewrite in variants ({label: (action, tone)}, default REWRITE_VARIANTS) concurrently.
+
+        Returns {label: rewritten text}; the whole set takes about as long as its slowest call.
+        """
+        variants = variants or REWRITE_VARIANTS
+        with concurrent.futures.ThreadPoolExecutor(max_workers=len(variants)) as executor:
+            future_map = {
+                executor.submit(self.generate, action, selected_text, tone or "Professional"): label
+                for label, (action, tone) in variants.items()
+            }
+            results = {future_map[f]: f.result() for f in concurrent.futures.as_completed(future_map)}
+        return {label: results[label] for label in variants}
+
+    async def agenerate_variants(self, selected_text, variants=None):
+        variants = variants or REWRITE_VARIANTS
+        rewrites = await asyncio.gather(
+            *(self.agenerate(action, selected_text, tone or "Professional") for action, tone in variants.values())
         )
-        user_prompt = user_prompt_template.replace("email", "paragraph")
-        
-        messages = [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_prompt},
-        ]
-        return self._clean_body(self._call_api(messages))
+        return dict(zip(variants, rewrites))
+
+    def _evaluate_messages(self, metric, original_text, rewritten_text):
+        template = self.prompts.get(metric)
+        if template is None:
+            return None
+        messages = template.messages(original_text=original_text, rewritten_text=rewritten_text)
+        if self.judge_format == "json":
+            messages[-1]["content"] += STRUCTURED_SCORE_FORMAT
+        return messages
+
+    def _evaluate_params(self):
+        return {"response_format": {"type": "json_object"}} if self.judge_format == "json" else {}
 
     def evaluate(self, metric: str, original_text: str, rewritten_text: str) -> str:
-        args = {"original_text": original_text, "rewritten_text": rewritten_text}
-        system_prompt = "You are an AI quality judge. Evaluate the text objectively with decimal precision."
-        user_prompt = self.get_prompt(metric, "user", **args)
-        
-        if not user_prompt:
+        messages = self._evaluate_messages(metric, original_text, rewritten_text)
+        if messages is None:
+            return f"Error: Metric prompt for '{metric}' not found."
+        return self._call_api(messages, tag=("evaluate", metric),
+                              completion_tokens=token_budget.JUDGE_COMPLETION_TOKENS, **self._evaluate_params())
+
+    async def aevaluate(self, metric: str, original_text: str, rewritten_text: str) -> str:
+        messages = self._evaluate_messages(metric, original_text, rewritten_text)
+        if messages is None:
             return f"Error: Metric prompt for '{metric}' not found."
+        return await self._acall_api(messages, tag=("evaluate", metric),
+                                     completion_tokens=token_budget.JUDGE_COMPLETION_TOKENS, **self._evaluate_params())
 
-        messages = [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_prompt},
+    # --- MULTI-METRIC JUDGING ---
+    def _combined_messages(self, metrics, original_text, rewritten_text):
+        # Each metric keeps its own rubric; the texts are sent once instead of per metric
+        placeholders = {
+            "original_text": "(see Original Text above)",
+            "rewritten_text": "(see Rewritten Text above)",
+        }
+        # One PromptSet for the whole message, even if prompts.yaml reloads meanwhile
+        prompt_set = self.prompts.snapshot()
+        judge = prompt_set.get("multi_metric_judge")
+        rubric_templates = [prompt_set.get(m) for m in metrics]
+        if judge is None or None in rubric_templates:
+            return None
+
+        rubrics = [
+            f"### METRIC: {m}\n{t.render(**placeholders).strip()}"
+            for m, t in zip(metrics, rubric_templates)
         ]
-        return self._call_api(messages)
+        return judge.messages(
+            original_text=original_text,
+            rewritten_text=rewritten_text,
+            metric_rubrics="\n\n".join(rubrics),
+            metric_keys=", ".join(metrics),
+        )
 
-    def synthesize_data(self, topic, persona, tone, length, id_num, mode="standard"):
+    @staticmethod
+    def _parse_combined(response_text, metrics):
+        """Returns {metric: {"score", "explanation"}} for every metric the JSON scored validly."""
+        clean_json = response_text.replace("```json", "").replace("```", "").strip()
+        try:
+            data = json.loads(clean_json)
+        except json.JSONDecodeError:
+            return {}
+        if not isinstance(data, dict):
+            return {}
+
+        parsed = {}
+        for m in metrics:
+            item = data.get(m)
+            if not isinstance(item, dict):
+                continue
+            score = _valid_score(item.get("score"))
+            if score is None:
+                continue
+            reason = str(item.get("explanation", "")).strip()
+            # Same shape as a per-metric judge reply so displays and reports don't care
+            parsed[m] = {"score": score, "explanation": f"**Score: {score:.2f}/5** - {reason}"}
+        return parsed
+
+    @staticmethod
+    def _judgement(response_text):
+        score, reason = parse_judgement(response_text)
+        if score is not None and reason is not None:
+            # Structured replies are shown like legacy ones so displays and reports don't care
+            return {"score": score, "explanation": f"**Score: {score:.2f}/5** - {reason}"}
+        return {"score": score, "explanation": response_text}
+
+    @staticmethod
+    def needs_reask(judgement):
+        # API errors were already retried in _call_api; only replies without a usable score are asked again
+        return judgement["score"] is None and not judgement["explanation"].startswith("Error:")
+
+    def reask(self, metric, original_text, rewritten_text):
+        """Asks again for a metric whose reply had no usable score, bypassing the cached reply."""
+        messages = self._evaluate_messages(metric, original_text, rewritten_text)
+        judgement = {"score": None, "explanation": f"Error: Metric prompt for '{metric}' not found."}
+        for _ in range(self.max_reasks if messages is not None else 0):
+            res = self._call_api(messages, cacheable=False, tag=("reask", metric), **self._evaluate_params())
+            judgement = self._judgement(res)
+            if judgement["score"] is not None:
+                self._cache_replace(messages, self._evaluate_params(), res)
+                break
+        return judgement
+
+    async def areask(self, metric, original_text, rewritten_text):
+        messages = self._evaluate_messages(metric, original_text, rewritten_text)
+        judgement = {"score": None, "explanation": f"Error: Metric prompt for '{metric}' not found."}
+        for _ in range(self.max_reasks if messages is not None else 0):
+            res = await self._acall_api(messages, cacheable=False, tag=("reask", metric), **self._evaluate_params())
+            judgement = self._judgement(res)
+            if judgement["score"] is not None:
+                self._cache_replace(messages, self._evaluate_params(), res)
+                break
+        return judgement
+
+    def evaluate_all(self, metrics, original_text, rewritten_text, parallel=True):
+        """Scores every metric, returning {metric: {"score": float or None, "explanation": str}}.
+
+        A reply without a usable score is asked again up to max_reasks times;
+        if it still has none (or the call failed) the score stays None.
+        With parallel=False the per-metric calls run one after another in the
+        calling thread, for schedulers that already provide the concurrency.
+        """
+        results = {}
+        if self.judge_mode == "combined":
+            messages = self._combined_messages(metrics, original_text, rewritten_text)
+            if messages is not None:
+                res = self._call_api(
+                    messages, tag=("evaluate_all", "combined"), response_format={"type": "json_object"},
+                    completion_tokens=token_budget.JUDGE_COMPLETION_TOKENS * len(metrics),
+                )
+                results = self._parse_combined(res, metrics)
+
+        # Per-metric calls for the default mode and for anything the combined reply missed
+        missing = [m for m in metrics if m not in results]
+        if missing and not parallel:
+            for m in missing:
+                results[m] = self._judgement(self.evaluate(m, original_text, rewritten_text))
+        elif missing:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=len(missing)) as executor:
+                future_map = {
+                    executor.submit(self.evaluate, m, original_text, rewritten_text): m
+                    for m in missing
+                }
+                for future in concurrent.futures.as_completed(future_map):
+                    results[future_map[future]] = self._judgement(future.result())
+
+        for m in metrics:
+            if m in results and self.needs_reask(results[m]):
+                results[m] = self.reask(m, original_text, rewritten_text)
+        return results
+
+    async def aevaluate_all(self, metrics, original_text, rewritten_text):
+        results = {}
+        if self.judge_mode == "combined":
+            messages = self._combined_messages(metrics, original_text, rewritten_text)
+            if messages is not None:
+                res = await self._acall_api(
+                    messages, tag=("evaluate_all", "combined"), response_format={"type": "json_object"},
+                    completion_tokens=token_budget.JUDGE_COMPLETION_TOKENS * len(metrics),
+                )
+                results = self._parse_combined(res, metrics)
+
+        missing = [m for m in metrics if m not in results]
+        judged = await asyncio.gather(
+            *(self.aevaluate(m, original_text, rewritten_text) for m in missing)
+        )
+        for m, res in zip(missing, judged):
+            results[m] = self._judgement(res)
+
+        unscored = [m for m in metrics if m in results and self.needs_reask(results[m])]
+        reasked = await asyncio.gather(*(self.areask(m, original_text, rewritten_text) for m in unscored))
+        results.update(zip(unscored, reasked))
+        return results
+
+    @staticmethod
+    def _synthesis_prompt_key(mode):
         # Select prompt based on mode
         if mode == "challenge":
-            prompt_key = "challenge_synthesis"
+            return "challenge_synthesis"
         elif mode == "adversarial":
-            prompt_key = "adversarial_synthesis"
-        else:
-            prompt_key = "data_synthesis"
-        
-        args = {
-            "topic": topic, "persona": persona, "tone": tone, 
-            "length": length, "id_num": id_num
-        }
-        user_prompt = self.get_prompt(prompt_key, "user", **args)
-        
-        if not user_prompt:
+            return "adversarial_synthesis"
+        return "data_synthesis"
+
+    def _synthesis_messages(self, prompt_key, topic, persona, tone, length, id_num):
+        template = self.prompts.get(prompt_key)
+        if template is None:
+            return None
+        return template.messages(topic=topic, persona=persona, tone=tone, length=length, id_num=id_num)
+
+    def synthesize_data(self, topic, persona, tone, length, id_num, mode="standard"):
+        prompt_key = self._synthesis_prompt_key(mode)
+        messages = self._synthesis_messages(prompt_key, topic, persona, tone, length, id_num)
+        if messages is None:
             return f'{{"error": "Prompt {prompt_key} not found in yaml"}}'
+        # Synthesis must produce fresh data on every run, so it skips the cache
+        return self._call_api(messages, cacheable=False, tag=("synthesize", prompt_key))
 
-        messages = [
-            {"role": "system", "content": "You are a data generator. Output valid JSON only. Do not use Markdown formatting."},
-            {"role": "user", "content": user_prompt},
-        ]
-        return self._call_api(messages)
+    async def asynthesize_data(self, topic, persona, tone, length, id_num, mode="standard"):
+        prompt_key = self._synthesis_prompt_key(mode)
+        messages = self._synthesis_messages(prompt_key, topic, persona, tone, length, id_num)
+        if messages is None:
+            return f'{{"error": "Prompt {prompt_key} not found in yaml"}}'
+        return await self._acall_api(messages, cacheable=False, tag=("synthesize", prompt_key))
+
+# --- SYNTHETIC DATASET GENERATION ---
+PERSONAS = ["strict project manager", "enthusiastic intern", "confused client", "apologetic support agent"]
+TONES = ["urgent", "professional", "casual", "sympathetic", "angry", "diplomatic", "witty"]
+TOPICS = ["rescheduling a meeting", "asking for a raise", "reporting a bug", "product launch"]
+LENGTHS = ["very short (5-10 words)", "short (1-2 sentences)", "medium (3-4 sentences)", "long (5-6 sentences)"]
+
+FIRST_NAMES = ["alex", "jordan", "taylor", "morgan"]
+LAST_NAMES = ["smith", "jones", "williams", "brown"]
+DOMAINS = ["gmail.com", "corp.net", "tech.io"]
+
+def get_random_sender():
+    return f"{random.choice(FIRST_NAMES)}.{random.choice(LAST_NAMES)}@{random.choice(DOMAINS)}"
+
+def _mode_for_file(filename):
+    # Determine mode based on filename to hit the correct prompt
+    if filename == "challenge.jsonl":
+        return "challenge"
+    elif filename == "adversarial.jsonl":
+        return "adversarial"
+    return "standard"
+
+# Attempts per file are capped at this multiple of its target, so a prompt that
+# keeps failing (or only yields duplicates) cannot loop forever
+TOP_UP_FACTOR = 3
+DEFAULT_SYNTH_CONCURRENCY = 8
+
+def _scenarios(rng):
+    """Endless topic/persona/tone/length combinations, each used once per shuffled pass."""
+    combos = list(itertools.product(TOPICS, PERSONAS, TONES, LENGTHS))
+    while True:
+        rng.shuffle(combos)
+        yield from combos
+
+def _finalize_record(generator, result):
+    clean_json = result.replace("```json", "").replace("```", "").strip()
+    try:
+        data = json.loads(clean_json)
+    except json.JSONDecodeError:
+        return None
+    if not isinstance(data, dict) or not isinstance(data.get("content"), str) or not data["content"].strip():
+        return None
+    data["sender"] = get_random_sender()
+    data["content"] = generator._clean_body(data["content"], "synthesis")
+    return data
+
+class _FileProgress:
+    """Target, writer, duplicate index and counters for one dataset file."""
+
+    def __init__(self, filename, target, dataset_dir, rng):
+        self.filename = filename
+        self.mode = _mode_for_file(filename)
+        self.target = target
+        self.path = os.path.join(dataset_dir, filename)
+        self.writer = DatasetWriter(self.path)
+        # numpy is only needed here, so it is imported with the first synthesis run
+        from dedup import NearDuplicateIndex
+        self.seen = NearDuplicateIndex()
+        self.scenarios = _scenarios(rng)
+        self.attempts = 0
+        self.in_flight = 0
+        self.counts = {"api_errors": 0, "unparseable": 0, "duplicates": 0}
+
+    def wants_more(self):
+        # Top up failed attempts until the target is met or the attempt budget runs out
+        return (self.writer.count + self.in_flight < self.target
+                and self.attempts < self.target * TOP_UP_FACTOR)
+
+class SynthesisRun:
+    """Book-keeping for generating several dataset files under one concurrency budget.
+
+    Jobs are handed out round-robin across the files that still need records;
+    each valid, non-duplicate record is written as soon as it arrives, with
+    ids assigned in arrival order so a file has no gaps.
+    """
+
+    def __init__(self, generator, targets, dataset_dir=None, seed=None):
+        self.generator = generator
+        rng = random.Random(seed)
+        dataset_dir = dataset_dir or DATASET_DIR
+        os.makedirs(dataset_dir, exist_ok=True)
+        self.files = [_FileProgress(name, count, dataset_dir, rng) for name, count in targets.items()]
+        self._turn = 0
+        from tqdm import tqdm
+        self.progress = tqdm(total=sum(targets.values()))
+
+    def next_job(self):
+        """(file, scenario, id_num) for the next request, or None if no file needs one now."""
+        for _ in range(len(self.files)):
+            state = self.files[self._turn % len(self.files)]
+            self._turn += 1
+            if state.wants_more():
+                state.attempts += 1
+                state.in_flight += 1
+                return state, next(state.scenarios), state.attempts
+        return None
+
+    def accept(self, state, result):
+        """Validates, de-duplicates and writes one synthesis reply."""
+        state.in_flight -= 1
+        if result.startswith("Error:"):
+            state.counts["api_errors"] += 1
+            return
+        record = _finalize_record(self.generator, result)
+        if record is None:
+            state.counts["unparseable"] += 1
+            return
+        if state.writer.count >= state.target:
+            return
+        if not state.seen.add(record["content"]):
+            state.counts["duplicates"] += 1
+            return
+        record["id"] = state.writer.count + 1
+        state.writer.write(record)
+        self.progress.update(1)
+
+    def close(self, completed=True):
+        """Promotes every finished file; an interrupted run leaves the old datasets in place."""
+        self.progress.close()
+        if not completed:
+            for state in self.files:
+                state.writer.abort()
+                print(f"⚠️ Interrupted: {state.filename} left unchanged, "
+                      f"{state.writer.count} new records kept in {state.writer.partial_path}")
+            return
+        for state in self.files:
+            state.writer.close()
+            skipped = ", ".join(f"{n} {k.replace('_', ' ')}" for k, n in state.counts.items() if n)
+            print(f"Saved {state.writer.count}/{state.target} to {state.path} "
+                  f"({state.attempts} requests{'; ' + skipped if skipped else ''})")
+            if state.writer.count < state.target:
+                print(f"⚠️ {state.filename} is short: gave up after {state.attempts} requests")
+
+def _synthesize(generator, job):
+    state, (topic, persona, tone, length), id_num = job
+    return state, generator.synthesize_data(topic, persona, tone, length, id_num, mode=state.mode)
+
+async def _asynthesize(generator, job):
+    state, (topic, persona, tone, length), id_num = job
+    return state, await generator.asynthesize_data(topic, persona, tone, length, id_num, mode=state.mode)
+
+def generate_datasets(generator, targets, concurrency=DEFAULT_SYNTH_CONCURRENCY, use_async=False, seed=None):
+    """Generates {filename: count} together, with at most `concurrency` requests in flight overall."""
+    if use_async:
+        return asyncio.run(agenerate_datasets(generator, targets, concurrency, seed))
+
+    print(f"\n--- Generating {', '.join(f'{n} x{c}' for n, c in targets.items())} ---")
+    run = SynthesisRun(generator, targets, seed=seed)
+    running = set()
+    completed = False
+    try:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=concurrency) as executor:
+            while True:
+                # Keep every worker busy; top-ups are issued as failures come back
+                while len(running) < concurrency:
+                    job = run.next_job()
+                    if job is None:
+                        break
+                    running.add(executor.submit(_synthesize, generator, job))
+                if not running:
+                    break
+                done, running = concurrent.futures.wait(running, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    run.accept(*future.result())
+        completed = True
+    finally:
+        run.close(completed)
+
+async def agenerate_datasets(generator, targets, concurrency=DEFAULT_SYNTH_CONCURRENCY, seed=None):
+    """Async twin of generate_datasets; the shared in-flight semaphore still applies."""
+    print(f"\n--- Generating {', '.join(f'{n} x{c}' for n, c in targets.items())} (async) ---")
+    run = SynthesisRun(generator, targets, seed=seed)
+    running = set()
+    completed = False
+    try:
+        while True:
+            while len(running) < concurrency:
+                job = run.next_job()
+                if job is None:
+                    break
+                running.add(asyncio.ensure_future(_asynthesize(generator, job)))
+            if not running:
+                break
+            done, running = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                run.accept(*task.result())
+        completed = True
+    finally:
+        for task in running:
+            task.cancel()
+        run.close(completed)
+
+def generate_file(generator, filename, count, use_async=False):
+    generate_datasets(generator, {filename: count}, use_async=use_async)
+
+async def agenerate_file(generator, filename, count):
+    await agenerate_datasets(generator, {filename: count})
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate synthetic email datasets.")
+    parser.add_argument("--async", dest="use_async", action="store_true",
+                        help="Drive all requests from one event loop instead of a thread pool.")
+    parser.add_argument("--max-inflight", type=int, default=None,
+                        help="Cap on concurrent API requests for --async (default: MAX_INFLIGHT_REQUESTS or 64).")
+    parser.add_argument("--count", type=int, default=30, help="Emails per file (default: 30).")
+    parser.add_argument("--files", nargs="+", default=["mixed.jsonl", "challenge.jsonl", "adversarial.jsonl"],
+                        help="Files to generate; the mode follows the name (challenge/adversarial, else standard).")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_SYNTH_CONCURRENCY,
+                        help="Requests in flight across all files together.")
+    parser.add_argument("--seed", type=int, default=None, help="Seed for scenario order and senders.")
+    cli_args = parser.parse_args()
+    # Before any setting is read, so .env can name the deployment
+    load_env()
+    if cli_args.max_inflight:
+        set_max_inflight(cli_args.max_inflight)
+    if cli_args.seed is not None:
+        random.seed(cli_args.seed)
+
     print("Initializing Data Generator...")
-    # Instantiate the class properly
     generator = GenerateEmail(deployment_name=os.getenv("GENERATOR_DEPLOYMENT", "gpt-4o-mini"))
+    generator.set_concurrency(cli_args.concurrency)
 
-    personas = ["strict project manager", "enthusiastic intern", "confused client", "apologetic support agent"]
-    tones = ["urgent", "professional", "casual", "sympathetic", "angry", "diplomatic", "witty"]
-    topics = ["rescheduling a meeting", "asking for a raise", "reporting a bug", "product launch"]
-    lengths = ["very short (5-10 words)", "short (1-2 sentences)", "medium (3-4 sentences)", "long (5-6 sentences)"]
-
-    first_names = ["alex", "jordan", "taylor", "morgan"]
-    last_names = ["smith", "jones", "williams", "brown"]
-    domains = ["gmail.com", "corp.net", "tech.io"]
-
-    def get_random_sender():
-        return f"{random.choice(first_names)}.{random.choice(last_names)}@{random.choice(domains)}"
-
-    def process_single_email(i, filename):
-        topic = random.choice(topics)
-        persona = random.choice(personas)
-        tone = random.choice(tones)
-        length = random.choice(lengths)
-        
-        # Determine mode based on filename to hit the correct prompt
-        if filename == "challenge.jsonl":
-            mode = "challenge"
-        elif filename == "adversarial.jsonl":
-            mode = "adversarial"
-        else:
-            mode = "standard"
-
-        result = generator.synthesize_data(topic, persona, tone, length, i, mode=mode)
-        clean_json = result.replace("```json", "").replace("```", "").strip()
-        
-        try:
-            data = json.loads(clean_json)
-            data["sender"] = get_random_sender()
-            if "content" in data:
-                data["content"] = generator._clean_body(data["content"])
-            data["id"] = i
-            return json.dumps(data)
-        except json.JSONDecodeError:
-            return None
+    # The 3 key files expected by app.py, generated together under one budget
+    generate_datasets(
+        generator,
+        {filename: cli_args.count for filename in cli_args.files},
+        concurrency=cli_args.concurrency,
+        use_async=cli_args.use_async,
+        seed=cli_args.seed,
+    )
 
-    def generate_file(filename, count):
-        print(f"\n--- Generating {filename} ---")
-        filepath = os.path.join(DATASET_DIR, filename) 
-        
-        results = []
-        with concurrent.futures.ThreadPoolExecutor(max_workers=5) as executor:
-            futures = [executor.submit(process_single_email, i, filename) for i in range(1, count + 1)]
-            for future in tqdm(concurrent.futures.as_completed(futures), total=count):
-                res = future.result()
-                if res: results.append(res)
-        
-        with open(filepath, "w", encoding="utf-8") as f:
-            for line in results:
-                f.write(line + "\n")
-        print(f"Saved to {filepath}")
-
-    # Generate the 3 key files expected by app.py
-    generate_file("mixed.jsonl", 30)
-    generate_file("challenge.jsonl", 30)
-    generate_file("adversarial.jsonl", 30)
-    
-    print("\n✅ All datasets generated in 'datasets/' folder!")
\ No newline at end of file
+    print("\n✅ All datasets generated in 'datasets/' folder!")
@@ -0,0 +1,253 @@
+"""Hedged requests: a second copy of a slow call, within a budget.
+
+Each deployment keeps a window of recent request latencies. A request that
+has been in flight longer than the chosen percentile of that window gets a
+duplicate, and whichever copy answers first is used. The other copy is left
+to finish and its reply discarded: a blocking request cannot be interrupted
+from another thread, and cancelling the slow copies would hide the very
+tail the percentile is meant to track.
+
+Hedges are paid for from a budget. Every call adds max_rate of a hedge to
+it, up to BURST, so at most about max_rate of calls are sent twice even
+when the whole deployment slows down at once.
+
+Latencies start once a copy has been admitted (acquire(), e.g. the rate
+limiter), so time spent queueing for quota is never mistaken for a slow
+request. Call latencies are recorded twice: as the caller waited, and as
+the first copy alone took. The second is the latency without hedging, so
+comparing their percentiles shows what hedging saved.
+"""
+import os
+import time
+import asyncio
+import threading
+import collections
+import concurrent.futures
+
+from telemetry import percentile
+
+# Recent requests the hedge delay is computed from, and how many it needs first
+WINDOW = 1000
+MIN_SAMPLES = 20
+# The delay is recomputed after this many new latencies
+REFRESH_EVERY = 10
+# Unused hedge budget is capped, so a quiet spell cannot save up a burst of hedges
+BURST = 10
+# Threads that run the copies of hedged sync calls; idle ones are reused
+HEDGE_THREADS = 256
+
+
+class HedgePolicy:
+    """Hedge delay, hedge budget and latency record for one deployment.
+
+    percentile=0 turns hedging off; latencies are still recorded.
+    """
+
+    def __init__(self, percentile=0.0, max_rate=0.1, min_samples=MIN_SAMPLES, window=WINDOW):
+        self.percentile = percentile
+        self.max_rate = max_rate
+        self.min_samples = min_samples
+        self.calls = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+        self._budget = 0.0
+        self._requests = collections.deque(maxlen=window)
+        self._waited = collections.deque(maxlen=window)
+        self._unhedged = collections.deque(maxlen=window)
+        self._delay = None
+        self._fresh = 0
+        self._lock = threading.Lock()
+
+    def configure(self, percentile=None, max_rate=None):
+        with self._lock:
+            if percentile is not None:
+                self.percentile = percentile
+                self._delay = None
+            if max_rate is not None:
+                self.max_rate = max_rate
+
+    def start_call(self):
+        """Counts a call and returns the seconds after which it may be hedged, or None."""
+        with self._lock:
+            self.calls += 1
+            if self.percentile <= 0:
+                return None
+            self._budget = min(BURST, self._budget + self.max_rate)
+            if len(self._requests) < self.min_samples:
+                return None
+            if self._delay is None or self._fresh >= REFRESH_EVERY:
+                self._delay = percentile(list(self._requests), self.percentile)
+                self._fresh = 0
+            return self._delay
+
+    def try_hedge(self):
+        """Spends one hedge from the budget; False when it is used up."""
+        with self._lock:
+            if self._budget < 1.0:
+                return False
+            self._budget -= 1.0
+            self.hedged += 1
+            return True
+
+    def observe_request(self, seconds, unhedged=None):
+        """Latency of one successful copy; unhedged is the call's latency when this was its first copy."""
+        with self._lock:
+            self._requests.append(seconds)
+            self._fresh += 1
+            if unhedged is not None:
+                self._unhedged.append(unhedged)
+
+    def observe_call(self, seconds, hedge_won=False):
+        with self._lock:
+            self._waited.append(seconds)
+            if hedge_won:
+                self.hedge_wins += 1
+
+    def stats(self):
+        with self._lock:
+            waited, unhedged = list(self._waited), list(self._unhedged)
+            return {
+                "percentile": self.percentile,
+                "delay_s": self._delay,
+                "calls": self.calls,
+                "hedged": self.hedged,
+                "hedge_rate": self.hedged / self.calls if self.calls else 0.0,
+                "hedge_wins": self.hedge_wins,
+                "p50_s": percentile(waited, 50),
+                "p95_s": percentile(waited, 95),
+                "p99_s": percentile(waited, 99),
+                "unhedged_p95_s": percentile(unhedged, 95),
+                "unhedged_p99_s": percentile(unhedged, 99),
+            }
+
+
+# --- SYNC ---
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = concurrent.futures.ThreadPoolExecutor(max_workers=HEDGE_THREADS, thread_name_prefix="hedge")
+        return _executor
+
+
+def _copy(policy, send, started, first, acquire=None):
+    # One copy of the request; successful ones feed the latency windows
+    if acquire is not None:
+        acquire()
+    copy_start = time.perf_counter()
+    result = send()
+    now = time.perf_counter()
+    policy.observe_request(now - copy_start, unhedged=now - started if first else None)
+    return result
+
+
+def _first_success(futures):
+    """(future, result) of whichever future succeeds first; the last error if none does."""
+    pending, error = set(futures), None
+    while pending:
+        done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is None:
+                return future, future.result()
+            error = future.exception()
+    raise error
+
+
+def call(policy, send, acquire=None):
+    """Returns send(), sending a second copy if the first outlasts the policy's delay and the budget allows.
+
+    acquire() admits a copy before it is sent; the hedge runs its own.
+    """
+    if acquire is not None:
+        acquire()
+    started = time.perf_counter()
+    delay = policy.start_call()
+    hedge = None
+    if delay is None:
+        result = _copy(policy, send, started, True)
+    else:
+        executor = _get_executor()
+        primary = executor.submit(_copy, policy, send, started, True)
+        done, _ = concurrent.futures.wait([primary], timeout=delay)
+        if done or not policy.try_hedge():
+            result = primary.result()
+        else:
+            hedge = executor.submit(_copy, policy, send, started, False, acquire)
+            winner, result = _first_success([primary, hedge])
+            hedge = hedge if winner is hedge else None
+    policy.observe_call(time.perf_counter() - started, hedge_won=hedge is not None)
+    return result
+
+
+# --- ASYNC ---
+def _drain(task):
+    # Losing copies are not awaited; fetch their outcome so asyncio does not warn about it
+    if not task.cancelled():
+        task.exception()
+
+
+async def _acopy(policy, send, started, first, acquire=None):
+    if acquire is not None:
+        await acquire()
+    copy_start = time.perf_counter()
+    result = await send()
+    now = time.perf_counter()
+    policy.observe_request(now - copy_start, unhedged=now - started if first else None)
+    return result
+
+
+async def _afirst_success(tasks):
+    pending, error = set(tasks), None
+    while pending:
+        done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            if task.exception() is None:
+                for loser in pending:
+                    loser.add_done_callback(_drain)
+                return task, task.result()
+            error = task.exception()
+    raise error
+
+
+async def acall(policy, send, acquire=None):
+    """Async twin of call(); send and acquire are coroutine functions."""
+    if acquire is not None:
+        await acquire()
+    started = time.perf_counter()
+    delay = policy.start_call()
+    hedge = None
+    if delay is None:
+        result = await _acopy(policy, send, started, True)
+    else:
+        primary = asyncio.ensure_future(_acopy(policy, send, started, True))
+        done, _ = await asyncio.wait([primary], timeout=delay)
+        if done or not policy.try_hedge():
+            result = await primary
+        else:
+            hedge = asyncio.ensure_future(_acopy(policy, send, started, False, acquire))
+            winner, result = await _afirst_success([primary, hedge])
+            hedge = hedge if winner is hedge else None
+    policy.observe_call(time.perf_counter() - started, hedge_won=hedge is not None)
+    return result
+
+
+_policies = {}
+_policies_lock = threading.Lock()
+
+
+def get_hedge_policy(deployment):
+    """Returns the shared policy for a deployment, set from HEDGE_PERCENTILE / HEDGE_MAX_RATE on first use.
+
+    Hedging is off unless HEDGE_PERCENTILE is set to a non-empty value above 0.
+    """
+    with _policies_lock:
+        if deployment not in _policies:
+            _policies[deployment] = HedgePolicy(
+                percentile=float(os.getenv("HEDGE_PERCENTILE") or 0),
+                max_rate=float(os.getenv("HEDGE_MAX_RATE") or 0.1),
+            )
+        return _policies[deployment]
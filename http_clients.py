@@ -0,0 +1,164 @@
+"""Process-wide OpenAI clients: one connection pool per (endpoint, api_version).
+
+Every GenerateEmail on the same endpoint shares one AzureOpenAI client (and
+one AsyncAzureOpenAI per event loop), so TCP connections and TLS sessions
+stay warm across bots, Streamlit reruns and batch stages instead of being
+rebuilt for each object. The pool keeps alive as many connections as the
+deployments on it may have in flight; when set_concurrency asks for more,
+new requests move to a larger pool and in-flight ones finish on the old one.
+
+Connection reuse is counted through httpcore's "trace" request extension:
+a request that had to open a TCP connection counts as a new connection,
+every other request reused a warm one.
+
+httpx and openai are imported when the first client is built, so importing
+this module (and everything that imports it) stays cheap.
+"""
+import os
+import asyncio
+import threading
+
+# Pool size before any deployment sets a concurrency; matches MAX_INFLIGHT_REQUESTS' default.
+# HTTP_POOL_SIZE / HTTP_KEEPALIVE_SECONDS override both when a pool is built, after .env is loaded.
+DEFAULT_POOL_SIZE = 64
+# Idle connections are closed after this long (Azure front doors drop them after a few minutes)
+KEEPALIVE_SECONDS = 60.0
+
+
+class ConnectionStats:
+    """Requests sent vs connections and TLS handshakes opened for them."""
+
+    def __init__(self):
+        self.requests = 0
+        self.new_connections = 0
+        self.tls_handshakes = 0
+        self._lock = threading.Lock()
+
+    def on_request(self, request):
+        with self._lock:
+            self.requests += 1
+        request.extensions["trace"] = self.trace
+
+    async def aon_request(self, request):
+        with self._lock:
+            self.requests += 1
+        request.extensions["trace"] = self.atrace
+
+    def trace(self, event, info):
+        if event == "connection.connect_tcp.complete":
+            with self._lock:
+                self.new_connections += 1
+        elif event == "connection.start_tls.complete":
+            with self._lock:
+                self.tls_handshakes += 1
+
+    async def atrace(self, event, info):
+        self.trace(event, info)
+
+    def snapshot(self):
+        with self._lock:
+            requests, new = self.requests, self.new_connections
+            return {
+                "requests": requests,
+                "new_connections": new,
+                "tls_handshakes": self.tls_handshakes,
+                "reuse_rate": 1 - new / requests if requests else 0.0,
+            }
+
+
+class ClientPool:
+    """The shared sync client and per-loop async clients for one endpoint and API version."""
+
+    def __init__(self, endpoint, api_version):
+        self.endpoint = endpoint
+        self.api_version = api_version
+        self.min_size = int(os.getenv("HTTP_POOL_SIZE", DEFAULT_POOL_SIZE))
+        self.keepalive = float(os.getenv("HTTP_KEEPALIVE_SECONDS", KEEPALIVE_SECONDS))
+        self.size = self.min_size
+        self.stats = ConnectionStats()
+        self._demand = {}
+        self._lock = threading.Lock()
+        self._client = None
+        self._async = {"loop": None, "client": None}
+
+    def _limits(self):
+        # Every connection the concurrency allows is kept alive, so a burst never reconnects
+        import httpx
+        return httpx.Limits(
+            max_connections=self.size,
+            max_keepalive_connections=self.size,
+            keepalive_expiry=self.keepalive,
+        )
+
+    def reserve(self, owner, concurrency):
+        """Records how many requests owner (a deployment) may have in flight and grows the pool to fit."""
+        with self._lock:
+            self._demand[owner] = concurrency
+            size = max(self.min_size, sum(self._demand.values()))
+            if size > self.size:
+                self.size = size
+                # Only new requests see the bigger pool; the old clients close once unreferenced
+                self._client = None
+                self._async = {"loop": None, "client": None}
+
+    def client(self):
+        client = self._client
+        if client is not None:
+            return client
+        from openai import AzureOpenAI, DefaultHttpxClient
+        with self._lock:
+            if self._client is None:
+                self._client = AzureOpenAI(
+                    azure_endpoint=self.endpoint,
+                    api_version=self.api_version,
+                    max_retries=0,
+                    http_client=DefaultHttpxClient(
+                        limits=self._limits(),
+                        event_hooks={"request": [self.stats.on_request]},
+                    ),
+                )
+            return self._client
+
+    def async_client(self):
+        # httpx async pools belong to one event loop; rebuild when a new loop is running
+        loop = asyncio.get_running_loop()
+        from openai import AsyncAzureOpenAI, DefaultAsyncHttpxClient
+        with self._lock:
+            if self._async["client"] is None or self._async["loop"] is not loop:
+                self._async = {
+                    "loop": loop,
+                    "client": AsyncAzureOpenAI(
+                        azure_endpoint=self.endpoint,
+                        api_version=self.api_version,
+                        max_retries=0,
+                        http_client=DefaultAsyncHttpxClient(
+                            limits=self._limits(),
+                            event_hooks={"request": [self.stats.aon_request]},
+                        ),
+                    ),
+                }
+            return self._async["client"]
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_client_pool(api_version, endpoint=None):
+    """Returns the shared pool for an endpoint (default: AZURE_OPENAI_ENDPOINT) and API version."""
+    endpoint = endpoint or os.getenv("AZURE_OPENAI_ENDPOINT")
+    key = (endpoint, api_version)
+    with _pools_lock:
+        if key not in _pools:
+            _pools[key] = ClientPool(endpoint, api_version)
+        return _pools[key]
+
+
+def connection_stats():
+    """Pool size and reuse counters for every pool created in this process."""
+    with _pools_lock:
+        pools = list(_pools.values())
+    return [
+        {"endpoint": p.endpoint, "api_version": p.api_version, "pool_size": p.size, **p.stats.snapshot()}
+        for p in pools
+    ]
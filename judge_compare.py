@@ -0,0 +1,134 @@
+import os
+import glob
+import json
+import time
+import argparse
+import itertools
+import threading
+import statistics
+import collections
+from generate import GenerateEmail, load_env
+from batch_runner import METRICS, DATASET_DIR
+from dataset import open_dataset
+import telemetry
+from telemetry import percentile
+from tqdm import tqdm
+
+# Scores at or above this are a "pass", matching the edge-case cut-off in batch_runner.py
+PASS_THRESHOLD = 3.0
+
+
+class _CallCounter:
+    """Telemetry sink that counts calls per action while it is registered."""
+
+    def __init__(self):
+        self.counts = collections.Counter()
+        self._lock = threading.Lock()
+
+    def emit(self, record):
+        with self._lock:
+            self.counts[record["action"]] += 1
+
+
+def compare_modes(files, limit, action, tone):
+    """Judges the same rewrites in both modes and collects per-item scores and timings."""
+    generator = GenerateEmail(deployment_name=os.getenv("GENERATOR_DEPLOYMENT", "gpt-4o-mini"))
+    # Judges skip the response cache so every call is a real round-trip
+    judge_deployment = os.getenv("JUDGE_DEPLOYMENT", "gpt-4.1")
+    per_metric_judge = GenerateEmail(judge_deployment, use_cache=False, judge_mode="per_metric")
+    combined_judge = GenerateEmail(judge_deployment, use_cache=False, judge_mode="combined")
+
+    rows = []
+    for filename in files:
+        entries = (e for e in open_dataset(os.path.join(DATASET_DIR, filename)) if e.get("content"))
+        for entry in tqdm(itertools.islice(entries, limit), total=limit, desc=f"   📂 {filename}", leave=False):
+            original = entry["content"]
+            rewritten = generator.generate(action, original, tone_type=tone)
+
+            start = time.perf_counter()
+            per_metric = per_metric_judge.evaluate_all(METRICS, original, rewritten)
+            per_metric_latency = time.perf_counter() - start
+
+            # Per-metric "evaluate" calls made by the combined judge are its fallbacks;
+            # re-asks are tagged "reask" and failed calls are counted too
+            counter = telemetry.add_sink(_CallCounter())
+            try:
+                start = time.perf_counter()
+                combined = combined_judge.evaluate_all(METRICS, original, rewritten)
+                combined_latency = time.perf_counter() - start
+            finally:
+                telemetry.remove_sink(counter)
+
+            rows.append({
+                "file": filename,
+                "id": entry.get("id"),
+                "per_metric": {m: j["score"] for m, j in per_metric.items()},
+                "combined": {m: j["score"] for m, j in combined.items()},
+                "per_metric_latency": per_metric_latency,
+                "combined_latency": combined_latency,
+                "fallback_calls": counter.counts["evaluate"],
+            })
+
+    return rows, per_metric_judge.usage, combined_judge.usage
+
+
+def print_report(rows, per_metric_usage, combined_usage):
+    print("\n" + "=" * 60)
+    print("⚖️  JUDGE MODE COMPARISON (per_metric vs combined)")
+    print("=" * 60)
+    print(f"Items Judged: {len(rows)}")
+    if not rows:
+        print("No data processed.")
+        return
+
+    print("-" * 60)
+    print(f"{'metric'.ljust(20)} {'mean |Δ|':>9} {'≤0.5':>7} {'pass agree':>11}")
+    for m in METRICS:
+        # Missing scores (API errors, unparseable replies) have nothing to compare
+        pairs = [(r["per_metric"].get(m), r["combined"].get(m)) for r in rows]
+        pairs = [(a, b) for a, b in pairs if a is not None and b is not None]
+        if not pairs:
+            print(f"{m.ljust(20)} no items scored by both modes")
+            continue
+        diffs = [abs(a - b) for a, b in pairs]
+        close = sum(d <= 0.5 for d in diffs) / len(diffs)
+        agree = sum((a >= PASS_THRESHOLD) == (b >= PASS_THRESHOLD) for a, b in pairs) / len(pairs)
+        missing = f"  ({len(rows) - len(pairs)} missing)" if len(pairs) < len(rows) else ""
+        print(f"{m.ljust(20)} {statistics.mean(diffs):>9.3f} {close:>7.0%} {agree:>11.0%}{missing}")
+
+    print("-" * 60)
+    per_lat = [r["per_metric_latency"] for r in rows]
+    comb_lat = [r["combined_latency"] for r in rows]
+    print(f"Latency per item (p50 / p95): per_metric {percentile(per_lat, 50):.2f}s / {percentile(per_lat, 95):.2f}s"
+          f" | combined {percentile(comb_lat, 50):.2f}s / {percentile(comb_lat, 95):.2f}s")
+
+    per_tokens = per_metric_usage["prompt_tokens"] + per_metric_usage["completion_tokens"]
+    comb_tokens = combined_usage["prompt_tokens"] + combined_usage["completion_tokens"]
+    print(f"Requests: per_metric {per_metric_usage['requests']} | combined {combined_usage['requests']}"
+          f" (fallback calls: {sum(r['fallback_calls'] for r in rows)})")
+    print(f"Prompt Tokens: per_metric {per_metric_usage['prompt_tokens']} | combined {combined_usage['prompt_tokens']}")
+    print(f"Completion Tokens: per_metric {per_metric_usage['completion_tokens']} | combined {combined_usage['completion_tokens']}")
+    if per_tokens:
+        print(f"Token Savings: {1 - comb_tokens / per_tokens:.1%}")
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    load_env()
+    bundled = sorted(os.path.basename(f) for f in glob.glob(os.path.join(DATASET_DIR, "*.jsonl")))
+
+    parser = argparse.ArgumentParser(description="Compare single-call and per-metric judging on the bundled datasets.")
+    parser.add_argument("--files", nargs="+", default=bundled, help="Dataset files to sample (default: all in datasets/).")
+    parser.add_argument("--limit", type=int, default=5, help="Entries per file.")
+    parser.add_argument("--action", default="shorten", choices=["shorten", "lengthen", "tone"])
+    parser.add_argument("--tone", default="Professional")
+    parser.add_argument("--output", help="Optional JSON file for the per-item rows.")
+    cli_args = parser.parse_args()
+
+    rows, per_metric_usage, combined_usage = compare_modes(cli_args.files, cli_args.limit, cli_args.action, cli_args.tone)
+    print_report(rows, per_metric_usage, combined_usage)
+
+    if cli_args.output:
+        with open(cli_args.output, "w", encoding="utf-8") as f:
+            json.dump({"rows": rows, "usage": {"per_metric": per_metric_usage, "combined": combined_usage}}, f, indent=2)
+        print(f"Saved to {cli_args.output}")
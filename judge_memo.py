@@ -0,0 +1,129 @@
+"""Process-wide memo of judge results for the Streamlit app.
+
+Judgements are keyed by a content hash of (original, rewritten, metric) plus
+everything else that decides the verdict: judge deployment, judge mode and
+format, and the prompts.yaml version. Every session in the server process
+shares the memo, so a pair judged once is answered without any API call.
+
+Judging can also be started in the background (prefetch) right after a
+rewrite. While a metric is in flight its result is a pending future, and a
+"Judge Email" click waits for it instead of sending the same calls again.
+Only judgements with a score are kept; failed ones are judged again next time.
+"""
+import os
+import json
+import hashlib
+import threading
+import collections
+import concurrent.futures
+
+# Judged (original, rewritten, metric) triples kept, least recently used evicted first.
+# JUDGE_MEMO_SIZE / JUDGE_PREFETCH_WORKERS override these when the memo is built.
+MEMO_SIZE = 5000
+PREFETCH_WORKERS = 8
+
+
+class JudgeMemo:
+    """Judgements by content hash, plus the futures of those still being judged."""
+
+    def __init__(self, max_entries=None, workers=None):
+        if max_entries is None:
+            max_entries = int(os.getenv("JUDGE_MEMO_SIZE", MEMO_SIZE))
+        if workers is None:
+            workers = int(os.getenv("JUDGE_PREFETCH_WORKERS", PREFETCH_WORKERS))
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.prefetched = 0
+        self._done = collections.OrderedDict()
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=workers, thread_name_prefix="judge-memo")
+
+    @staticmethod
+    def key(bot, metric, original_text, rewritten_text):
+        payload = json.dumps(
+            [bot.model, bot.judge_mode, bot.judge_format, bot.prompts.snapshot().version,
+             metric, original_text, rewritten_text],
+            ensure_ascii=False,
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _claim(self, bot, metrics, original_text, rewritten_text):
+        """Futures for every metric; the metrics nobody is judging yet are returned to be judged."""
+        futures, claimed = {}, {}
+        with self._lock:
+            for m in metrics:
+                key = self.key(bot, m, original_text, rewritten_text)
+                if key in self._done:
+                    self._done.move_to_end(key)
+                    self.hits += 1
+                    futures[m] = concurrent.futures.Future()
+                    futures[m].set_result(self._done[key])
+                elif key in self._pending:
+                    self.hits += 1
+                    futures[m] = self._pending[key]
+                else:
+                    self.misses += 1
+                    futures[m] = self._pending[key] = concurrent.futures.Future()
+                    claimed[m] = key
+        return futures, claimed
+
+    def _judge(self, bot, claimed, original_text, rewritten_text):
+        try:
+            results = bot.evaluate_all(list(claimed), original_text, rewritten_text)
+        except Exception as e:
+            results = {m: {"score": None, "explanation": f"Error: {e}"} for m in claimed}
+
+        with self._lock:
+            for m, key in claimed.items():
+                judgement = results.get(m, {"score": None, "explanation": f"Error: No judgement for '{m}'."})
+                future = self._pending.pop(key)
+                if judgement["score"] is not None:
+                    self._done[key] = judgement
+                    while len(self._done) > self.max_entries:
+                        self._done.popitem(last=False)
+                future.set_result(judgement)
+
+    def _submit(self, bot, metrics, original_text, rewritten_text):
+        futures, claimed = self._claim(bot, metrics, original_text, rewritten_text)
+        if claimed:
+            self._executor.submit(self._judge, bot, claimed, original_text, rewritten_text)
+        return futures, len(claimed)
+
+    def evaluate_all(self, bot, metrics, original_text, rewritten_text):
+        """Like bot.evaluate_all, but memoized and joined with judging already in flight.
+
+        Returns the judgements and how many of them needed new judge calls.
+        """
+        futures, judged = self._submit(bot, metrics, original_text, rewritten_text)
+        return {m: f.result() for m, f in futures.items()}, judged
+
+    def prefetch(self, bot, metrics, original_text, rewritten_text):
+        """Starts judging in the background; returns at once."""
+        _, judged = self._submit(bot, metrics, original_text, rewritten_text)
+        with self._lock:
+            self.prefetched += judged
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._done),
+                "pending": len(self._pending),
+                "hits": self.hits,
+                "misses": self.misses,
+                "prefetched": self.prefetched,
+            }
+
+
+_memo = None
+_memo_lock = threading.Lock()
+
+
+def get_judge_memo():
+    """Returns the memo shared by every session in this process."""
+    global _memo
+    with _memo_lock:
+        if _memo is None:
+            _memo = JudgeMemo()
+        return _memo
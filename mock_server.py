@@ -0,0 +1,285 @@
+"""Local stand-in for the Azure OpenAI chat-completions endpoint.
+
+Point the app at it with AZURE_OPENAI_ENDPOINT=http://127.0.0.1:<port> and any
+AZURE_OPENAI_API_KEY. Replies are canned but shaped like the real thing:
+judge prompts get "**Score: x.xx/5**" (or a {"score", "reason"} object when
+asked for JSON), synthesis prompts get an email JSON and
+rewrite prompts echo the original text back. Requests with "stream": true get
+the same reply as server-sent chat.completion.chunk events, one word at a time,
+followed by a usage-only chunk when stream_options.include_usage is set.
+
+Besides the log-normal latency, a fraction of requests (slow_rate) can be
+made to take slow_ms instead: the stalled backend that hedged requests and
+per-call timeouts are there for.
+"""
+import re
+import json
+import math
+import time
+import random
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+ROUTE = re.compile(r"^/openai/deployments/(?P<deployment>[^/]+)/chat/completions")
+
+
+def _estimate_tokens(text):
+    return max(1, len(text) // 4)
+
+
+_FILLER = ("meeting project deadline client review budget launch update report schedule call team "
+           "invoice contract proposal agenda feedback release timeline priority issue request").split()
+
+
+class MockBehaviour:
+    """Tunable latency distribution, slow-response and 429 injection, and judge scores."""
+
+    def __init__(self, latency_ms=200.0, latency_sigma=0.5, error_rate=0.0, retry_after_ms=500,
+                 score_range=(3.0, 5.0), seed=None, chunk_delay_ms=20.0, garbage_rate=0.0,
+                 slow_rate=0.0, slow_ms=5000.0):
+        self.latency_ms = latency_ms
+        self.slow_rate = slow_rate
+        self.slow_ms = slow_ms
+        # Fraction of judge replies that come back without a parseable score
+        self.garbage_rate = garbage_rate
+        self.chunk_delay_ms = chunk_delay_ms
+        self.latency_sigma = latency_sigma
+        self.error_rate = error_rate
+        self.retry_after_ms = retry_after_ms
+        self.score_range = score_range
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.throttled = 0
+        self.slowed = 0
+
+    def sample_latency(self):
+        with self.lock:
+            if self.slow_rate and self.random.random() < self.slow_rate:
+                self.slowed += 1
+                return self.slow_ms / 1000.0
+            # Log-normal around the median, which is how real completion latency skews
+            if self.latency_ms <= 0:
+                return 0.0
+            return self.random.lognormvariate(math.log(self.latency_ms / 1000.0), self.latency_sigma)
+
+    def should_throttle(self):
+        with self.lock:
+            self.requests += 1
+            if self.random.random() < self.error_rate:
+                self.throttled += 1
+                return True
+            return False
+
+    def garbage(self):
+        with self.lock:
+            return self.random.random() < self.garbage_rate
+
+    def email_body(self):
+        # Varied wording, so duplicate detection on generated datasets has real text to work with
+        with self.lock:
+            words = [self.random.choice(_FILLER) for _ in range(self.random.randint(12, 40))]
+        return "This is a mock email about " + " ".join(words) + "."
+
+    def score(self):
+        with self.lock:
+            return self.random.uniform(*self.score_range)
+
+    def reply(self, body):
+        messages = body.get("messages", [])
+        system = messages[0]["content"] if messages else ""
+        user = messages[-1]["content"] if messages else ""
+
+        if body.get("response_format", {}).get("type") == "json_object" and "### METRIC:" in user:
+            metrics = re.findall(r"### METRIC: (\w+)", user)
+            return json.dumps({m: {"score": round(self.score(), 2), "explanation": "Mock judgement."} for m in metrics})
+        if "quality judge" in system:
+            if self.garbage():
+                return "The rewrite looks reasonable overall."
+            if body.get("response_format", {}).get("type") == "json_object":
+                return json.dumps({"score": round(self.score(), 2), "reason": "Mock judgement."})
+            return f"**Score: {self.score():.2f}/5** - Mock judgement."
+        if "data generator" in system:
+            match = re.search(r'"id":\s*(\d+)', user)
+            return json.dumps({
+                "id": int(match.group(1)) if match else 1,
+                "subject": "Mock subject",
+                "content": self.email_body(),
+            })
+        # Rewrites echo the original so downstream cleaning has real text to chew on
+        original = user.split("Original Text:", 1)[-1].strip()
+        return original or "Mock rewrite of the paragraph content."
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def handle_one_request(self):
+        # Clients that time out or drop a losing hedge close the socket mid-reply
+        try:
+            super().handle_one_request()
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True
+
+    def _send(self, status, payload, headers=None):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_stream(self, deployment, content, usage=None):
+        # SSE without Content-Length: the body ends when the connection closes
+        self.close_connection = True
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+
+        words = re.findall(r"\S+\s*", content) or [content]
+        deltas = [{"role": "assistant", "content": ""}] + [{"content": w} for w in words]
+        for i, delta in enumerate(deltas):
+            chunk = {
+                "id": "chatcmpl-mock",
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": deployment,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": "stop" if i == len(deltas) - 1 else None}],
+            }
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+            time.sleep(self.server.behaviour.chunk_delay_ms / 1000.0)
+        if usage is not None:
+            # As the real API does: one last chunk with no choices, carrying the request's usage
+            chunk = {"id": "chatcmpl-mock", "object": "chat.completion.chunk", "created": int(time.time()),
+                     "model": deployment, "choices": [], "usage": usage}
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+    def do_GET(self):
+        # Request counters, so an out-of-process benchmark can read server-side totals
+        if self.path == "/stats":
+            behaviour = self.server.behaviour
+            with behaviour.lock:
+                self._send(200, {"requests": behaviour.requests, "throttled": behaviour.throttled,
+                                 "slowed": behaviour.slowed})
+            return
+        self._send(404, {"error": {"code": "404", "message": "Unknown route"}})
+
+    def do_POST(self):
+        behaviour = self.server.behaviour
+        match = ROUTE.match(self.path)
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        if not match:
+            self._send(404, {"error": {"code": "404", "message": "Unknown route"}})
+            return
+
+        time.sleep(behaviour.sample_latency())
+        if behaviour.should_throttle():
+            self._send(
+                429,
+                {"error": {"code": "429", "message": "Requests to the deployment have exceeded the rate limit."}},
+                {"retry-after-ms": str(behaviour.retry_after_ms), "retry-after": str(math.ceil(behaviour.retry_after_ms / 1000))},
+            )
+            return
+
+        content = behaviour.reply(body)
+        prompt_tokens = sum(_estimate_tokens(m.get("content", "")) for m in body.get("messages", []))
+        completion_tokens = _estimate_tokens(content)
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        }
+        if body.get("stream"):
+            include_usage = (body.get("stream_options") or {}).get("include_usage")
+            self._send_stream(match.group("deployment"), content, usage if include_usage else None)
+            return
+        self._send(200, {
+            "id": "chatcmpl-mock",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": match.group("deployment"),
+            "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": content}}],
+            "usage": usage,
+        })
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+
+class MockAzureServer:
+    """Runs the mock endpoint on a background thread; usable as a context manager."""
+
+    def __init__(self, host="127.0.0.1", port=0, **behaviour):
+        self.behaviour = MockBehaviour(**behaviour)
+        self._server = _Server((host, port), _Handler)
+        self._server.behaviour = self.behaviour
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def serve_forever(self):
+        self._server.serve_forever()
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a local mock Azure OpenAI chat-completions server.")
+    parser.add_argument("--port", type=int, default=8799)
+    parser.add_argument("--latency-ms", type=float, default=200.0, help="Median response latency.")
+    parser.add_argument("--latency-sigma", type=float, default=0.5, help="Log-normal spread of the latency.")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with 429.")
+    parser.add_argument("--retry-after-ms", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--chunk-delay-ms", type=float, default=20.0, help="Gap between streamed chunks.")
+    parser.add_argument("--garbage-rate", type=float, default=0.0, help="Fraction of judge replies without a score.")
+    parser.add_argument("--slow-rate", type=float, default=0.0, help="Fraction of requests that take --slow-ms instead.")
+    parser.add_argument("--slow-ms", type=float, default=5000.0, help="Latency of the slow requests.")
+    cli_args = parser.parse_args()
+
+    server = MockAzureServer(
+        port=cli_args.port,
+        latency_ms=cli_args.latency_ms,
+        latency_sigma=cli_args.latency_sigma,
+        error_rate=cli_args.error_rate,
+        retry_after_ms=cli_args.retry_after_ms,
+        seed=cli_args.seed,
+        chunk_delay_ms=cli_args.chunk_delay_ms,
+        garbage_rate=cli_args.garbage_rate,
+        slow_rate=cli_args.slow_rate,
+        slow_ms=cli_args.slow_ms,
+    )
+    print(f"Mock Azure OpenAI listening on {server.url}", flush=True)
+    print(f"  export AZURE_OPENAI_ENDPOINT={server.url} AZURE_OPENAI_API_KEY=mock")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
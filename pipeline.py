@@ -0,0 +1,211 @@
+"""Bounded producer/consumer pipeline used by batch_runner.py.
+
+Items flow through a chain of stages. Each stage has its own worker count
+and bounded input queue, so a slow stage pushes back on the one before it
+and memory stays flat however many items are fed in. Each worker's time is
+split three ways:
+
+    busy     running the stage function
+    starved  waiting for input (the upstream stage is the bottleneck)
+    blocked  waiting for room downstream (the downstream stage is the bottleneck)
+
+Stage functions return the item for the next stage, or None to drop it. An
+item whose stage raises skips the remaining stages and reaches the caller
+as a StageError, so every item fed in is accounted for.
+"""
+import time
+import queue
+import asyncio
+import threading
+
+# Each queue holds this many items per consuming worker
+QUEUE_FACTOR = 2
+
+_DONE = object()
+
+
+class Stage:
+    def __init__(self, name, func, workers):
+        if workers < 1:
+            raise ValueError(f"stage '{name}' needs at least one worker")
+        self.name = name
+        self.func = func
+        self.workers = workers
+
+
+class StageStats:
+    """Per-stage totals; utilization is busy time over workers × wall time."""
+
+    def __init__(self, name, workers):
+        self.name = name
+        self.workers = workers
+        self.items = 0
+        self.errors = 0
+        self.busy = 0.0
+        self.starved = 0.0
+        self.blocked = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, busy=0.0, starved=0.0, blocked=0.0, items=0, errors=0):
+        with self._lock:
+            self.busy += busy
+            self.starved += starved
+            self.blocked += blocked
+            self.items += items
+            self.errors += errors
+
+    def row(self, wall):
+        capacity = max(self.workers * wall, 1e-9)
+        return {
+            "stage": self.name,
+            "workers": self.workers,
+            "items": self.items,
+            "errors": self.errors,
+            "busy": self.busy / capacity,
+            "starved": self.starved / capacity,
+            "blocked": self.blocked / capacity,
+        }
+
+
+class StageError:
+    """An item a stage raised on, handed to on_error instead of on_output."""
+
+    def __init__(self, stage, item, error):
+        self.stage = stage
+        self.item = item
+        self.error = error
+
+
+def _report_error(stage, item, error):
+    print(f"⚠️ {stage.name} stage dropped an item after an unexpected error: {error!r}")
+    return StageError(stage.name, item, error)
+
+
+def _deliver(result, on_output, on_error):
+    if isinstance(result, StageError):
+        if on_error is not None:
+            on_error(result)
+    else:
+        on_output(result)
+
+
+# --- THREADS ---
+def run_pipeline(items, stages, on_output, on_error=None):
+    """Runs items through stages on worker threads; on_output and on_error run on the calling thread.
+
+    Returns one StageStats per stage.
+    """
+    stats = [StageStats(s.name, s.workers) for s in stages]
+    queues = [queue.Queue(maxsize=QUEUE_FACTOR * s.workers) for s in stages]
+    # Results are handed to the calling thread through a bounded queue as well
+    queues.append(queue.Queue(maxsize=QUEUE_FACTOR * stages[-1].workers))
+    consumers = [s.workers for s in stages] + [1]
+    remaining = [s.workers for s in stages]
+    remaining_lock = threading.Lock()
+
+    def feed():
+        for item in items:
+            queues[0].put(item)
+        for _ in range(consumers[0]):
+            queues[0].put(_DONE)
+
+    def work(index):
+        stage, inbox, outbox, st = stages[index], queues[index], queues[index + 1], stats[index]
+        while True:
+            waited = time.perf_counter()
+            item = inbox.get()
+            started = time.perf_counter()
+            st.add(starved=started - waited)
+            if item is _DONE:
+                break
+            try:
+                result = stage.func(item)
+            except Exception as e:
+                st.add(busy=time.perf_counter() - started, items=1, errors=1)
+                # Straight to the caller: the later stages have nothing to work on
+                queues[-1].put(_report_error(stage, item, e))
+                continue
+            finished = time.perf_counter()
+            if result is not None:
+                outbox.put(result)
+            st.add(busy=finished - started, blocked=time.perf_counter() - finished, items=1)
+
+        # The last worker out tells every consumer of the next queue to stop
+        with remaining_lock:
+            remaining[index] -= 1
+            last = remaining[index] == 0
+        if last:
+            for _ in range(consumers[index + 1]):
+                outbox.put(_DONE)
+
+    threads = [threading.Thread(target=feed, daemon=True)]
+    for index, stage in enumerate(stages):
+        threads += [threading.Thread(target=work, args=(index,), daemon=True) for _ in range(stage.workers)]
+    for t in threads:
+        t.start()
+
+    while True:
+        result = queues[-1].get()
+        if result is _DONE:
+            break
+        _deliver(result, on_output, on_error)
+    for t in threads:
+        t.join()
+    return stats
+
+
+# --- ASYNCIO ---
+async def arun_pipeline(items, stages, on_output, on_error=None):
+    """Async twin of run_pipeline: stage functions are coroutines, workers are tasks."""
+    stats = [StageStats(s.name, s.workers) for s in stages]
+    queues = [asyncio.Queue(maxsize=QUEUE_FACTOR * s.workers) for s in stages]
+    queues.append(asyncio.Queue(maxsize=QUEUE_FACTOR * stages[-1].workers))
+    consumers = [s.workers for s in stages] + [1]
+    remaining = [s.workers for s in stages]
+
+    async def feed():
+        for item in items:
+            await queues[0].put(item)
+        for _ in range(consumers[0]):
+            await queues[0].put(_DONE)
+
+    async def work(index):
+        stage, inbox, outbox, st = stages[index], queues[index], queues[index + 1], stats[index]
+        while True:
+            waited = time.perf_counter()
+            item = await inbox.get()
+            started = time.perf_counter()
+            st.add(starved=started - waited)
+            if item is _DONE:
+                break
+            try:
+                result = await stage.func(item)
+            except Exception as e:
+                st.add(busy=time.perf_counter() - started, items=1, errors=1)
+                await queues[-1].put(_report_error(stage, item, e))
+                continue
+            finished = time.perf_counter()
+            if result is not None:
+                await outbox.put(result)
+            st.add(busy=finished - started, blocked=time.perf_counter() - finished, items=1)
+
+        remaining[index] -= 1
+        if remaining[index] == 0:
+            for _ in range(consumers[index + 1]):
+                await outbox.put(_DONE)
+
+    tasks = [asyncio.ensure_future(feed())]
+    for index, stage in enumerate(stages):
+        tasks += [asyncio.ensure_future(work(index)) for _ in range(stage.workers)]
+
+    try:
+        while True:
+            result = await queues[-1].get()
+            if result is _DONE:
+                break
+            _deliver(result, on_output, on_error)
+        await asyncio.gather(*tasks)
+    finally:
+        for t in tasks:
+            t.cancel()
+    return stats
@@ -0,0 +1,104 @@
+"""Post-processing of model output before it is shown, judged or stored.
+
+Rewrites and synthesized emails come back with email scaffolding the app
+does not want: subject lines, salutations, sign-offs, "[Your Name]"
+placeholders and stray fragments. clean_body removes them in one pass over
+the lines, using patterns compiled at import; which rules apply is set per
+action in ACTION_RULES.
+
+With keep_urls, bracketed text that carries a link survives (markdown links
+"[text](url)" and bracketed URLs), as do short lines that are just a URL, so
+the url_preservation judge sees what the model wrote. LEGACY_RULES reproduce
+the original behaviour, which dropped every bracketed span.
+"""
+import re
+
+SALUTATIONS = (
+    "subject:", "dear", "to:", "from:", "hi ", "hello ", "greetings",
+    "regards", "best regards", "sincerely", "best,", "cheers",
+    "thank you", "thanks,", "yours truly", "warm regards",
+)
+TERMINAL_PUNCTUATION = (".", "!", "?")
+
+_URL = re.compile(r"https?://|www\.", re.IGNORECASE)
+_ANY_BRACKETS = re.compile(r"\[.*?\]")
+# After the "[", alternatives are tried left to right: links first, so only plain
+# placeholders are left to drop. The literal "[" leads the whole pattern so the regex
+# engine can jump from bracket to bracket instead of trying every alternative at
+# every character, which made the link-keeping pass the slowest part of clean_body.
+_BRACKETS = re.compile(
+    r"\[(?:[^\]\n]*\]\([^)\n]*\)"
+    r"|[^\]\n]*?(?:https?://|www\.)[^\]\n]*\]"
+    r"|(?P<placeholder>[^\]\n]*\]))",
+    re.IGNORECASE,
+)
+
+
+def _keep_links(match):
+    return "" if match.lastgroup else match.group(0)
+
+
+class CleanRules:
+    """What clean_body removes.
+
+    Lines with at most max_salutation_words words that start like a greeting
+    or sign-off are dropped, as are lines with at most max_fragment_words
+    words and no closing punctuation (a name under "Best,"), and blank lines.
+    """
+
+    def __init__(self, strip_placeholders=True, keep_urls=True, drop_salutations=True,
+                 max_salutation_words=9, drop_fragments=True, max_fragment_words=3):
+        self.strip_placeholders = strip_placeholders
+        self.keep_urls = keep_urls
+        self.drop_salutations = drop_salutations
+        self.max_salutation_words = max_salutation_words
+        self.drop_fragments = drop_fragments
+        self.max_fragment_words = max_fragment_words
+
+
+DEFAULT_RULES = CleanRules()
+LEGACY_RULES = CleanRules(keep_urls=False)
+
+# Keyed by generate action, plus "synthesis" for generated dataset emails
+ACTION_RULES = {
+    "shorten": DEFAULT_RULES,
+    "lengthen": DEFAULT_RULES,
+    "tone": DEFAULT_RULES,
+    "synthesis": DEFAULT_RULES,
+}
+
+
+def rules_for(action):
+    return ACTION_RULES.get(action, DEFAULT_RULES)
+
+
+def clean_body(text, action=None, rules=None):
+    """Strips email scaffolding from model output; returns the input if nothing would be left."""
+    rules = rules or rules_for(action)
+    if rules.strip_placeholders and "[" in text:
+        if rules.keep_urls:
+            text = _BRACKETS.sub(_keep_links, text)
+        else:
+            text = _ANY_BRACKETS.sub("", text)
+
+    max_salutation = rules.max_salutation_words if rules.drop_salutations else 0
+    max_fragment = rules.max_fragment_words if rules.drop_fragments else 0
+    # Only short lines can be dropped, so splitting stops after this many words
+    max_words = max(max_salutation, max_fragment)
+    keep_urls = rules.keep_urls
+
+    cleaned = []
+    for line in text.splitlines():
+        words = len(line.split(None, max_words)) if max_words else len(line.split(None, 1))
+        if not words:
+            continue
+        if words <= max_words:
+            s_line = line.strip().lower()
+            if words <= max_salutation and s_line.startswith(SALUTATIONS):
+                continue
+            if words <= max_fragment and not s_line.endswith(TERMINAL_PUNCTUATION) \
+                    and not (keep_urls and _URL.search(s_line)):
+                continue
+        cleaned.append(line)
+    result = "\n".join(cleaned).strip()
+    return result if result else text
@@ -0,0 +1,211 @@
+"""Precompiled prompts.yaml templates with hot reload.
+
+Each entry is parsed once into literal text and placeholder pieces, so a
+render is a single join and a template with unbalanced braces or an
+unsupported field fails at load time instead of mid-request. Static parts of
+the messages (system prompts, the "email" -> "paragraph" wording of the
+rewrite prompts) are applied once per load too.
+
+When prompts.yaml changes on disk the registry swaps in a new PromptSet on
+the next lookup. A PromptSet never changes after it is built, so a batch run
+that holds one (via snapshot()) keeps its prompts for the whole run.
+"""
+import os
+import json
+import time
+import string
+import hashlib
+import threading
+
+PROMPTS_PATH = "prompts.yaml"
+
+# Rewrite prompts talk about "emails", but the app rewrites single paragraphs
+REWRITE_PROMPTS = ("shorten", "lengthen", "tone")
+
+REWRITE_SYSTEM = (
+    "You are a professional writing assistant.\n"
+    "Rules:\n"
+    "- Output ONLY the rewritten paragraph content.\n"
+    "- Return plain text only."
+)
+JUDGE_SYSTEM = "You are an AI quality judge. Evaluate the text objectively with decimal precision."
+SYNTHESIS_SYSTEM = "You are a data generator. Output valid JSON only. Do not use Markdown formatting."
+
+# Appended to a metric rubric when the judge is asked for a structured reply
+STRUCTURED_SCORE_FORMAT = (
+    '\n\nIgnore the "Format:" line above. Output ONE JSON object only: '
+    '{"score": <number 0.00 - 5.00, 2 decimal precision>, "reason": "<the explanation>"}'
+)
+
+# A "system" key in prompts.yaml overrides these; anything unlisted is a metric rubric
+SYSTEM_PROMPTS = {
+    **{name: REWRITE_SYSTEM for name in REWRITE_PROMPTS},
+    "multi_metric_judge": JUDGE_SYSTEM + " Output valid JSON only.",
+    "data_synthesis": SYNTHESIS_SYSTEM,
+    "challenge_synthesis": SYNTHESIS_SYSTEM,
+    "adversarial_synthesis": SYNTHESIS_SYSTEM,
+}
+
+_formatter = string.Formatter()
+
+
+class PromptTemplate:
+    """One prompts.yaml entry: precompiled user template plus its system prompt."""
+
+    def __init__(self, name, text, system=None, rewrite=False):
+        self.name = name
+        self.system = system
+        # Changes whenever this entry's wording does, and only then (see fingerprints.py)
+        self.fingerprint = hashlib.sha256(json.dumps([system, text, rewrite]).encode("utf-8")).hexdigest()[:16]
+        self._parts = []
+        placeholders = []
+        try:
+            parsed = list(_formatter.parse(text))
+        except ValueError as e:
+            raise ValueError(f"Prompt '{name}': {e}") from None
+
+        for literal, field, spec, conversion in parsed:
+            if rewrite:
+                # Only the prompt wording changes; the user's text is filled in later
+                literal = literal.replace("email", "paragraph")
+            if field is not None and (not field.isidentifier() or spec or conversion):
+                raise ValueError(f"Prompt '{name}': unsupported placeholder '{{{field}}}'")
+            self._parts.append((literal, field))
+            if field is not None and field not in placeholders:
+                placeholders.append(field)
+        self.placeholders = tuple(placeholders)
+
+    def render(self, **kwargs):
+        missing = [p for p in self.placeholders if p not in kwargs]
+        if missing:
+            raise KeyError(f"Prompt '{self.name}' is missing placeholders: {', '.join(missing)}")
+        return "".join(
+            literal if field is None else literal + str(kwargs[field])
+            for literal, field in self._parts
+        )
+
+    def messages(self, **kwargs):
+        user = {"role": "user", "content": self.render(**kwargs)}
+        if not self.system:
+            return [user]
+        return [{"role": "system", "content": self.system}, user]
+
+
+class PromptSet:
+    """Immutable set of templates from one load of prompts.yaml."""
+
+    def __init__(self, templates, version):
+        self._templates = templates
+        self.version = version
+
+    def get(self, name):
+        return self._templates.get(name)
+
+    def snapshot(self):
+        # Already frozen; lets callers treat a PromptSet and the registry alike
+        return self
+
+    def names(self):
+        return list(self._templates)
+
+    def __contains__(self, name):
+        return name in self._templates
+
+
+def compile_prompts(raw, version=None):
+    """Builds a PromptSet from parsed YAML, raising ValueError on any bad entry."""
+    if raw is None:
+        raw = {}
+    if not isinstance(raw, dict):
+        raise ValueError("prompts.yaml must be a mapping of prompt names")
+
+    templates = {}
+    for name, entry in raw.items():
+        if not isinstance(entry, dict) or not isinstance(entry.get("user"), str):
+            raise ValueError(f"Prompt '{name}' needs a 'user' template string")
+        templates[name] = PromptTemplate(
+            name,
+            entry["user"],
+            system=entry.get("system", SYSTEM_PROMPTS.get(name, JUDGE_SYSTEM)),
+            rewrite=name in REWRITE_PROMPTS,
+        )
+    return PromptSet(templates, version)
+
+
+class PromptRegistry:
+    """Serves the current PromptSet, reloading prompts.yaml when its mtime or size changes."""
+
+    def __init__(self, path=PROMPTS_PATH, check_interval=1.0):
+        self.path = path
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._signature = None
+        self._checked = 0.0
+        self._current = PromptSet({}, None)
+        self._reload(initial=True)
+
+    def _file_signature(self):
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return (st.st_mtime_ns, st.st_size)
+
+    def _reload(self, initial=False):
+        signature = self._file_signature()
+        if signature == self._signature:
+            return
+        if signature is None:
+            # Same as before the registry existed: no file, no prompts
+            self._current = PromptSet({}, None)
+            self._signature = None
+            return
+
+        # Imported on first load; entry points that never render a prompt skip it
+        import yaml
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                prompt_set = compile_prompts(yaml.safe_load(f), version=signature[0])
+        except (yaml.YAMLError, ValueError) as e:
+            if initial:
+                raise
+            # Keep serving the last good prompts while the file is mid-edit or broken
+            print(f"⚠️ Ignoring invalid {self.path}: {e}")
+            self._signature = signature
+            return
+
+        self._current = prompt_set
+        self._signature = signature
+        if not initial:
+            print(f"🔄 Reloaded {self.path} ({len(prompt_set.names())} prompts)")
+
+    def _maybe_reload(self):
+        now = time.monotonic()
+        if now - self._checked < self.check_interval:
+            return
+        with self._lock:
+            if now - self._checked < self.check_interval:
+                return
+            self._checked = now
+            self._reload()
+
+    def snapshot(self):
+        """The current PromptSet; it stays the same even if prompts.yaml is edited later."""
+        self._maybe_reload()
+        return self._current
+
+    def get(self, name):
+        return self.snapshot().get(name)
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_prompt_registry():
+    """Returns the shared registry for prompts.yaml, loading it on first use."""
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = PromptRegistry()
+        return _registry
@@ -0,0 +1,183 @@
+import time
+import random
+import asyncio
+import threading
+from collections import deque
+from email.utils import parsedate_to_datetime
+
+WINDOW_SECONDS = 60.0
+
+
+def backoff_delay(attempt, base=1.0, cap=60.0):
+    """Full-jitter exponential backoff: uniform(0, min(cap, base * 2**attempt))."""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+def parse_retry_after(headers):
+    """Seconds the server asked us to wait, from retry-after-ms / retry-after headers."""
+    if not headers:
+        return None
+    value = headers.get("retry-after-ms")
+    if value:
+        try:
+            return float(value) / 1000.0
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        # HTTP-date form
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def _header_int(headers, name):
+    try:
+        return int(headers.get(name))
+    except (TypeError, ValueError):
+        return None
+
+
+class AdaptiveRateLimiter:
+    """Client-side pacing for one deployment.
+
+    Tracks requests and estimated tokens over a sliding one-minute window and
+    keeps an AIMD concurrency window: +1 slot per window of successes, halved
+    on every 429. Retry-After pauses every caller, not just the one throttled.
+    """
+
+    def __init__(self, rpm=None, tpm=None, max_concurrency=64, min_concurrency=1):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.window = float(max_concurrency)
+        self.in_flight = 0
+        self.successes = 0
+        self.throttles = 0
+        self._requests = deque()
+        self._tokens = deque()
+        self._token_total = 0
+        self._blocked_until = 0.0
+        self._last_decrease = 0.0
+        self._lock = threading.Lock()
+        self._released = threading.Condition(self._lock)
+
+    def configure(self, rpm=None, tpm=None, max_concurrency=None):
+        with self._lock:
+            if rpm is not None:
+                self.rpm = rpm
+            if tpm is not None:
+                self.tpm = tpm
+            if max_concurrency is not None:
+                self.max_concurrency = max_concurrency
+                self.window = min(self.window, float(max_concurrency))
+
+    def _prune(self, now):
+        cutoff = now - WINDOW_SECONDS
+        while self._requests and self._requests[0] <= cutoff:
+            self._requests.popleft()
+        while self._tokens and self._tokens[0][0] <= cutoff:
+            self._token_total -= self._tokens.popleft()[1]
+
+    def try_acquire(self, est_tokens):
+        """Reserves a request slot; returns 0.0 on success or seconds to wait first."""
+        with self._lock:
+            now = time.monotonic()
+            self._prune(now)
+            if now < self._blocked_until:
+                return self._blocked_until - now
+            if self.in_flight >= max(self.min_concurrency, int(self.window)):
+                return 0.05
+            if self.rpm and len(self._requests) >= self.rpm:
+                return self._requests[0] + WINDOW_SECONDS - now
+            # A single oversized request may go when the window is empty
+            if self.tpm and self._token_total and self._token_total + est_tokens > self.tpm:
+                return self._tokens[0][0] + WINDOW_SECONDS - now
+            self.in_flight += 1
+            self._requests.append(now)
+            self._tokens.append((now, est_tokens))
+            self._token_total += est_tokens
+            return 0.0
+
+    def acquire(self, est_tokens):
+        while True:
+            wait = self.try_acquire(est_tokens)
+            if wait <= 0:
+                return
+            with self._released:
+                self._released.wait(timeout=min(wait, 1.0))
+
+    async def aacquire(self, est_tokens):
+        while True:
+            wait = self.try_acquire(est_tokens)
+            if wait <= 0:
+                return
+            await asyncio.sleep(min(wait, 1.0))
+
+    def release(self, est_tokens, used_tokens):
+        with self._lock:
+            self.in_flight -= 1
+            # Correct the window with the real usage once it is known
+            if used_tokens != est_tokens:
+                self._tokens.append((time.monotonic(), used_tokens - est_tokens))
+                self._token_total += used_tokens - est_tokens
+            self._released.notify_all()
+
+    def on_success(self, headers=None):
+        with self._lock:
+            self.successes += 1
+            # Additive increase: roughly one extra slot per window's worth of successes
+            self.window = min(float(self.max_concurrency), self.window + 1.0 / max(self.window, 1.0))
+            if not headers:
+                return
+            if self.rpm is None:
+                self.rpm = _header_int(headers, "x-ratelimit-limit-requests")
+            if self.tpm is None:
+                self.tpm = _header_int(headers, "x-ratelimit-limit-tokens")
+            remaining_requests = _header_int(headers, "x-ratelimit-remaining-requests")
+            remaining_tokens = _header_int(headers, "x-ratelimit-remaining-tokens")
+            if remaining_requests == 0 or remaining_tokens == 0:
+                # Quota is exhausted for now; pause briefly instead of earning a 429
+                self._blocked_until = max(self._blocked_until, time.monotonic() + 1.0)
+
+    def on_throttle(self, retry_after=None):
+        with self._lock:
+            self.throttles += 1
+            now = time.monotonic()
+            # Multiplicative decrease, once per burst: a wave of 429s from requests
+            # that were already in flight should not collapse the window to 1
+            if now - self._last_decrease > 1.0:
+                self.window = max(float(self.min_concurrency), self.window / 2.0)
+                self._last_decrease = now
+            pause = retry_after if retry_after is not None else backoff_delay(1)
+            self._blocked_until = max(self._blocked_until, now + pause)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "window": round(self.window, 2),
+                "in_flight": self.in_flight,
+                "successes": self.successes,
+                "throttles": self.throttles,
+                "rpm": self.rpm,
+                "tpm": self.tpm,
+            }
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(deployment):
+    """Returns the shared limiter for a deployment, creating it on first use."""
+    with _limiters_lock:
+        if deployment not in _limiters:
+            _limiters[deployment] = AdaptiveRateLimiter()
+        return _limiters[deployment]
@@ -0,0 +1,121 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+
+DEFAULT_CACHE_PATH = os.path.join(".cache", "responses.sqlite")
+DEFAULT_MAX_MB = 256
+
+
+class ResponseCache:
+    """Disk-backed cache of chat completions keyed by a hash of the request.
+
+    Entries live in a single SQLite table. When the stored text grows past
+    ``max_bytes`` the least recently read entries are evicted first.
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_bytes=DEFAULT_MAX_MB * 1024 * 1024):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " key TEXT PRIMARY KEY,"
+            " value TEXT NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " last_access REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_last_access ON responses(last_access)")
+        self._conn.commit()
+        self._total_bytes = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    @staticmethod
+    def make_key(deployment, temperature, messages, **params):
+        """Hashes everything that determines the completion into a stable key."""
+        payload = json.dumps(
+            {"deployment": deployment, "temperature": temperature, "messages": messages, **params},
+            sort_keys=True,
+            ensure_ascii=False,
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (time.time(), key))
+            self._conn.commit()
+            return row[0]
+
+    def put(self, key, value):
+        size = len(value.encode("utf-8"))
+        with self._lock:
+            old = self._conn.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, value, size, last_access) VALUES (?, ?, ?, ?)",
+                (key, value, size, time.time()),
+            )
+            self._total_bytes += size - (old[0] if old else 0)
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        # Trim to 90% so a full cache doesn't evict on every single insert
+        target = int(self.max_bytes * 0.9)
+        rows = self._conn.execute("SELECT key, size FROM responses ORDER BY last_access ASC")
+        doomed = []
+        for key, size in rows:
+            if self._total_bytes <= target:
+                break
+            doomed.append((key,))
+            self._total_bytes -= size
+        self._conn.executemany("DELETE FROM responses WHERE key = ?", doomed)
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+            self._conn.commit()
+            self._total_bytes = 0
+
+    def stats(self):
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": entries,
+                "bytes": self._total_bytes,
+            }
+
+
+_shared_cache = None
+_shared_lock = threading.Lock()
+
+
+def get_response_cache():
+    """Returns the process-wide cache, or None when RESPONSE_CACHE=0."""
+    global _shared_cache
+    if os.getenv("RESPONSE_CACHE", "1").lower() in ("0", "false", "off"):
+        return None
+    with _shared_lock:
+        if _shared_cache is None:
+            _shared_cache = ResponseCache(
+                path=os.getenv("RESPONSE_CACHE_PATH", DEFAULT_CACHE_PATH),
+                max_bytes=int(float(os.getenv("RESPONSE_CACHE_MAX_MB", DEFAULT_MAX_MB)) * 1024 * 1024),
+            )
+        return _shared_cache
@@ -0,0 +1,63 @@
+import os
+import json
+import threading
+
+DEFAULT_RESULTS_PATH = os.path.join("results", "batch_results.jsonl")
+
+
+def unit_key(config, filename, entry_id):
+    """Identifies one (config, file, entry) work unit across runs."""
+    return f"{config}|{filename}|{entry_id}"
+
+
+def read_results(path):
+    """Streams the records of a results file without opening it for writing."""
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                # A line cut short by a crash is simply redone on resume
+                continue
+
+
+class ResultsStore:
+    """Append-only JSONL log of per-item batch results.
+
+    Every record is written and flushed as soon as it completes, so a crash or
+    Ctrl-C loses at most the items that were still in flight.
+    """
+
+    def __init__(self, path=DEFAULT_RESULTS_PATH, resume=False):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        # A fresh run starts a new log; --resume keeps appending to the old one
+        self._file = open(path, "a" if resume else "w", encoding="utf-8")
+        if resume and self._file.tell() > 0:
+            with open(path, "rb") as f:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b"\n":
+                    # Terminate a line cut short by a crash so new records stay parseable
+                    self._file.write("\n")
+
+    def append(self, record):
+        line = json.dumps(record, ensure_ascii=False)
+        with self._lock:
+            self._file.write(line + "\n")
+            self._file.flush()
+
+    def __iter__(self):
+        """Streams stored records without loading the whole file."""
+        with self._lock:
+            self._file.flush()
+        yield from read_results(self.path)
+
+    def completed_keys(self):
+        return {unit_key(r["config"], r["file"], r["id"]) for r in self}
+
+    def close(self):
+        with self._lock:
+            self._file.close()
@@ -0,0 +1,232 @@
+"""Columnar view of batch results: one row per (config, file, id, metric) score.
+
+The table is built from the JSONL results store, written as Parquet, and
+summarised with vectorized groupbys instead of Python loops, so a run with
+millions of score rows aggregates in milliseconds. Two Parquet files from
+different runs can be diffed per group or per item.
+
+    python results_table.py export results/batch_results.jsonl
+    python results_table.py report results/batch_results.parquet --by config metric
+    python results_table.py diff old.parquet new.parquet
+"""
+import os
+import argparse
+import numpy as np
+import pandas as pd
+
+# Scores below this count as a failure, matching the edge-case cut-off of the report
+FAILURE_THRESHOLD = 3.0
+GROUP_BY = ("config", "file", "metric")
+ITEM_KEY = ["config", "file", "id"]
+QUANTILES = {"p05": 0.05, "p50": 0.5, "p95": 0.95}
+
+
+def scores_frame(records):
+    """Builds the long score table from result records (e.g. a ResultsStore)."""
+    configs, files, ids, metrics, scores = [], [], [], [], []
+    for rec in records:
+        for metric, score in rec["scores"].items():
+            configs.append(rec["config"])
+            files.append(rec["file"])
+            ids.append(rec["id"])
+            metrics.append(metric)
+            scores.append(score)
+
+    id_column = pd.Series(ids)
+    if id_column.dtype == object:
+        # Parquet needs one type per column; mixed ids are compared as text
+        id_column = id_column.astype(str)
+    return pd.DataFrame({
+        "config": pd.Categorical(configs),
+        "file": pd.Categorical(files),
+        "id": id_column,
+        "metric": pd.Categorical(metrics),
+        # Missing scores become NaN and are left out of means and failure rates
+        "score": np.asarray(scores, dtype="float64"),
+    })
+
+
+def write_parquet(df, path):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    df.to_parquet(path, index=False)
+    return path
+
+
+def read_parquet(path):
+    return pd.read_parquet(path)
+
+
+def parquet_path(results_path):
+    """results/batch_results.jsonl -> results/batch_results.parquet"""
+    return os.path.splitext(results_path)[0] + ".parquet"
+
+
+# Judge scores are X.XX on a 0-5 scale, so 0.01-wide histogram bins hold exact values
+SCORE_RESOLUTION = 100
+MAX_SCORE = 5.0
+
+
+def _group_codes(df, by):
+    """One integer per row for its combination of the by columns, plus each column's levels."""
+    codes = np.zeros(len(df), dtype=np.int64)
+    levels = []
+    for column in by:
+        values = df[column]
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            column_codes, column_levels = values.cat.codes.to_numpy(), values.cat.categories
+        else:
+            column_codes, column_levels = pd.factorize(values, sort=True)
+        codes = codes * len(column_levels) + column_codes
+        levels.append(column_levels)
+    return codes, levels
+
+
+def aggregate(df, by=GROUP_BY, threshold=FAILURE_THRESHOLD):
+    """count, mean, std, min, percentiles, max and failure rate of the scores per group.
+
+    Everything comes from bincounts over one group code per row; percentiles
+    are read off per-group score histograms, so nothing is sorted.
+    """
+    by = list(by)
+    codes, levels = _group_codes(df, by)
+    n_groups = int(np.prod([len(level) for level in levels]))
+    present = np.flatnonzero(np.bincount(codes, minlength=n_groups))
+
+    scores = df["score"].to_numpy(dtype="float64")
+    scored = ~np.isnan(scores)
+    codes, scores = codes[scored], scores[scored]
+
+    count = np.bincount(codes, minlength=n_groups)[present]
+    total = np.bincount(codes, weights=scores, minlength=n_groups)[present]
+    squares = np.bincount(codes, weights=scores * scores, minlength=n_groups)[present]
+    failed = np.bincount(codes, weights=scores < threshold, minlength=n_groups)[present]
+    lowest = np.full(n_groups, np.inf)
+    highest = np.full(n_groups, -np.inf)
+    np.minimum.at(lowest, codes, scores)
+    np.maximum.at(highest, codes, scores)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = total / count
+        std = np.sqrt(np.maximum(squares - total * mean, 0.0) / (count - 1))
+        std[count < 2] = np.nan
+        table = {
+            "count": count,
+            "mean": mean,
+            "std": std,
+            "min": np.where(count > 0, lowest[present], np.nan),
+        }
+
+        n_bins = int(MAX_SCORE * SCORE_RESOLUTION) + 1
+        bins = np.clip(np.rint(scores * SCORE_RESOLUTION), 0, n_bins - 1).astype(np.int64)
+        cumulative = np.bincount(codes * n_bins + bins, minlength=n_groups * n_bins) \
+            .reshape(n_groups, n_bins)[present].cumsum(axis=1)
+
+        def value_at(rank):
+            # Score of the rank-th smallest value (0-based) in each group
+            return (cumulative <= rank[:, None]).sum(axis=1) / SCORE_RESOLUTION
+
+        for name, q in QUANTILES.items():
+            # Linear interpolation between neighbouring ranks, like pandas' quantile
+            position = q * (count - 1)
+            below, above = value_at(np.floor(position)), value_at(np.ceil(position))
+            table[name] = np.where(count > 0, below + (above - below) * (position - np.floor(position)), np.nan)
+
+        table["max"] = np.where(count > 0, highest[present], np.nan)
+        table["failure_rate"] = failed / count
+
+    keys = np.unravel_index(present, [len(level) for level in levels])
+    columns = {column: np.asarray(level)[key] for column, level, key in zip(by, levels, keys)}
+    return pd.DataFrame({**columns, **table})
+
+
+def item_count(df):
+    codes, _ = _group_codes(df, ITEM_KEY)
+    return len(pd.unique(codes))
+
+
+def worst_items(df, n=3, threshold=FAILURE_THRESHOLD):
+    """The n items with the lowest score below the threshold, plus how many items failed at all."""
+    failing = df[df["score"] < threshold]
+    if failing.empty:
+        return [], 0
+    codes, _ = _group_codes(failing, ITEM_KEY)
+    item_of_row, _ = pd.factorize(codes)
+    lowest = np.full(item_of_row.max() + 1, np.inf)
+    np.minimum.at(lowest, item_of_row, failing["score"].to_numpy())
+
+    worst = []
+    for item in np.argsort(lowest, kind="stable")[:n]:
+        rows = failing[item_of_row == item]
+        first = rows.iloc[0]
+        worst.append({
+            "config": first["config"],
+            "file": first["file"],
+            "id": first["id"],
+            "lowest": float(lowest[item]),
+            "failures": sorted(map(str, rows["metric"])),
+        })
+    return worst, len(lowest)
+
+
+def diff_runs(old, new, by=GROUP_BY, threshold=FAILURE_THRESHOLD):
+    """Per-group change in mean and failure rate between two runs, biggest moves first."""
+    keys = list(by)
+    merged = aggregate(old, by, threshold).merge(
+        aggregate(new, by, threshold), on=keys, how="outer", suffixes=("_old", "_new")
+    )
+    merged["mean_delta"] = merged["mean_new"] - merged["mean_old"]
+    merged["failure_rate_delta"] = merged["failure_rate_new"] - merged["failure_rate_old"]
+    columns = keys + ["count_old", "count_new", "mean_old", "mean_new", "mean_delta",
+                      "failure_rate_old", "failure_rate_new", "failure_rate_delta"]
+    return merged[columns].sort_values("mean_delta", key=lambda s: s.abs(), ascending=False, na_position="last")
+
+
+def diff_items(old, new):
+    """Per-item score changes for the items and metrics both runs scored."""
+    keys = ITEM_KEY + ["metric"]
+    # Categories differ between files, so join on plain strings
+    left = old.astype({c: str for c in ("config", "file", "metric")})
+    right = new.astype({c: str for c in ("config", "file", "metric")})
+    paired = left.merge(right, on=keys, suffixes=("_old", "_new"))
+    paired["delta"] = paired["score_new"] - paired["score_old"]
+    return paired[paired["delta"] != 0].sort_values("delta", key=lambda s: s.abs(), ascending=False)
+
+
+def _print_frame(df):
+    with pd.option_context("display.max_rows", None, "display.width", 160, "display.float_format", "{:.3f}".format):
+        print(df.to_string(index=False))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export, summarise and diff batch results as a columnar table.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    export = sub.add_parser("export", help="Convert a JSONL results store to Parquet.")
+    export.add_argument("results", help="JSONL results file written by batch_runner.py.")
+    export.add_argument("--output", help="Parquet path (default: next to the results file).")
+
+    report = sub.add_parser("report", help="Print grouped statistics for one run.")
+    report.add_argument("parquet")
+    report.add_argument("--by", nargs="+", default=list(GROUP_BY), choices=["config", "file", "metric"])
+
+    diff = sub.add_parser("diff", help="Compare two runs.")
+    diff.add_argument("old")
+    diff.add_argument("new")
+    diff.add_argument("--by", nargs="+", default=list(GROUP_BY), choices=["config", "file", "metric"])
+    diff.add_argument("--items", type=int, default=10, help="Also list this many of the biggest per-item changes.")
+    cli_args = parser.parse_args()
+
+    if cli_args.command == "export":
+        from results_store import read_results
+
+        df = scores_frame(read_results(cli_args.results))
+        path = write_parquet(df, cli_args.output or parquet_path(cli_args.results))
+        print(f"Saved {len(df)} score rows ({item_count(df)} items) to {path}")
+    elif cli_args.command == "report":
+        _print_frame(aggregate(read_parquet(cli_args.parquet), cli_args.by))
+    else:
+        old, new = read_parquet(cli_args.old), read_parquet(cli_args.new)
+        _print_frame(diff_runs(old, new, cli_args.by))
+        if cli_args.items:
+            print(f"\nBiggest per-item changes (of {len(diff_items(old, new))} that moved):")
+            _print_frame(diff_items(old, new).head(cli_args.items))
@@ -0,0 +1,128 @@
+"""Per-call telemetry for GenerateEmail API calls.
+
+Every finished call (including cache hits and calls that ended in an error)
+is emitted as one flat dict to each registered sink:
+
+    {"ts", "deployment", "action", "key", "prompt_tokens", "completion_tokens",
+     "latency_s", "ttft_s", "retries", "cache_hit", "error"}
+
+"ttft_s" (time to first token) is only set for streamed calls.
+
+"action" is the kind of call (generate / evaluate / evaluate_all / synthesize)
+and "key" the prompts.yaml entry it used (rewrite action or metric name).
+"""
+import json
+import time
+import threading
+
+_sinks = []
+_sinks_lock = threading.Lock()
+
+
+def add_sink(sink):
+    with _sinks_lock:
+        _sinks.append(sink)
+    return sink
+
+
+def remove_sink(sink):
+    with _sinks_lock:
+        if sink in _sinks:
+            _sinks.remove(sink)
+
+
+def has_sinks():
+    return bool(_sinks)
+
+
+def emit(record):
+    for sink in list(_sinks):
+        sink.emit(record)
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+class JsonlSink:
+    """Appends every call record to a JSONL file."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = open(path, "a", encoding="utf-8")
+
+    def emit(self, record):
+        line = json.dumps(record)
+        with self._lock:
+            self._file.write(line + "\n")
+            self._file.flush()
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+class MemoryAggregator:
+    """Keeps call records in memory and summarises them by any record fields."""
+
+    def __init__(self):
+        self.records = []
+        self._lock = threading.Lock()
+
+    def emit(self, record):
+        with self._lock:
+            self.records.append(record)
+
+    def latencies(self):
+        with self._lock:
+            return [r["latency_s"] for r in self.records if not r["cache_hit"]]
+
+    def summary(self, group_by=("action", "key")):
+        """Returns one row per group with call counts, latency percentiles and token totals."""
+        with self._lock:
+            records = list(self.records)
+
+        groups = {}
+        for r in records:
+            groups.setdefault(tuple(r[f] for f in group_by), []).append(r)
+
+        rows = []
+        for group, items in sorted(groups.items(), key=lambda kv: tuple(str(k) for k in kv[0])):
+            # Cache hits would drag the percentiles towards zero, so only real calls count
+            live = [r["latency_s"] for r in items if not r["cache_hit"]]
+            rows.append({
+                **dict(zip(group_by, group)),
+                "calls": len(items),
+                "cache_hits": sum(r["cache_hit"] for r in items),
+                "errors": sum(r["error"] is not None for r in items),
+                "retries": sum(r["retries"] for r in items),
+                "p50_s": percentile(live, 50),
+                "p95_s": percentile(live, 95),
+                "p99_s": percentile(live, 99),
+                "prompt_tokens": sum(r["prompt_tokens"] for r in items),
+                "completion_tokens": sum(r["completion_tokens"] for r in items),
+            })
+        return rows
+
+
+def make_record(deployment, tag, latency_s, prompt_tokens=0, completion_tokens=0, retries=0,
+                cache_hit=False, error=None, ttft_s=None):
+    action, key = tag if tag else ("call", None)
+    return {
+        "ts": time.time(),
+        "deployment": deployment,
+        "action": action,
+        "key": key,
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "latency_s": round(latency_s, 4),
+        "ttft_s": round(ttft_s, 4) if ttft_s is not None else None,
+        "retries": retries,
+        "cache_hit": cache_hit,
+        "error": error,
+    }
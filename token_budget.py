@@ -0,0 +1,137 @@
+"""Local token counting and paragraph chunking for request budgets.
+
+Token counts come from tiktoken when it is installed (the o200k_base encoding
+of the gpt-4o / gpt-4.1 family) and from a conservative regex estimate
+otherwise, so budgets never need a network call. Chat messages add a few
+tokens of framing each, as in OpenAI's counting guide.
+
+Rewrites are predicted as a multiple of the input (COMPLETION_RATIOS) and
+judge replies as a fixed size. Emails over the chunk limit are split at
+paragraph boundaries (then sentences, then words for a single oversized
+paragraph) into chunks that are rewritten separately and stitched back.
+"""
+import os
+import re
+
+# Defaults for TOKENIZER_ENCODING and REWRITE_CHUNK_TOKENS, which are read on first
+# use rather than at import, so a .env loaded after this module still applies
+ENCODING = "o200k_base"
+# Rewrites of inputs above this many tokens are split into chunks of at most this size
+CHUNK_TOKENS = 1500
+# Framing tokens per chat message, and for priming the assistant reply
+MESSAGE_OVERHEAD = 4
+REPLY_OVERHEAD = 3
+
+# Expected completion size as a multiple of the text being rewritten
+COMPLETION_RATIOS = {"shorten": 0.7, "lengthen": 1.4, "tone": 1.1}
+# A "Score: X.XX" line plus a short explanation, or one structured object
+JUDGE_COMPLETION_TOKENS = 150
+# Used when nothing better is known about the reply
+DEFAULT_COMPLETION_TOKENS = 300
+
+# Fallback: word pieces of up to 6 characters and single punctuation marks, which
+# overestimates BPE counts for English prose slightly; a safe side for budgets
+_PIECE = re.compile(r"\w{1,6}|[^\w\s]")
+_PARAGRAPH_BREAK = re.compile(r"\n\s*\n")
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+# None until the first count; False when tiktoken is not installed
+_encoder = None
+
+
+def _get_encoder():
+    # tiktoken is imported (and its encoding loaded) on the first count, not at import
+    global _encoder
+    if _encoder is None:
+        try:
+            import tiktoken
+        except ImportError:
+            _encoder = False
+        else:
+            _encoder = tiktoken.get_encoding(os.getenv("TOKENIZER_ENCODING", ENCODING))
+    return _encoder or None
+
+
+def chunk_tokens():
+    return int(os.getenv("REWRITE_CHUNK_TOKENS", CHUNK_TOKENS))
+
+
+def count_tokens(text):
+    encoder = _get_encoder()
+    if encoder is not None:
+        return len(encoder.encode(text, disallowed_special=()))
+    return len(_PIECE.findall(text))
+
+
+def message_tokens(messages):
+    """Prompt tokens of a chat request."""
+    return sum(count_tokens(m["content"]) + MESSAGE_OVERHEAD for m in messages) + REPLY_OVERHEAD
+
+
+def completion_tokens(action, text):
+    """Predicted reply size for rewriting text with action."""
+    ratio = COMPLETION_RATIOS.get(action)
+    if ratio is None:
+        return DEFAULT_COMPLETION_TOKENS
+    return int(count_tokens(text) * ratio) + 20
+
+
+def _sentences(paragraph, max_tokens):
+    """Pieces of one oversized paragraph: its sentences, with any sentence over the limit cut between words."""
+    for sentence in _SENTENCE_END.split(paragraph):
+        if count_tokens(sentence) <= max_tokens:
+            yield sentence
+            continue
+        # Word counts add up to within a token or two of the joined text's count
+        current, current_tokens = [], 0
+        for word in sentence.split(" "):
+            word_tokens = count_tokens(" " + word)
+            if current and current_tokens + word_tokens > max_tokens:
+                yield " ".join(current)
+                current, current_tokens = [], 0
+            current.append(word)
+            current_tokens += word_tokens
+        if current:
+            yield " ".join(current)
+
+
+def split_paragraphs(text, max_tokens=None):
+    """Splits text into [(separator, chunk)] with every chunk at most max_tokens.
+
+    Consecutive paragraphs are packed into one chunk while they fit, so a long
+    email becomes a few balanced requests rather than one per paragraph. The
+    separator is what joined the chunk to the previous one ("\n\n" between
+    paragraphs, " " inside a paragraph that had to be cut), for stitch().
+    max_tokens defaults to chunk_tokens().
+    """
+    max_tokens = max_tokens or chunk_tokens()
+    if count_tokens(text) <= max_tokens:
+        return [("", text)]
+
+    chunks, current, current_tokens = [], [], 0
+    for paragraph in (p.strip() for p in _PARAGRAPH_BREAK.split(text)):
+        if not paragraph:
+            continue
+        tokens = count_tokens(paragraph)
+        if tokens <= max_tokens:
+            pieces = [("\n\n", paragraph, tokens)]
+        else:
+            pieces = [(" ", s, count_tokens(s)) for s in _sentences(paragraph, max_tokens)]
+            pieces[0] = ("\n\n",) + pieces[0][1:]
+        for separator, piece, piece_tokens in pieces:
+            if current and current_tokens + piece_tokens > max_tokens:
+                chunks.append(current)
+                current, current_tokens = [], 0
+            current.append((separator, piece))
+            current_tokens += piece_tokens
+    if current:
+        chunks.append(current)
+
+    # A chunk keeps the separator of its first piece; pieces inside it keep their own
+    joined = [(c[0][0], c[0][1] + "".join(sep + piece for sep, piece in c[1:])) for c in chunks]
+    return [("", joined[0][1])] + joined[1:]
+
+
+def stitch(chunks, rewrites):
+    """Joins per-chunk rewrites with the separators split_paragraphs recorded."""
+    return "".join(separator + rewrite.strip() for (separator, _), rewrite in zip(chunks, rewrites)).strip()